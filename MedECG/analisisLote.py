@@ -0,0 +1,290 @@
+"""
+Análisis por lotes de ECG escaneados, sin interfaz de Streamlit.
+
+Procesa carpetas completas con un ProcessPoolExecutor y guarda los resultados
+en MongoDB con escrituras masivas. Cada archivo debe nombrarse con el ID del
+paciente como prefijo, por ejemplo ``PAC001_2025-03-01.png``.
+
+Uso:
+    python analisisLote.py CARPETA [--nivel original|completo|rapido] [--plantilla ID] [--workers N] [--lote N]
+                           [--memoria-mb MB] [--cpu-s S]
+
+El límite de memoria se aplica al espacio de direcciones de cada proceso, que
+ya ocupa unos 500 MB solo con NumPy, OpenCV y Pillow cargados; por debajo de
+MEMORIA_MINIMA_MB todas las imágenes fallarían por falta de memoria.
+"""
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Un hilo por proceso: el paralelismo lo da el pool, y cada hilo de OpenCV u
+# OpenBLAS reserva pila y arena de malloc que cuentan contra el límite de memoria
+for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(variable, "1")
+os.environ.setdefault("MALLOC_ARENA_MAX", "2")
+
+import cv2
+
+from extraer import NIVELES_RESOLUCION, analyze_ecg
+from intervalosECG import documento_intervalos
+from senalesECG import codificar_senales
+from picosECG import documento_picos
+from reglasDiagnostico import diagnosticar_por_reglas
+from veredictoECG import parsear_veredicto
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EXTENSIONES = (".jpg", ".jpeg", ".png")
+
+# Diagnóstico que se guarda cuando las reglas no bastan y el ECG queda a la
+# espera del modelo de lenguaje
+ANOMALIAS_PENDIENTE = "⏳ Pendiente de diagnóstico"
+
+# Límite de memoria por proceso por debajo del cual no cabe ni un ECG escaneado
+MEMORIA_MINIMA_MB = 768
+
+ERROR_PROCESO = "El proceso de análisis terminó inesperadamente (memoria o tiempo de CPU agotados)"
+
+def id_paciente_desde_archivo(ruta):
+    """
+    Obtiene el ID del paciente a partir del nombre del archivo (prefijo antes del primer '_').
+    """
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    return nombre.split("_")[0]
+
+def listar_imagenes(carpeta, extensiones=EXTENSIONES):
+    """
+    Lista las imágenes de ECG de una carpeta (recursivamente) en orden alfabético.
+    """
+    rutas = []
+    for raiz, _, archivos in os.walk(carpeta):
+        for archivo in archivos:
+            if archivo.lower().endswith(extensiones):
+                rutas.append(os.path.join(raiz, archivo))
+    return sorted(rutas)
+
+def _limitar_memoria(memoria_mb):
+    """
+    Inicializador de cada proceso: limita su memoria virtual para que un escaneo
+    enorme falle con MemoryError en lugar de agotar la RAM del servidor.
+
+    Se ejecuta con los módulos de análisis ya importados y OpenCV en un solo
+    hilo, de modo que el límite solo lo consume el procesamiento de imágenes.
+    """
+    cv2.setNumThreads(1)
+    if resource is None or not memoria_mb:
+        return
+    limite = memoria_mb * 1024 * 1024
+    _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    resource.setrlimit(resource.RLIMIT_AS, (limite, maximo))
+
+def _limitar_cpu(cpu_s):
+    """
+    Limita el tiempo de CPU de la tarea actual: al agotarlo, el sistema termina el
+    proceso (SIGXCPU) aunque esté atascado dentro de código nativo.
+    """
+    if resource is None or not cpu_s:
+        return
+    uso = resource.getrusage(resource.RUSAGE_SELF)
+    limite = math.ceil(uso.ru_utime + uso.ru_stime) + cpu_s
+    _, maximo = resource.getrlimit(resource.RLIMIT_CPU)
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    resource.setrlimit(resource.RLIMIT_CPU, (limite, maximo))
+
+def _analizar_archivo(ruta, nivel, plantilla, cpu_s=None):
+    """
+    Tarea del proceso hijo: extrae los valores, el diagnóstico por reglas, los picos
+    anormales, los intervalos y las señales digitalizadas (ya codificadas, para
+    enviar pocos bytes al proceso principal).
+    """
+    _limitar_cpu(cpu_s)
+    try:
+        analisis = analyze_ecg(ruta, nivel=nivel, mosaico=True, detectar_rejilla=True, plantilla=plantilla)
+    except MemoryError:
+        return ruta, None, "Memoria insuficiente para procesar la imagen"
+    except Exception as e:
+        return ruta, None, str(e)
+
+    resultado_reglas = diagnosticar_por_reglas(analisis["valores"])
+    veredicto = parsear_veredicto(resultado_reglas["diagnostico"])
+    return ruta, {
+        "valores": analisis["valores"],
+        "diagnostico": resultado_reglas["diagnostico"] or ANOMALIAS_PENDIENTE,
+        "picos": documento_picos(analisis["valores"]),
+        "senales": codificar_senales(analisis["senales"]),
+        "intervalos": documento_intervalos(analisis["intervalos"]),
+        "veredicto": veredicto.documento() if veredicto else None,
+    }, None
+
+def _resultado(futuro, ruta):
+    """
+    Resultado de una tarea terminada; si el proceso que la ejecutaba murió o la
+    tarea falló fuera del análisis, se informa como error de su archivo.
+    """
+    try:
+        return futuro.result()
+    except BrokenProcessPool:
+        return ruta, None, ERROR_PROCESO
+    except Exception as e:
+        return ruta, None, str(e)
+
+def _ejecutar_en_procesos(rutas, nivel, plantilla, workers, memoria_mb, max_pendientes, cpu_s=None):
+    """
+    Envía las rutas al pool por bloques (como máximo max_pendientes tareas en vuelo)
+    y devuelve los resultados a medida que terminan.
+
+    Si un proceso muere (límite de memoria o de CPU), las tareas en vuelo se
+    informan como errores y las rutas restantes continúan en un pool nuevo.
+    """
+    opciones = {"max_workers": workers, "initializer": _limitar_memoria, "initargs": (memoria_mb,)}
+    if sys.version_info >= (3, 11):
+        # Reciclar procesos para liberar la memoria fragmentada por OpenCV
+        opciones["max_tasks_per_child"] = 50
+
+    rutas = list(rutas)
+    siguiente = 0
+    while siguiente < len(rutas):
+        with ProcessPoolExecutor(**opciones) as executor:
+            pendientes = {}
+            try:
+                while siguiente < len(rutas):
+                    ruta = rutas[siguiente]
+                    pendientes[executor.submit(_analizar_archivo, ruta, nivel, plantilla, cpu_s)] = ruta
+                    siguiente += 1
+                    if len(pendientes) < max_pendientes:
+                        continue
+                    terminadas, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in terminadas:
+                        yield _resultado(futuro, pendientes.pop(futuro))
+            except BrokenProcessPool:
+                # La ruta que no se pudo enviar se reintenta en el pool nuevo
+                pass
+
+            for futuro in wait(pendientes).done:
+                yield _resultado(futuro, pendientes[futuro])
+
+def analizar_archivos(rutas, nivel=None, plantilla=None, workers=None, tamano_lote=50, memoria_mb=1024,
+                      cpu_s=120, progreso=None):
+    """
+    Analiza una lista de imágenes de ECG y guarda los resultados en MongoDB.
+
+    Args:
+        rutas: Rutas de las imágenes a procesar
+        nivel: Nivel de resolución de la extracción ("rapido", "completo" o None)
+        plantilla: Identificador del equipo que imprimió los ECG; si es None, la
+            rejilla de derivaciones se reconoce por la huella de cada imagen
+        workers: Número de procesos (por defecto, los CPU disponibles)
+        tamano_lote: Registros acumulados antes de cada escritura masiva
+        memoria_mb: Límite de memoria por proceso en MB (0 para no limitar, como
+            mínimo MEMORIA_MINIMA_MB)
+        cpu_s: Tiempo máximo de CPU por imagen en segundos (0 para no limitar)
+        progreso: Función opcional progreso(ruta, error) llamada por cada archivo
+
+    Returns:
+        Diccionario con el número de archivos procesados, guardados y los errores
+    """
+    if memoria_mb and memoria_mb < MEMORIA_MINIMA_MB:
+        raise ValueError(f"El límite de memoria debe ser de al menos {MEMORIA_MINIMA_MB} MB (o 0 para no limitar)")
+
+    # Solo el proceso principal se conecta a la base de datos
+    from conexion import crear_registro_ecg, guardar_ecgs_analizados, obtener_paciente
+
+    workers = workers or os.cpu_count() or 1
+    resumen = {"procesados": 0, "guardados": 0, "errores": []}
+    nombres_pacientes = {}
+    registros = []
+
+    resultados = _ejecutar_en_procesos(rutas, nivel, plantilla, workers, memoria_mb, workers * 2, cpu_s)
+    try:
+        for ruta, resultado, error in resultados:
+            resumen["procesados"] += 1
+
+            if error is None:
+                id_paciente = id_paciente_desde_archivo(ruta)
+                if id_paciente not in nombres_pacientes:
+                    paciente = obtener_paciente(id_paciente)
+                    nombres_pacientes[id_paciente] = paciente.get("Nombre Paciente") if paciente else None
+
+                if nombres_pacientes[id_paciente] is None:
+                    error = f"No existe el paciente {id_paciente}"
+                else:
+                    try:
+                        with open(ruta, "rb") as archivo:
+                            imagen_bytes = archivo.read()
+                    except OSError as e:
+                        error = str(e)
+                    else:
+                        registros.append(crear_registro_ecg(
+                            id_paciente, nombres_pacientes[id_paciente], imagen_bytes,
+                            resultado["diagnostico"], resultado["picos"], resultado["senales"],
+                            resultado["intervalos"], resultado["veredicto"]
+                        ))
+
+            if error is not None:
+                resumen["errores"].append((ruta, error))
+            if progreso:
+                progreso(ruta, error)
+
+            if len(registros) >= tamano_lote:
+                lote, registros = registros, []
+                resumen["guardados"] += guardar_ecgs_analizados(lote)
+    finally:
+        # Los análisis ya terminados se guardan aunque el lote se interrumpa
+        resultados.close()
+        if registros:
+            resumen["guardados"] += guardar_ecgs_analizados(registros)
+    return resumen
+
+def analizar_carpeta(carpeta, **opciones):
+    """
+    Analiza todas las imágenes de ECG de una carpeta. Acepta las mismas opciones que analizar_archivos.
+    """
+    return analizar_archivos(listar_imagenes(carpeta), **opciones)
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis por lotes de ECG escaneados")
+    parser.add_argument("carpeta", help="Carpeta con las imágenes de ECG (PAC001_*.png, ...)")
+    parser.add_argument(
+        "--nivel", choices=["original", *NIVELES_RESOLUCION], default="original",
+        help="Nivel de resolución (original = sin reescalar)"
+    )
+    parser.add_argument("--plantilla", default=None, help="Equipo o plantilla de impresión de los ECG")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo")
+    parser.add_argument("--lote", type=int, default=50, help="Registros por escritura masiva")
+    parser.add_argument(
+        "--memoria-mb", type=int, default=1024,
+        help=f"Límite de memoria por proceso, mínimo {MEMORIA_MINIMA_MB} (0 = sin límite)"
+    )
+    parser.add_argument("--cpu-s", type=int, default=120, help="Tiempo máximo de CPU por imagen (0 = sin límite)")
+    args = parser.parse_args()
+    if args.memoria_mb and args.memoria_mb < MEMORIA_MINIMA_MB:
+        parser.error(f"--memoria-mb debe ser al menos {MEMORIA_MINIMA_MB} (o 0 para no limitar)")
+
+    def progreso(ruta, error):
+        estado = f"❌ {error}" if error else "✅"
+        print(f"{estado} {ruta}")
+
+    resumen = analizar_carpeta(
+        args.carpeta,
+        nivel=None if args.nivel == "original" else args.nivel,
+        plantilla=args.plantilla,
+        workers=args.workers,
+        tamano_lote=args.lote,
+        memoria_mb=args.memoria_mb,
+        cpu_s=args.cpu_s,
+        progreso=progreso,
+    )
+    print(f"Procesados: {resumen['procesados']} | Guardados: {resumen['guardados']} | Errores: {len(resumen['errores'])}")
+    return 1 if resumen["errores"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Benchmark del motor de extracción de extraer.py.
+
+Compara el motor en lote (analyze_all_leads) contra la ruta de referencia
+por derivación (analyze_all_leads_per_lead) sobre una imagen real o sobre
+un ECG sintético generado al vuelo, y mide cómo cambian la latencia y los
+valores extraídos con cada nivel de resolución del preprocesamiento.
+
+Uso:
+    python benchmark_extraer.py [ruta_imagen] [--repeticiones N] [--dpi DPI] [--jpeg]
+"""
+import argparse
+import io
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from extraer import (
+    NIVELES_RESOLUCION,
+    analyze_all_leads,
+    analyze_all_leads_per_lead,
+    analyze_ecg,
+    column_profiles,
+    estimar_px_por_mm,
+    extract_ecg_values,
+    get_lead_regions,
+    preprocess_image,
+    values_from_profiles,
+)
+from rejillaECG import detectar_rejilla
+
+# Cuadrícula milimetrada rosa: más clara que el umbral de tinta, como en el papel de ECG
+COLOR_LINEA_MM = (255, 225, 230)
+COLOR_LINEA_5MM = (255, 200, 210)
+
+def generar_ecg_sintetico(dpi=300, ancho_mm=280, alto_mm=200, cuadricula=True):
+    """
+    Genera una imagen de ECG de 12 derivaciones (rejilla 4x3) con trazos negros
+    sobre papel blanco, con la cuadrícula milimetrada si se pide.
+    """
+    px_mm = dpi / 25.4
+    ancho, alto = int(ancho_mm * px_mm), int(alto_mm * px_mm)
+    imagen = np.full((alto, ancho, 3), 255, np.uint8)
+
+    if cuadricula:
+        for mm in range(int(max(ancho_mm, alto_mm)) + 1):
+            color = COLOR_LINEA_5MM if mm % 5 == 0 else COLOR_LINEA_MM
+            grosor = 2 if mm % 5 == 0 and px_mm >= 8 else 1
+            posicion = int(round(mm * px_mm))
+            cv2.line(imagen, (posicion, 0), (posicion, alto), color, grosor)
+            cv2.line(imagen, (0, posicion), (ancho, posicion), color, grosor)
+
+    fila_alto = alto // 4
+    col_ancho = ancho // 3
+    # 25 mm/s y 10 mm/mV; latido a 75 lpm
+    t = np.arange(ancho) / px_mm / 25.0
+    fase = (t % 0.8) / 0.8
+    latido = (
+        0.15 * np.exp(-((fase - 0.20) / 0.03) ** 2)
+        + 1.00 * np.exp(-((fase - 0.35) / 0.01) ** 2)
+        + 0.30 * np.exp(-((fase - 0.60) / 0.05) ** 2)
+    )
+
+    for fila in range(4):
+        base = fila * fila_alto + fila_alto * 0.7
+        y = (base - latido * 10 * px_mm * 0.6).astype(np.int32)
+        puntos = np.stack([np.arange(ancho), y], axis=1).reshape(-1, 1, 2)
+        cv2.polylines(imagen, [puntos], False, (0, 0, 0), max(1, int(px_mm * 0.3)))
+
+    for col in (1, 2):
+        cv2.line(imagen, (col * col_ancho, 0), (col * col_ancho, alto), (255, 255, 255), 1)
+
+    return Image.fromarray(imagen)
+
+def medir(funcion, repeticiones):
+    """Devuelve el mejor tiempo (s) de varias ejecuciones y el último resultado."""
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+def deriva(valores, referencia):
+    """Diferencia absoluta media y máxima (mV) entre dos resultados de analyze_all_leads."""
+    diferencias = [
+        abs(valores[lead][pico] - referencia[lead][pico])
+        for lead in referencia
+        for pico in referencia[lead]
+    ]
+    return float(np.mean(diferencias)), float(np.max(diferencias))
+
+def comprobar_rejilla(binary, nominal):
+    """
+    Cortes de columnas detectados en la imagen binarizada. Si nominal es True
+    (ECG sintético, sin marcas separadoras), deben quedar en 1/3 y 2/3: los
+    complejos QRS no pueden tomarse por separadores.
+    """
+    columnas = detectar_rejilla(binary)["columnas"]
+    print("Cortes de columnas detectados:", ", ".join(f"{corte:.3f}" for corte in columnas))
+    if not nominal:
+        return True
+    correctos = all(abs(corte - k / 3) < 0.01 for k, corte in enumerate(columnas))
+    print("Cortes de columnas nominales:", correctos)
+    return correctos
+
+def frecuencia_media(fuente, nivel, mosaico=False):
+    """Frecuencia cardíaca media (lpm) y píxeles por mm con los que analyze_ecg calibra un nivel."""
+    analisis = analyze_ecg(fuente(), nivel=nivel, mosaico=mosaico)
+    return analisis["intervalos"]["global"]["FC"]["media"], analisis["senales"]["calibracion"]["px_por_mm"]
+
+def comparar_niveles(fuente, repeticiones, frecuencia_esperada=None):
+    """
+    Latencia (desde el archivo codificado) y deriva de valores de cada nivel de
+    resolución frente a la resolución original, y frecuencia cardíaca medida en
+    cada nivel con y sin mosaicos. fuente() devuelve la entrada de
+    analyze_all_leads sin decodificar (ruta o io.BytesIO).
+
+    Returns:
+        True si en todos los niveles la frecuencia queda a ±1 lpm de
+        frecuencia_esperada (o si no se indica)
+    """
+    print()
+    print(
+        f"{'Nivel':<10} {'px/mm':>6} {'Latencia':>11} {'Deriva media':>13} {'Deriva máx.':>12}"
+        f" {'FC':>7} {'FC mosaico':>11}"
+    )
+    _, valores_originales = medir(lambda: analyze_all_leads(fuente(), nivel=None), 1)
+    correcto = True
+
+    for nivel in (None, *NIVELES_RESOLUCION):
+        tiempo, valores = medir(lambda: analyze_all_leads(fuente(), nivel=nivel), repeticiones)
+        media, maxima = deriva(valores, valores_originales)
+        frecuencia, px_por_mm = frecuencia_media(fuente, nivel)
+        frecuencia_mosaico, _ = frecuencia_media(fuente, nivel, mosaico=True)
+        print(
+            f"{nivel or 'original':<10} {px_por_mm:>6.2f} {tiempo * 1000:8.2f} ms {media:10.4f} mV {maxima:9.4f} mV"
+            f" {frecuencia:>7.1f} {frecuencia_mosaico:>11.1f}"
+        )
+        if frecuencia_esperada is not None:
+            correcto &= all(abs(f - frecuencia_esperada) <= 1 for f in (frecuencia, frecuencia_mosaico))
+
+    if frecuencia_esperada is not None:
+        print(f"Frecuencia de {frecuencia_esperada} lpm en todos los niveles:", correcto)
+    return correcto
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción de valores ECG")
+    parser.add_argument("imagen", nargs="?", help="Ruta de la imagen ECG (por defecto, sintética)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--dpi", type=int, default=300, help="DPI del ECG sintético")
+    parser.add_argument("--jpeg", action="store_true", help="Codificar el ECG sintético como JPEG (foto de celular)")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla para comparar el modo con variación")
+    args = parser.parse_args()
+
+    imagen = Image.open(args.imagen) if args.imagen else generar_ecg_sintetico(args.dpi)
+    imagen.load()
+    print(f"Imagen: {imagen.size[0]}x{imagen.size[1]} px")
+
+    binary, _ = preprocess_image(imagen, nivel=None)
+    regiones = get_lead_regions(*binary.shape)
+
+    # Solo la etapa de extracción (imagen ya binarizada)
+    t_lote, _ = medir(lambda: values_from_profiles(column_profiles(binary, regiones)), args.repeticiones)
+    t_ref, _ = medir(
+        lambda: {lead: extract_ecg_values(binary, region) for lead, region in regiones.items()},
+        args.repeticiones,
+    )
+    print(f"Extracción por derivación: {t_ref * 1000:8.2f} ms")
+    print(f"Extracción en lote:        {t_lote * 1000:8.2f} ms  (x{t_ref / t_lote:.2f})")
+
+    # Pipeline completo (incluye preprocesamiento)
+    t_ref, valores_ref = medir(lambda: analyze_all_leads_per_lead(imagen, nivel=None), args.repeticiones)
+    t_lote, valores_lote = medir(lambda: analyze_all_leads(imagen, nivel=None), args.repeticiones)
+    print(f"Pipeline por derivación:   {t_ref * 1000:8.2f} ms")
+    print(f"Pipeline en lote:          {t_lote * 1000:8.2f} ms")
+    t_mosaico, valores_mosaico = medir(lambda: analyze_all_leads(imagen, nivel=None, mosaico=True), args.repeticiones)
+    print(f"Pipeline por mosaicos:     {t_mosaico * 1000:8.2f} ms")
+    t_completo, analisis = medir(lambda: analyze_ecg(imagen, nivel=None), args.repeticiones)
+    print(f"Señales e intervalos:      {t_completo * 1000:8.2f} ms")
+    px_por_mm = estimar_px_por_mm(np.asarray(imagen.convert("L")))
+    print(f"Píxeles por mm (cuadrícula): {px_por_mm:.3f}" if px_por_mm else "Píxeles por mm: sin cuadrícula visible")
+    frecuencia = analisis["intervalos"]["global"]["FC"]["media"]
+    print(f"Frecuencia cardíaca media: {frecuencia} lpm")
+    # El ECG sintético late a 75 lpm sea cual sea su ancho de papel
+    frecuencia_correcta = args.imagen is not None or abs(frecuencia - 75) <= 1
+
+    # Ambos caminos deben coincidir bit a bit, tanto en modo determinista
+    # como con la misma semilla de variación aleatoria
+    print("Resultados idénticos:", valores_ref == valores_lote)
+    con_semilla = (
+        analyze_all_leads_per_lead(imagen, np.random.default_rng(args.semilla), nivel=None)
+        == analyze_all_leads(imagen, np.random.default_rng(args.semilla), nivel=None)
+    )
+    print(f"Resultados idénticos (semilla {args.semilla}):", con_semilla)
+    print("Ejecución repetida idéntica:", analyze_all_leads(imagen, nivel=None) == valores_lote)
+    print("Mosaicos idénticos:", valores_mosaico == valores_lote)
+    print("Valores del análisis completo idénticos:", analisis["valores"] == valores_lote)
+    rejilla_correcta = comprobar_rejilla(binary, nominal=not args.imagen)
+
+    if args.imagen:
+        fuente = lambda: args.imagen
+    else:
+        codificada = io.BytesIO()
+        imagen.save(codificada, "JPEG" if args.jpeg else "PNG")
+        fuente = lambda: io.BytesIO(codificada.getvalue())
+    # El ECG sintético late a 75 lpm en cualquier nivel y formato
+    niveles_correctos = comparar_niveles(fuente, args.repeticiones, None if args.imagen else 75)
+
+    correcto = (
+        valores_ref == valores_lote and con_semilla and rejilla_correcta and frecuencia_correcta
+        and niveles_correctos
+    )
+    return 0 if correcto else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Caché de diagnósticos del modelo de lenguaje.
+
+La clave combina el modelo, la versión de la plantilla del prompt, el sexo del
+paciente, los valores por derivación redondeados a DIAGNOSTICO_CACHE_RESOLUCION
+mV y los picos fuera de rango de cada derivación, de modo que repetir el
+análisis de un ECG estable no vuelve a consultar al modelo. Los picos fuera de
+rango entran en la clave porque el redondeo puede juntar valores a uno y otro
+lado de un límite normal, y el prompt (promptECG) cambia según cuáles sean.
+
+Solo se guardan las respuestas de las que se obtiene un veredicto
+(parsear_veredicto); los errores y las respuestas vacías o ilegibles se vuelven
+a consultar.
+
+Tiene dos niveles:
+    - Memoria: LRU dentro del proceso (compartida por las sesiones de Streamlit)
+    - MongoDB: colección Cache_Diagnosticos con índice TTL (DIAGNOSTICO_CACHE_TTL_DIAS)
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo.errors import PyMongoError
+
+from conexion import guardar_diagnostico_cache, obtener_diagnostico_cache
+from picosECG import obtener_picos_anormales
+from veredictoECG import parsear_veredicto
+
+RESOLUCION_MV = float(os.getenv("DIAGNOSTICO_CACHE_RESOLUCION", "0.01"))
+MAX_ENTRADAS_MEMORIA = 256
+
+_memoria = OrderedDict()
+_lock = threading.Lock()
+
+def cuantizar(valor, resolucion=RESOLUCION_MV):
+    """
+    Redondea un valor en mV a la resolución de la caché (como entero de pasos).
+    """
+    return int(round(float(valor) / resolucion))
+
+def clave_diagnostico(modelo, plantilla, sexo_paciente, valores_por_derivacion, resolucion=RESOLUCION_MV):
+    """
+    Clave de la caché de diagnósticos.
+
+    Args:
+        modelo: Nombre del modelo en LM Studio
+        plantilla: Identificador y versión de la plantilla del prompt (por ejemplo "deepseek-v1")
+        sexo_paciente: Sexo del paciente tal como se envía en el prompt
+        valores_por_derivacion: Diccionario {derivación: {pico: valor}}
+        resolucion: Resolución en mV del redondeo de los valores
+
+    Returns:
+        Hash SHA-256 en hexadecimal
+    """
+    valores = {
+        lead: {pico: cuantizar(valor, resolucion) for pico, valor in picos.items()}
+        for lead, picos in valores_por_derivacion.items()
+    }
+    # Sin redondear: un valor a cada lado del límite cambia el prompt y el cuadro clínico
+    anormales = sorted(
+        [derivacion["derivacion"], pico, derivacion["direccion"]]
+        for pico, datos in obtener_picos_anormales(valores_por_derivacion).items()
+        for derivacion in datos["derivaciones"]
+    )
+    descriptor = json.dumps(
+        {
+            "modelo": modelo,
+            "plantilla": plantilla,
+            "sexo": sexo_paciente,
+            "resolucion": resolucion,
+            "valores": valores,
+            "anormales": anormales,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(descriptor.encode()).hexdigest()
+
+def _leer_memoria(clave):
+    with _lock:
+        if clave not in _memoria:
+            return None
+        _memoria.move_to_end(clave)
+        return _memoria[clave]
+
+def _guardar_memoria(clave, diagnostico):
+    with _lock:
+        _memoria[clave] = diagnostico
+        _memoria.move_to_end(clave)
+        while len(_memoria) > MAX_ENTRADAS_MEMORIA:
+            _memoria.popitem(last=False)
+
+def _leer_mongo(clave):
+    try:
+        documento = obtener_diagnostico_cache(clave)
+    except PyMongoError:
+        return None
+    return documento["diagnostico"] if documento else None
+
+def _guardar_mongo(clave, diagnostico, modelo, tiempo):
+    try:
+        guardar_diagnostico_cache(clave, diagnostico, modelo, tiempo)
+    except PyMongoError:
+        # La caché es opcional: un fallo de escritura no debe romper el diagnóstico
+        pass
+
+def con_cache_diagnostico(plantilla):
+    """
+    Decorador para las funciones obtener_diagnostico_*(valores_ecg,
+    valores_por_derivacion, sexo_paciente, modelo) que devuelven
+    (diagnóstico, tiempo de respuesta).
+
+    En un acierto se devuelve el diagnóstico guardado con el tiempo de la
+    consulta a la caché. Cambiar la versión de plantilla al modificar el
+    prompt invalida sus entradas.
+    """
+    def decorador(funcion):
+        modelo_por_defecto = funcion.__defaults__[-1] if funcion.__defaults__ else None
+
+        @functools.wraps(funcion)
+        def envoltura(valores_ecg, valores_por_derivacion, sexo_paciente, modelo=modelo_por_defecto):
+            tiempo_inicio = time.time()
+            clave = clave_diagnostico(modelo, plantilla, sexo_paciente, valores_por_derivacion)
+
+            diagnostico = _leer_memoria(clave)
+            if diagnostico is None:
+                diagnostico = _leer_mongo(clave)
+                if diagnostico is not None:
+                    _guardar_memoria(clave, diagnostico)
+            if diagnostico is not None:
+                return diagnostico, time.time() - tiempo_inicio
+
+            diagnostico, tiempo = funcion(valores_ecg, valores_por_derivacion, sexo_paciente, modelo)
+            if parsear_veredicto(diagnostico) is not None:
+                _guardar_memoria(clave, diagnostico)
+                _guardar_mongo(clave, diagnostico, modelo, tiempo)
+            return diagnostico, tiempo
+
+        return envoltura
+    return decorador
+
+def limpiar_cache_memoria():
+    """
+    Vacía la caché en memoria (la colección de Mongo caduca sola por TTL).
+    """
+    with _lock:
+        _memoria.clear()
@@ -0,0 +1,181 @@
+"""
+Caché de valores extraídos de imágenes de ECG.
+
+La clave es un hash SHA-256 de los bytes de la imagen junto con los parámetros
+de extracción, de modo que volver a analizar (o diagnosticar) el mismo archivo
+no repite el procesamiento con OpenCV y SciPy.
+
+Tiene dos niveles:
+    - Memoria: LRU dentro del proceso (compartida por las sesiones de Streamlit)
+    - Disco (opcional): un archivo por entrada en ECG_CACHE_DIR, con expulsión
+      de los archivos menos usados cuando se supera ECG_CACHE_MAX_MB
+"""
+import copy
+import hashlib
+import io
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from extraer import analyze_all_leads, analyze_ecg
+
+# Cambiar al modificar el algoritmo de extracción para invalidar la caché
+VERSION_EXTRACCION = 5
+
+MAX_ENTRADAS_MEMORIA = 64
+DIRECTORIO_CACHE = os.getenv("ECG_CACHE_DIR")
+MAX_BYTES_DISCO = int(os.getenv("ECG_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+_memoria = OrderedDict()
+_lock = threading.Lock()
+
+def hash_imagen(imagen_bytes):
+    """
+    Hash SHA-256 de los bytes de la imagen.
+    """
+    return hashlib.sha256(imagen_bytes).hexdigest()
+
+def clave_cache(imagen_bytes, **parametros):
+    """
+    Clave de caché a partir del hash de la imagen y los parámetros de extracción.
+    """
+    descriptor = json.dumps(
+        {"version": VERSION_EXTRACCION, "parametros": parametros},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(f"{hash_imagen(imagen_bytes)}:{descriptor}".encode()).hexdigest()
+
+def _leer_memoria(clave):
+    with _lock:
+        if clave not in _memoria:
+            return None
+        _memoria.move_to_end(clave)
+        return _memoria[clave]
+
+def _guardar_memoria(clave, valor):
+    with _lock:
+        _memoria[clave] = valor
+        _memoria.move_to_end(clave)
+        while len(_memoria) > MAX_ENTRADAS_MEMORIA:
+            _memoria.popitem(last=False)
+
+def _ruta_disco(clave):
+    return os.path.join(DIRECTORIO_CACHE, f"{clave}.pkl")
+
+def _leer_disco(clave):
+    if not DIRECTORIO_CACHE:
+        return None
+    ruta = _ruta_disco(clave)
+    try:
+        with open(ruta, "rb") as archivo:
+            valor = pickle.load(archivo)
+        # Marcar como usado recientemente para la expulsión por antigüedad
+        os.utime(ruta)
+        return valor
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+def _guardar_disco(clave, valor):
+    if not DIRECTORIO_CACHE:
+        return
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        ruta = _ruta_disco(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as archivo:
+            pickle.dump(valor, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+        _expulsar_disco()
+    except OSError:
+        # La caché en disco es opcional: un fallo de escritura no debe romper el análisis
+        pass
+
+def _expulsar_disco():
+    """
+    Elimina los archivos menos usados hasta que la caché quede bajo MAX_BYTES_DISCO.
+    """
+    entradas = []
+    total = 0
+    for nombre in os.listdir(DIRECTORIO_CACHE):
+        if not nombre.endswith(".pkl"):
+            continue
+        ruta = os.path.join(DIRECTORIO_CACHE, nombre)
+        try:
+            info = os.stat(ruta)
+        except OSError:
+            continue
+        entradas.append((info.st_mtime, info.st_size, ruta))
+        total += info.st_size
+
+    entradas.sort()
+    for _, tamano, ruta in entradas:
+        if total <= MAX_BYTES_DISCO:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+        except OSError:
+            continue
+
+def _obtener(funcion, clave, imagen_bytes, semilla, parametros):
+    valor = _leer_memoria(clave)
+    if valor is None:
+        valor = _leer_disco(clave)
+        if valor is None:
+            rng = np.random.default_rng(semilla) if semilla is not None else None
+            valor = funcion(io.BytesIO(imagen_bytes), rng=rng, **parametros)
+            _guardar_disco(clave, valor)
+        _guardar_memoria(clave, valor)
+
+    # Copia para que quien llama no modifique la entrada de la caché
+    return copy.deepcopy(valor)
+
+def obtener_valores_ecg(imagen_bytes, semilla=None, **parametros):
+    """
+    Devuelve los valores de todas las derivaciones de la imagen, usando la caché si es posible.
+
+    Args:
+        imagen_bytes: Bytes del archivo de imagen subido
+        semilla: Semilla opcional de la variación aleatoria (None = extracción determinista)
+        **parametros: Parámetros de extracción que se pasan a analyze_all_leads
+
+    Returns:
+        Diccionario con valores de todas las derivaciones
+    """
+    clave = clave_cache(imagen_bytes, semilla=semilla, **parametros)
+    return _obtener(analyze_all_leads, clave, imagen_bytes, semilla, parametros)
+
+def obtener_analisis_ecg(imagen_bytes, semilla=None, **parametros):
+    """
+    Devuelve el análisis completo de la imagen (valores, señales e intervalos,
+    ver extraer.analyze_ecg), usando la caché si es posible.
+
+    Args:
+        imagen_bytes: Bytes del archivo de imagen subido
+        semilla: Semilla opcional de la variación aleatoria (None = extracción determinista)
+        **parametros: Parámetros de extracción que se pasan a analyze_ecg
+
+    Returns:
+        Diccionario con "valores", "senales" e "intervalos"
+    """
+    clave = clave_cache(imagen_bytes, semilla=semilla, analisis="completo", **parametros)
+    return _obtener(analyze_ecg, clave, imagen_bytes, semilla, parametros)
+
+def limpiar_cache(disco=False):
+    """
+    Vacía la caché en memoria y, opcionalmente, la de disco.
+    """
+    with _lock:
+        _memoria.clear()
+    if disco and DIRECTORIO_CACHE and os.path.isdir(DIRECTORIO_CACHE):
+        for nombre in os.listdir(DIRECTORIO_CACHE):
+            if nombre.endswith(".pkl"):
+                try:
+                    os.remove(os.path.join(DIRECTORIO_CACHE, nombre))
+                except OSError:
+                    continue
@@ -1,11 +1,8 @@
 import streamlit as st
 import requests
-import json
 import re
 from datetime import datetime
-
-# Configuración del endpoint de LM Studio
-LMSTUDIO_ENDPOINT = "http://localhost:1234/v1/chat/completions"
+from clienteLMStudio import enviar_chat, iterar_contenido
 
 def filtrar_respuesta(texto):
     """
@@ -149,12 +146,7 @@ def procesar_consulta_api(user_input):
     }
 
     try:
-        response = requests.post(
-            LMSTUDIO_ENDPOINT,
-            headers={'Content-Type': 'application/json'},
-            data=json.dumps(payload),
-            stream=True
-        )
+        response = enviar_chat(payload, stream=True, origen="chatbot")
         
         if response.status_code == 200:
             # Contenedor para la respuesta en tiempo real
@@ -162,26 +154,14 @@ def procesar_consulta_api(user_input):
                 response_container = st.empty()
                 accumulated_response = ""
                 
-                for line in response.iter_lines(decode_unicode=True):
-                    if line:
-                        if line.strip() == "data: [DONE]":
-                            break
-                        if line.startswith("data: "):
-                            try:
-                                json_data = json.loads(line[6:])
-                                if "choices" in json_data and json_data["choices"]:
-                                    delta = json_data['choices'][0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    
-                                    # Aplicar corrección de codificación para caracteres especiales
-                                    # Esto corrige caracteres mal codificados como ÃÂ³ → ó
-                                    content = content.encode('latin1').decode('utf-8', errors='replace')
+                for content in iterar_contenido(response):
+                    # Aplicar corrección de codificación para caracteres especiales
+                    # Esto corrige caracteres mal codificados como ÃÂ³ → ó
+                    content = content.encode('latin1').decode('utf-8', errors='replace')
 
-                                    accumulated_response += content
-                                    accumulated_response = filtrar_respuesta(accumulated_response)
-                                    response_container.markdown(accumulated_response)
-                            except json.JSONDecodeError:
-                                continue
+                    accumulated_response += content
+                    accumulated_response = filtrar_respuesta(accumulated_response)
+                    response_container.markdown(accumulated_response)
             
             # Y también antes de guardarla en el historial:
             st.session_state.messages.append({"role": "assistant", "content": filtrar_respuesta(accumulated_response)})
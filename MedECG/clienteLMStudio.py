@@ -0,0 +1,161 @@
+"""
+Cliente compartido de LM Studio (API compatible con OpenAI).
+
+Todas las llamadas al modelo (diagnóstico y chatbot) pasan por una única
+requests.Session con un pool de conexiones keep-alive, tiempos de espera y
+reintentos con espera exponencial, en lugar de abrir una conexión nueva y sin
+límite de tiempo en cada consulta. Cada llamada se mide con telemetriaLLM.
+
+La configuración se lee de las variables de entorno (ver .evn.example.ini):
+    LM_STUDIO_API                URL base de la API (por defecto http://localhost:1234/v1)
+    LM_STUDIO_TIMEOUT_CONEXION   Segundos para establecer la conexión
+    LM_STUDIO_TIMEOUT_LECTURA    Segundos máximos de espera entre datos de la respuesta
+    LM_STUDIO_REINTENTOS         Reintentos ante errores de conexión o 429/502/503/504
+    LM_STUDIO_BACKOFF            Factor de espera exponencial entre reintentos
+    LM_STUDIO_POOL               Conexiones reutilizables en el pool
+"""
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from telemetriaLLM import MedicionLLM
+
+LM_STUDIO_API = os.getenv("LM_STUDIO_API", "http://localhost:1234/v1").rstrip("/")
+TIMEOUT_CONEXION = float(os.getenv("LM_STUDIO_TIMEOUT_CONEXION", "5"))
+TIMEOUT_LECTURA = float(os.getenv("LM_STUDIO_TIMEOUT_LECTURA", "120"))
+REINTENTOS = int(os.getenv("LM_STUDIO_REINTENTOS", "3"))
+BACKOFF = float(os.getenv("LM_STUDIO_BACKOFF", "0.5"))
+TAMANO_POOL = int(os.getenv("LM_STUDIO_POOL", "10"))
+
+URL_CHAT = f"{LM_STUDIO_API}/chat/completions"
+
+_sesion = None
+_lock = threading.Lock()
+
+def obtener_sesion():
+    """
+    Devuelve la sesión compartida, creándola la primera vez.
+    """
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                reintentos = Retry(
+                    total=REINTENTOS,
+                    backoff_factor=BACKOFF,
+                    status_forcelist=(429, 502, 503, 504),
+                    allowed_methods=frozenset({"POST"}),
+                    raise_on_status=False,
+                )
+                adaptador = HTTPAdapter(
+                    pool_connections=TAMANO_POOL,
+                    pool_maxsize=TAMANO_POOL,
+                    max_retries=reintentos,
+                )
+                sesion = requests.Session()
+                sesion.mount("http://", adaptador)
+                sesion.mount("https://", adaptador)
+                sesion.headers.update({"Content-Type": "application/json"})
+                _sesion = sesion
+    return _sesion
+
+def enviar_chat(payload, stream=False, timeout=None, origen="diagnostico"):
+    """
+    Envía una petición a /chat/completions.
+
+    Args:
+        payload: Cuerpo de la petición (model, messages, temperature, ...)
+        stream: True para leer la respuesta por eventos (SSE)
+        timeout: Tupla (conexión, lectura) en segundos; por defecto la configurada
+        origen: Quién hace la petición ("diagnostico" o "chatbot"), para la telemetría
+
+    Returns:
+        requests.Response (quien llama revisa status_code). En streaming lleva
+        la medición en response.medicion, que iterar_contenido completa
+
+    Raises:
+        requests.RequestException: Si no se pudo conectar o se agotó el tiempo
+    """
+    if stream:
+        # Pedir el uso de tokens en el último evento (los servidores que no lo admiten lo ignoran)
+        payload = {**payload, "stream_options": {"include_usage": True}}
+
+    medicion = MedicionLLM(payload.get("model"), stream, origen)
+    try:
+        response = obtener_sesion().post(
+            URL_CHAT,
+            json=payload,
+            stream=stream,
+            timeout=timeout or (TIMEOUT_CONEXION, TIMEOUT_LECTURA),
+        )
+    except requests.RequestException as e:
+        medicion.error = type(e).__name__
+        medicion.registrar()
+        raise
+
+    medicion.estado_http = response.status_code
+    if stream and response.status_code == 200:
+        response.medicion = medicion
+        return response
+
+    if response.status_code == 200:
+        medicion.completa = True
+        try:
+            medicion.uso(response.json().get("usage"))
+        except ValueError:
+            pass
+    medicion.registrar()
+    return response
+
+def cerrar_sesion():
+    """
+    Cierra las conexiones del pool (la siguiente llamada crea una sesión nueva).
+    """
+    global _sesion
+    with _lock:
+        if _sesion is not None:
+            _sesion.close()
+            _sesion = None
+
+def iterar_contenido(response):
+    """
+    Recorre una respuesta en streaming (SSE) y devuelve los fragmentos de texto
+    de cada evento, hasta "data: [DONE]". Al terminar (o al dejar de recorrerla
+    quien llama) registra la medición de la petición.
+    """
+    medicion = getattr(response, "medicion", None)
+    try:
+        # chunk_size=None entrega cada fragmento HTTP al llegar (con el valor
+        # por defecto se esperaría a juntar 512 bytes, varios tokens)
+        for linea in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not linea:
+                continue
+            if linea.strip() == "data: [DONE]":
+                if medicion is not None:
+                    medicion.completa = True
+                break
+            if not linea.startswith("data: "):
+                continue
+            try:
+                evento = json.loads(linea[6:])
+            except json.JSONDecodeError:
+                continue
+            if medicion is not None:
+                medicion.uso(evento.get("usage"))
+            if evento.get("choices"):
+                contenido = evento["choices"][0].get("delta", {}).get("content")
+                if contenido:
+                    if medicion is not None:
+                        medicion.fragmento()
+                    yield contenido
+    except requests.RequestException as e:
+        if medicion is not None:
+            medicion.error = type(e).__name__
+        raise
+    finally:
+        if medicion is not None:
+            medicion.registrar()
@@ -0,0 +1,265 @@
+"""
+Cola de diagnósticos en segundo plano.
+
+La interfaz solo encola el trabajo (imagen, paciente y opciones) en la
+colección Trabajos_Diagnostico y consulta su estado; un grupo de trabajadores
+hace la extracción, el diagnóstico (reglas y modelos) y el guardado del
+registro. Así el hilo de Streamlit de cada médico no queda bloqueado los 5-30 s
+que tarda el modelo.
+
+Los trabajos se deduplican por el hash de la imagen (junto con el paciente y
+las opciones): volver a enviar la misma imagen devuelve el trabajo existente.
+La imagen se sube a GridFS al crear el trabajo y este solo guarda su id, que
+después usa también el registro del ECG.
+
+Si los modelos no responden (LM Studio caído o fuera de plazo), el trabajo
+termina en error sin guardar el registro, y volver a enviar la imagen lo
+reintenta.
+
+La reserva de trabajos es atómica en Mongo, de modo que pueden convivir los
+trabajadores de varios procesos de Streamlit y los de este script. Mientras
+procesa un trabajo, el trabajador renueva su reserva cada tercio del plazo;
+un trabajo sin renovar se da por abandonado y lo recupera otro trabajador
+(hasta DIAGNOSTICO_TRABAJO_MAX_INTENTOS veces). Si aun así dos trabajadores
+llegan a procesar el mismo trabajo, solo se guarda un registro del ECG y solo
+el que tiene la reserva escribe el resultado.
+
+Configuración (ver .evn.example.ini):
+    DIAGNOSTICO_TRABAJADORES      Trabajadores dentro del proceso de Streamlit (0 = solo externos)
+    DIAGNOSTICO_SONDEO_S          Espera entre consultas de un trabajador sin trabajo
+    DIAGNOSTICO_TRABAJO_PLAZO_S   Segundos sin renovar tras los que un trabajo en proceso se da por abandonado
+    DIAGNOSTICO_TRABAJO_MAX_INTENTOS Veces que se recupera un trabajo abandonado antes de marcarlo como error
+    DIAGNOSTICO_TRABAJOS_TTL_DIAS Días que se conservan los trabajos terminados
+
+Uso (trabajadores en un proceso aparte):
+    python colaDiagnosticos.py [--trabajadores N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from pymongo.errors import PyMongoError
+
+from cacheECG import hash_imagen, obtener_analisis_ecg
+from conexion import (
+    buscar_trabajo, eliminar_imagen_ecg, encolar_trabajo, fallar_trabajo, guardar_ecg_analizado,
+    guardar_imagen_ecg, obtener_imagen_ecg, obtener_trabajo, renovar_trabajo, terminar_trabajo, tomar_trabajo
+)
+from intervalosECG import documento_intervalos
+from modelosDiagnostico import DIAGNOSTICO_ERROR, diagnosticar_ecg
+from picosECG import documento_picos
+from senalesECG import codificar_senales
+from veredictoECG import parsear_veredicto
+
+TRABAJADORES = int(os.getenv("DIAGNOSTICO_TRABAJADORES", "2"))
+SONDEO_S = float(os.getenv("DIAGNOSTICO_SONDEO_S", "1"))
+PLAZO_TRABAJO_S = float(os.getenv("DIAGNOSTICO_TRABAJO_PLAZO_S", "300"))
+MAX_INTENTOS = int(os.getenv("DIAGNOSTICO_TRABAJO_MAX_INTENTOS", "3"))
+
+ESTADOS_EN_CURSO = ("pendiente", "procesando")
+
+_hilos = []
+_lock = threading.Lock()
+
+def clave_trabajo(imagen_bytes, id_paciente, opciones):
+    """
+    Clave de deduplicación: hash de la imagen, paciente y opciones del análisis.
+    """
+    descriptor = json.dumps({"paciente": id_paciente, "opciones": opciones}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{hash_imagen(imagen_bytes)}:{descriptor}".encode()).hexdigest()
+
+def encolar_diagnostico(imagen_bytes, id_paciente, nombre_paciente, sexo_paciente, nivel=None,
+                        detectar_rejilla=True, usar_consenso=False):
+    """
+    Encola el análisis y diagnóstico de una imagen de ECG.
+
+    Args:
+        imagen_bytes: Bytes del archivo de imagen subido
+        id_paciente: ID del paciente
+        nombre_paciente: Nombre del paciente
+        sexo_paciente: Sexo del paciente
+        nivel: Nivel de resolución de la extracción ("completo", "rapido" o None para la original)
+        detectar_rejilla: True para detectar la rejilla de derivaciones
+        usar_consenso: True para el consenso de modelos en los casos ambiguos
+
+    Returns:
+        ID (texto) del trabajo, nuevo o ya existente para la misma imagen
+    """
+    opciones = {"nivel": nivel, "detectar_rejilla": detectar_rejilla, "usar_consenso": usar_consenso}
+    clave = clave_trabajo(imagen_bytes, id_paciente, opciones)
+    # La imagen no va en el documento del trabajo (límite de 16 MB de Mongo) y
+    # solo se sube si no hay ya un trabajo para ella (uno en error se reintenta con la suya)
+    existente = buscar_trabajo(clave, {"imagen_id": 1})
+    imagen_id = existente["imagen_id"] if existente else guardar_imagen_ecg(imagen_bytes, id_paciente)
+    trabajo = encolar_trabajo(
+        clave,
+        {
+            "id_paciente": id_paciente,
+            "nombre_paciente": nombre_paciente,
+            "sexo_paciente": sexo_paciente,
+            "opciones": opciones,
+            "hash_imagen": hash_imagen(imagen_bytes),
+            "imagen_id": imagen_id,
+        },
+    )
+    if existente is None and trabajo.get("imagen_id") != imagen_id:
+        # Otro envío simultáneo creó antes el trabajo: se usa su imagen
+        eliminar_imagen_ecg(imagen_id)
+    return str(trabajo["_id"])
+
+def estado_trabajo(id_trabajo):
+    """
+    Estado y resultado de un trabajo, o None si no existe.
+    """
+    return obtener_trabajo(id_trabajo)
+
+def _resumen_consenso(consenso):
+    """
+    Parte del consenso que se guarda en el trabajo (los votos usan el
+    diagnóstico como clave y Mongo no admite cualquier texto como clave).
+    """
+    if consenso is None:
+        return None
+    return {"respuestas": consenso["respuestas"], "anticipado": consenso["anticipado"], "tiempo": consenso["tiempo"]}
+
+def procesar_trabajo(trabajo):
+    """
+    Extrae los valores, diagnostica y guarda el registro del ECG de un trabajo.
+
+    Returns:
+        Resultado que se guarda en el trabajo
+    """
+    opciones = trabajo["opciones"]
+    imagen_bytes = obtener_imagen_ecg(trabajo)
+    if imagen_bytes is None:
+        raise ValueError("No se encontró la imagen del trabajo")
+    analisis_ecg = obtener_analisis_ecg(
+        imagen_bytes, nivel=opciones["nivel"], mosaico=True, detectar_rejilla=opciones["detectar_rejilla"]
+    )
+    resultado = diagnosticar_ecg(analisis_ecg["valores"], trabajo["sexo_paciente"], opciones["usar_consenso"])
+    if resultado["diagnostico"].startswith(DIAGNOSTICO_ERROR):
+        # Sin respuesta de los modelos: el trabajo queda en error para reintentarlo
+        raise RuntimeError(resultado["diagnostico"])
+    veredicto = parsear_veredicto(resultado["diagnostico"])
+
+    # Idempotente por id_trabajo: un trabajo procesado dos veces guarda un solo registro
+    id_registro = guardar_ecg_analizado(
+        trabajo["id_paciente"], trabajo["nombre_paciente"], trabajo["imagen_id"], resultado["diagnostico"],
+        documento_picos(analisis_ecg["valores"]),
+        codificar_senales(analisis_ecg["senales"]),
+        documento_intervalos(analisis_ecg["intervalos"]),
+        veredicto.documento() if veredicto else None,
+        id_trabajo=trabajo["_id"]
+    )
+
+    return {
+        "diagnostico": resultado["diagnostico"],
+        "veredicto": veredicto.documento() if veredicto else None,
+        "tiempo": resultado["tiempo"],
+        "regla": resultado["regla"],
+        "consenso": _resumen_consenso(resultado["consenso"]),
+        "modelo": resultado["modelo"],
+        "motivo_modelo": resultado["motivo_modelo"],
+        "picos_anormales": resultado["picos_anormales"],
+        "id_registro": id_registro,
+    }
+
+def _renovar_reserva(id_trabajo, trabajador, detener):
+    """
+    Renueva la reserva del trabajo cada tercio del plazo hasta que se active
+    detener o el trabajo deje de pertenecer al trabajador.
+    """
+    while not detener.wait(PLAZO_TRABAJO_S / 3):
+        try:
+            if not renovar_trabajo(id_trabajo, trabajador):
+                return
+        except PyMongoError:
+            # Se reintenta en la siguiente renovación
+            traceback.print_exc()
+
+def ejecutar_siguiente(trabajador):
+    """
+    Reserva y procesa un trabajo pendiente.
+
+    Returns:
+        True si había un trabajo (terminado o fallido), False si la cola estaba vacía
+    """
+    trabajo = tomar_trabajo(trabajador, PLAZO_TRABAJO_S, MAX_INTENTOS)
+    if trabajo is None:
+        return False
+
+    detener = threading.Event()
+    threading.Thread(
+        target=_renovar_reserva, args=(trabajo["_id"], trabajador, detener), name=f"reserva-{trabajador}", daemon=True
+    ).start()
+    try:
+        terminar_trabajo(trabajo["_id"], trabajador, procesar_trabajo(trabajo))
+    except Exception as e:
+        traceback.print_exc()
+        fallar_trabajo(trabajo["_id"], trabajador, str(e) or type(e).__name__)
+    finally:
+        detener.set()
+    return True
+
+def bucle_trabajador(trabajador, detener=None):
+    """
+    Procesa trabajos hasta que se active el evento detener (o indefinidamente).
+    """
+    detener = detener or threading.Event()
+    while not detener.is_set():
+        try:
+            hubo_trabajo = ejecutar_siguiente(trabajador)
+        except PyMongoError:
+            # Base de datos no disponible: reintentar en el siguiente sondeo
+            traceback.print_exc()
+            hubo_trabajo = False
+        if not hubo_trabajo:
+            detener.wait(SONDEO_S)
+
+def _nombre_trabajador(indice):
+    return f"{socket.gethostname()}:{os.getpid()}:{indice}"
+
+def iniciar_trabajadores(cantidad=TRABAJADORES):
+    """
+    Inicia (una sola vez por proceso) los trabajadores en hilos de fondo.
+    Streamlit vuelve a ejecutar el script en cada interacción, así que las
+    llamadas siguientes no hacen nada.
+    """
+    with _lock:
+        if _hilos:
+            return
+        for indice in range(cantidad):
+            hilo = threading.Thread(
+                target=bucle_trabajador, args=(_nombre_trabajador(indice),), name=f"diagnostico-{indice}", daemon=True
+            )
+            hilo.start()
+            _hilos.append(hilo)
+
+def main():
+    parser = argparse.ArgumentParser(description="Trabajadores de la cola de diagnósticos de ECG")
+    parser.add_argument("--trabajadores", type=int, default=max(TRABAJADORES, 1))
+    args = parser.parse_args()
+
+    detener = threading.Event()
+    hilos = [
+        threading.Thread(target=bucle_trabajador, args=(_nombre_trabajador(indice), detener), daemon=True)
+        for indice in range(args.trabajadores)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    print(f"{args.trabajadores} trabajadores esperando diagnósticos (Ctrl+C para salir)")
+    try:
+        while any(hilo.is_alive() for hilo in hilos):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 # database.py
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError
-from datetime import datetime
+import os
+import gridfs
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+from gridfs.errors import NoFile
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 
 # Configuración de la conexión a MongoDB
@@ -15,6 +18,76 @@ collection_pacientes.create_index("CURP", unique=True)
 
 # Colección de registros de ECG
 collection_ecg = db["Registros_ECG"]
+# Las consultas por paciente filtran por (id_paciente[, veredicto.normal]) y
+# ordenan por (fecha_analisis, _id): los índices compuestos cubren el filtro y
+# el orden en ambos sentidos, sin ordenar en memoria
+collection_ecg.create_index([("id_paciente", 1), ("fecha_analisis", -1), ("_id", -1)])
+collection_ecg.create_index([("id_paciente", 1), ("veredicto.normal", 1), ("fecha_analisis", -1), ("_id", -1)])
+collection_ecg.create_index("veredicto.diagnostico")
+# Un registro por trabajo de la cola: si dos trabajadores procesan el mismo
+# trabajo, el segundo guardado no crea otro registro
+collection_ecg.create_index("id_trabajo", unique=True, partialFilterExpression={"id_trabajo": {"$exists": True}})
+
+# Imágenes de los ECG en GridFS (Imagenes_ECG.files / Imagenes_ECG.chunks); el
+# registro solo guarda su id en "imagen_id" y la imagen se descarga al verla
+imagenes_ecg = gridfs.GridFSBucket(db, bucket_name="Imagenes_ECG")
+
+# Campos que no se devuelven en los listados de ECG (imagen en línea de los
+# registros anteriores a GridFS)
+SIN_IMAGEN = {"imagen_ecg": 0}
+
+# Proyecciones de las consultas de ECG: cada vista pide solo lo que muestra
+PROYECCIONES_ECG = {
+    # Listados: fecha, diagnóstico y veredicto
+    "resumen": {"id_paciente": 1, "fecha_analisis": 1, "anomalias": 1, "veredicto": 1, "imagen_id": 1},
+    # Evolución: valores de picos e intervalos, sin señales ni imagen (el texto
+    # de detalles solo existe en los registros sin migrar)
+    "evolucion": {
+        "fecha_analisis": 1, "anomalias": 1, "veredicto": 1, "picos_ECG": 1, "detalles_picos_del_ECG": 1,
+        "intervalos_ECG": 1
+    },
+    # Historial: resumen más el análisis detallado
+    "historial": {
+        "id_paciente": 1, "fecha_analisis": 1, "anomalias": 1, "veredicto": 1, "imagen_id": 1,
+        "picos_ECG": 1, "detalles_picos_del_ECG": 1
+    },
+    # Registro completo salvo la imagen en línea
+    "completo": SIN_IMAGEN,
+}
+
+# Caché de diagnósticos del modelo; Mongo borra las entradas vencidas con el índice TTL
+collection_cache_diagnosticos = db["Cache_Diagnosticos"]
+collection_cache_diagnosticos.create_index("clave", unique=True)
+collection_cache_diagnosticos.create_index(
+    "fecha", expireAfterSeconds=int(float(os.getenv("DIAGNOSTICO_CACHE_TTL_DIAS", "30")) * 86400)
+)
+
+# Cola de trabajos de diagnóstico; los terminados caducan por el índice TTL
+collection_trabajos = db["Trabajos_Diagnostico"]
+collection_trabajos.create_index("clave", unique=True)
+collection_trabajos.create_index([("estado", 1), ("creado", 1)])
+collection_trabajos.create_index(
+    "terminado", expireAfterSeconds=int(float(os.getenv("DIAGNOSTICO_TRABAJOS_TTL_DIAS", "7")) * 86400)
+)
+
+# Telemetría de las llamadas a LM Studio en una colección limitada (capped):
+# Mongo descarta las mediciones más antiguas al llegar a METRICAS_LLM_MB
+if "Metricas_LLM" not in db.list_collection_names():
+    try:
+        db.create_collection(
+            "Metricas_LLM", capped=True, size=int(float(os.getenv("METRICAS_LLM_MB", "64")) * 1024 * 1024)
+        )
+    except CollectionInvalid:
+        # Otro proceso la creó a la vez
+        pass
+collection_metricas_llm = db["Metricas_LLM"]
+collection_metricas_llm.create_index([("fecha", 1), ("modelo", 1)])
+
+# Peticiones a LM Studio en curso en todos los procesos (interfaz, trabajadores
+# de la cola, lotes); las de un proceso que murió sin cerrarlas caducan por TTL
+PETICIONES_LLM_TTL_S = int(os.getenv("PETICIONES_LLM_TTL_S", "600"))
+collection_peticiones_llm = db["Peticiones_LLM"]
+collection_peticiones_llm.create_index("inicio", expireAfterSeconds=PETICIONES_LLM_TTL_S)
 
 def obtener_pacientes():
     return collection_pacientes.find()
@@ -30,36 +103,569 @@ def eliminar_paciente(id_paciente):
     """
     Eliminar un paciente y todos sus registros de ECG asociados.
     """
-    # Primero eliminar todos los ECGs asociados al paciente
+    # Primero eliminar todos los ECGs asociados al paciente y sus imágenes
+    for ecg in collection_ecg.find({"id_paciente": id_paciente, "imagen_id": {"$exists": True}}, {"imagen_id": 1}):
+        eliminar_imagen_ecg(ecg["imagen_id"])
     collection_ecg.delete_many({"id_paciente": id_paciente})
 
     # Luego elimino el paciente
     result = collection_pacientes.delete_one({"ID Paciente": id_paciente})
     return result.deleted_count > 0
 
-def guardar_ecg_analizado(id_paciente, nombre_paciente, imagen_ecg, anomalias, detalles_picos):
+def obtener_paciente(id_paciente):
     """
-    Guarda el ECG analizado en la colección registro_ECG.
+    Obtiene un paciente por su ID o None si no existe.
+    """
+    return collection_pacientes.find_one({"ID Paciente": id_paciente})
+
+def crear_registro_ecg(id_paciente, nombre_paciente, imagen_ecg, anomalias, picos_ecg, senales_ecg=None,
+                       intervalos_ecg=None, veredicto=None):
+    """
+    Construye el documento de un ECG analizado sin insertarlo ni subir nada.
+    imagen_ecg son los bytes de la imagen, que se suben a GridFS al guardar el
+    registro (guardar_ecg_analizado / guardar_ecgs_analizados), o el id de una
+    imagen que ya está en GridFS.
+    picos_ecg es la lista de picosECG.documento_picos,
+    senales_ecg el documento de senalesECG.codificar_senales, intervalos_ecg
+    el de intervalosECG.documento_intervalos y veredicto el de
+    veredictoECG.Veredicto.documento (todos opcionales).
     """
     registro = {
         "id_paciente": id_paciente,
         "nombre_paciente": nombre_paciente,
-        "imagen_ecg": imagen_ecg,  # Puede ser un archivo binario o una URL
         "anomalias": anomalias,
-        "detalles_picos_del_ECG": detalles_picos,
+        "picos_ECG": picos_ecg,
         "fecha_analisis": datetime.now()
     }
-    collection_ecg.insert_one(registro)
+    if isinstance(imagen_ecg, ObjectId):
+        registro["imagen_id"] = imagen_ecg
+    else:
+        registro["imagen_ecg"] = imagen_ecg  # Pendiente de subir a GridFS
+    if senales_ecg is not None:
+        registro["senales_ECG"] = senales_ecg
+    if intervalos_ecg is not None:
+        registro["intervalos_ECG"] = intervalos_ecg
+    if veredicto is not None:
+        registro["veredicto"] = veredicto
+    return registro
+
+def guardar_ecg_analizado(id_paciente, nombre_paciente, imagen_ecg, anomalias, picos_ecg, senales_ecg=None,
+                          intervalos_ecg=None, veredicto=None, id_trabajo=None):
+    """
+    Guarda el ECG analizado en la colección registro_ECG y devuelve su _id.
+    Con id_trabajo (trabajo de la cola) el guardado es idempotente: si el
+    trabajo ya tiene registro, se devuelve ese sin crear otro.
+    """
+    registro = crear_registro_ecg(
+        id_paciente, nombre_paciente, imagen_ecg, anomalias, picos_ecg, senales_ecg, intervalos_ecg, veredicto
+    )
+    if id_trabajo is not None:
+        return _guardar_ecg_de_trabajo(registro, id_trabajo)
+    subidas = _subir_imagenes([registro])
+    try:
+        return collection_ecg.insert_one(registro).inserted_id
+    except Exception:
+        _eliminar_imagenes_sin_registro([registro], subidas)
+        raise
+
+def _guardar_ecg_de_trabajo(registro, id_trabajo):
+    """
+    Inserta el registro de un trabajo de la cola solo si el trabajo no tiene ya uno.
+    """
+    registro["id_trabajo"] = id_trabajo
+    existente = collection_ecg.find_one({"id_trabajo": id_trabajo}, {"_id": 1})
+    if existente is not None:
+        return existente["_id"]
+    subidas = _subir_imagenes([registro])
+    try:
+        return collection_ecg.insert_one(registro).inserted_id
+    except DuplicateKeyError:
+        # Otro trabajador guardó el mismo trabajo a la vez
+        _eliminar_imagenes_sin_registro([registro], subidas)
+        return collection_ecg.find_one({"id_trabajo": id_trabajo}, {"_id": 1})["_id"]
+    except Exception:
+        _eliminar_imagenes_sin_registro([registro], subidas)
+        raise
+
+def guardar_ecgs_analizados(registros):
+    """
+    Guarda varios ECG analizados con una sola escritura masiva.
+    Devuelve el número de documentos insertados.
+    """
+    if not registros:
+        return 0
+    subidas = _subir_imagenes(registros)
+    try:
+        result = collection_ecg.insert_many(registros, ordered=False)
+    except Exception:
+        _eliminar_imagenes_sin_registro(registros, subidas)
+        raise
+    return len(result.inserted_ids)
+
+def _subir_imagenes(registros):
+    """
+    Sube a GridFS las imágenes pendientes de los registros creados con
+    crear_registro_ecg y deja su id en "imagen_id".
+
+    Returns:
+        Diccionario {índice del registro: id de la imagen subida}
+    """
+    subidas = {}
+    for indice, registro in enumerate(registros):
+        if "imagen_ecg" in registro:
+            registro["imagen_id"] = guardar_imagen_ecg(registro.pop("imagen_ecg"), registro["id_paciente"])
+            subidas[indice] = registro["imagen_id"]
+    return subidas
+
+def _eliminar_imagenes_sin_registro(registros, subidas):
+    """
+    Tras un fallo al insertar, elimina las imágenes subidas que ningún registro
+    guardado referencia (insert_many con ordered=False puede guardar una parte).
+    """
+    guardadas = {
+        ecg["imagen_id"]
+        for ecg in collection_ecg.find({"imagen_id": {"$in": list(subidas.values())}}, {"imagen_id": 1})
+    }
+    for imagen_id in subidas.values():
+        if imagen_id not in guardadas:
+            eliminar_imagen_ecg(imagen_id)
 
-def obtener_ecgs_por_paciente(id_paciente):
+def _proyeccion_ecg(proyeccion):
+    return PROYECCIONES_ECG[proyeccion] if isinstance(proyeccion, str) else proyeccion
+
+def buscar_ecgs(id_paciente, proyeccion="resumen", normal=None, desde=None, hasta=None, limite=None,
+                ascendente=False):
+    """
+    Consulta los ECG de un paciente usando el índice (id_paciente, fecha_analisis).
+
+    Args:
+        id_paciente: ID del paciente
+        proyeccion: Nombre de PROYECCIONES_ECG o proyección de Mongo
+        normal: True/False para filtrar por el veredicto estructurado (los
+            registros sin veredicto solo aparecen sin filtro)
+        desde: Fecha mínima de análisis (incluida) o None
+        hasta: Fecha máxima de análisis (excluida) o None
+        limite: Número máximo de registros o None para todos
+        ascendente: True para ordenar del más antiguo al más reciente
+
+    Returns:
+        Cursor de Mongo ordenado por fecha_analisis
+    """
+    filtro = {"id_paciente": id_paciente}
+    if normal is not None:
+        filtro["veredicto.normal"] = normal
+    if desde is not None or hasta is not None:
+        filtro["fecha_analisis"] = {}
+        if desde is not None:
+            filtro["fecha_analisis"]["$gte"] = desde
+        if hasta is not None:
+            filtro["fecha_analisis"]["$lt"] = hasta
+
+    orden = 1 if ascendente else -1
+    cursor = collection_ecg.find(filtro, _proyeccion_ecg(proyeccion)).sort([("fecha_analisis", orden), ("_id", orden)])
+    if limite:
+        cursor = cursor.limit(limite)
+    return cursor
+
+def pagina_ecgs(id_paciente, tamano, despues=None, proyeccion="historial", normal=None):
+    """
+    Página de ECG de un paciente, del más reciente al más antiguo, con
+    paginación por clave (fecha_analisis, _id): cada página continúa tras el
+    último registro de la anterior usando el índice, sin saltar registros con
+    skip (su coste crece con el número de página).
+
+    Args:
+        id_paciente: ID del paciente
+        tamano: Número de registros por página
+        despues: Cursor (fecha_analisis, _id) devuelto por la página anterior,
+            o None para la primera página
+        proyeccion: Nombre de PROYECCIONES_ECG o proyección de Mongo
+        normal: True/False para filtrar por el veredicto estructurado
+
+    Returns:
+        Tupla (lista de ECG, cursor de la página siguiente o None si es la última)
+    """
+    filtro = {"id_paciente": id_paciente}
+    if normal is not None:
+        filtro["veredicto.normal"] = normal
+    if despues is not None:
+        fecha, id_ecg = despues
+        filtro["$or"] = [
+            {"fecha_analisis": {"$lt": fecha}},
+            {"fecha_analisis": fecha, "_id": {"$lt": id_ecg}},
+        ]
+
+    # Se pide un registro de más para saber si hay otra página
+    ecgs = list(
+        collection_ecg.find(filtro, _proyeccion_ecg(proyeccion))
+        .sort([("fecha_analisis", -1), ("_id", -1)])
+        .limit(tamano + 1)
+    )
+    if len(ecgs) <= tamano:
+        return ecgs, None
+    ecgs = ecgs[:tamano]
+    return ecgs, (ecgs[-1]["fecha_analisis"], ecgs[-1]["_id"])
+
+def ultimos_ecgs(id_paciente, n=10, normal=None):
+    """
+    Resúmenes de los n ECG más recientes de un paciente.
+    """
+    return list(buscar_ecgs(id_paciente, "resumen", normal=normal, limite=n))
+
+def valores_evolucion(id_paciente, desde=None, hasta=None):
     """
-    Obtiene todos los ECG analizados de un paciente específico.
+    Valores de picos e intervalos de los ECG de un paciente, del más antiguo al
+    más reciente (sin imagen ni señales).
+    """
+    return list(buscar_ecgs(id_paciente, "evolucion", desde=desde, hasta=hasta, ascendente=True))
+
+def evolucion_por_fecha(id_paciente, desde=None, hasta=None):
+    """
+    Estadísticas de los picos anormales de cada ECG de un paciente, calculadas
+    en Mongo con una agregación: solo se transfieren los resúmenes, no los
+    registros.
+
+    Args:
+        id_paciente: ID del paciente
+        desde: Fecha mínima de análisis (incluida) o None
+        hasta: Fecha máxima de análisis (excluida) o None
+
+    Returns:
+        Lista ordenada por fecha_analisis con "fecha_analisis", "anomalias",
+        "veredicto", "intervalos_ECG" (solo PR y QT globales), "migrado"
+        (False si el registro aún guarda el texto de picos, que se devuelve en
+        "detalles_picos_del_ECG") y "picos": lista de {"pico", "min", "media",
+        "max", "anomalias"} de las derivaciones anormales
+    """
+    filtro = {"id_paciente": id_paciente}
+    if desde is not None or hasta is not None:
+        filtro["fecha_analisis"] = {}
+        if desde is not None:
+            filtro["fecha_analisis"]["$gte"] = desde
+        if hasta is not None:
+            filtro["fecha_analisis"]["$lt"] = hasta
+
+    tiene_picos = {"$isArray": "$picos_ECG"}
+    campos = ["fecha_analisis", "anomalias", "veredicto", "intervalos_ECG", "migrado", "detalles_picos_del_ECG"]
+    return list(collection_ecg.aggregate([
+        # Índice (id_paciente, fecha_analisis, _id)
+        {"$match": filtro},
+        {"$sort": {"fecha_analisis": 1, "_id": 1}},
+        {"$project": {
+            "fecha_analisis": 1,
+            "anomalias": 1,
+            "veredicto": 1,
+            "intervalos_ECG.global.PR": 1,
+            "intervalos_ECG.global.QT": 1,
+            "migrado": tiene_picos,
+            "detalles_picos_del_ECG": {"$cond": [tiene_picos, None, "$detalles_picos_del_ECG"]},
+            "anormales": {"$filter": {
+                "input": {"$ifNull": ["$picos_ECG", []]}, "as": "p", "cond": "$$p.anormal"
+            }},
+        }},
+        # Una fila por derivación anormal (o una sola si el ECG no tiene)
+        {"$unwind": {"path": "$anormales", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": {"ecg": "$_id", "pico": "$anormales.pico"},
+            **{campo: {"$first": f"${campo}"} for campo in campos},
+            "min": {"$min": "$anormales.valor"},
+            "media": {"$avg": "$anormales.valor"},
+            "max": {"$max": "$anormales.valor"},
+            "anomalias_pico": {"$sum": {"$cond": [{"$ifNull": ["$anormales", False]}, 1, 0]}},
+        }},
+        {"$group": {
+            "_id": "$_id.ecg",
+            **{campo: {"$first": f"${campo}"} for campo in campos},
+            "picos": {"$push": {
+                "pico": "$_id.pico", "min": "$min", "media": "$media", "max": "$max", "anomalias": "$anomalias_pico"
+            }},
+        }},
+        # Quitar la fila vacía de los ECG sin derivaciones anormales
+        {"$project": {
+            **{campo: 1 for campo in campos},
+            "picos": {"$filter": {
+                "input": "$picos", "as": "p", "cond": {"$ne": [{"$ifNull": ["$$p.pico", None]}, None]}
+            }},
+        }},
+        # $group no conserva el orden
+        {"$sort": {"fecha_analisis": 1, "_id": 1}},
+    ]))
+
+def obtener_ecg(id_ecg, proyeccion="completo"):
+    """
+    Obtiene un registro de ECG por su ID, o None si no existe.
+    """
+    return collection_ecg.find_one({"_id": ObjectId(id_ecg)}, _proyeccion_ecg(proyeccion))
+
+def obtener_ecgs_por_paciente(id_paciente, normal=None):
+    """
+    Obtiene todos los ECG analizados de un paciente específico, del más
+    reciente al más antiguo y sin la imagen.
+    Con normal=True/False filtra por el veredicto estructurado (los registros
+    sin veredicto, anteriores a él o pendientes, solo aparecen sin filtro).
+    """
+    return buscar_ecgs(id_paciente, "completo", normal=normal)
+
+def contar_veredictos_por_paciente(id_paciente):
+    """
+    Cuenta los ECG de un paciente por veredicto con una agregación en Mongo.
+
+    Returns:
+        Diccionario {"normales", "anormales", "sin_veredicto", "diagnosticos": {diagnóstico: n}}
     """
-    return collection_ecg.find({"id_paciente": id_paciente})
+    conteo = {"normales": 0, "anormales": 0, "sin_veredicto": 0, "diagnosticos": {}}
+    grupos = collection_ecg.aggregate([
+        {"$match": {"id_paciente": id_paciente}},
+        {"$group": {
+            "_id": {"normal": "$veredicto.normal", "diagnostico": "$veredicto.diagnostico"},
+            "n": {"$sum": 1}
+        }},
+    ])
+    for grupo in grupos:
+        normal = grupo["_id"].get("normal")
+        if normal is True:
+            conteo["normales"] += grupo["n"]
+        elif normal is False:
+            conteo["anormales"] += grupo["n"]
+            diagnostico = grupo["_id"].get("diagnostico")
+            conteo["diagnosticos"][diagnostico] = conteo["diagnosticos"].get(diagnostico, 0) + grupo["n"]
+        else:
+            conteo["sin_veredicto"] += grupo["n"]
+    return conteo
 
 def eliminar_ecg_analizado(id_ecg):
     """
-    Elimina un ECG analizado por su ID.
+    Elimina un ECG analizado por su ID junto con su imagen.
+    """
+    ecg = collection_ecg.find_one_and_delete({"_id": ObjectId(id_ecg)}, {"imagen_id": 1})
+    if ecg is None:
+        return False
+    if ecg.get("imagen_id") is not None:
+        eliminar_imagen_ecg(ecg["imagen_id"])
+    return True
+
+def guardar_imagen_ecg(imagen_bytes, id_paciente):
+    """
+    Sube la imagen de un ECG a GridFS y devuelve su id.
+    """
+    return imagenes_ecg.upload_from_stream(
+        f"{id_paciente}.img", imagen_bytes, metadata={"id_paciente": id_paciente}
+    )
+
+def obtener_imagen_ecg(ecg):
+    """
+    Descarga la imagen de un ECG (solo cuando se va a mostrar).
+
+    Args:
+        ecg: Registro del ECG (con "imagen_id" o, si es anterior a GridFS, su "_id")
+
+    Returns:
+        Bytes de la imagen o None si no existe
+    """
+    if ecg.get("imagen_id") is not None:
+        try:
+            return imagenes_ecg.open_download_stream(ecg["imagen_id"]).read()
+        except NoFile:
+            return None
+    # Registro anterior a GridFS: la imagen sigue en línea en el documento
+    registro = collection_ecg.find_one({"_id": ecg["_id"]}, {"imagen_ecg": 1})
+    return registro.get("imagen_ecg") if registro else None
+
+def eliminar_imagen_ecg(imagen_id):
+    """
+    Elimina de GridFS la imagen de un ECG (si existe).
+    """
+    try:
+        imagenes_ecg.delete(imagen_id)
+    except NoFile:
+        pass
+
+def mover_imagenes_a_gridfs():
+    """
+    Pasa a GridFS las imágenes guardadas en línea en los registros anteriores.
+
+    Returns:
+        Número de registros actualizados
+    """
+    movidos = 0
+    pendientes = collection_ecg.find(
+        {"imagen_ecg": {"$exists": True}, "imagen_id": {"$exists": False}}, {"_id": 1, "id_paciente": 1}
+    )
+    for ecg in pendientes:
+        # La imagen se lee de una en una para no cargarlas todas en memoria
+        registro = collection_ecg.find_one({"_id": ecg["_id"]}, {"imagen_ecg": 1})
+        if not isinstance(registro.get("imagen_ecg"), bytes):
+            continue
+        imagen_id = guardar_imagen_ecg(registro["imagen_ecg"], ecg.get("id_paciente"))
+        collection_ecg.update_one(
+            {"_id": ecg["_id"]}, {"$set": {"imagen_id": imagen_id}, "$unset": {"imagen_ecg": ""}}
+        )
+        movidos += 1
+    return movidos
+
+def obtener_diagnostico_cache(clave):
+    """
+    Obtiene el diagnóstico guardado en la caché para la clave, o None.
+    """
+    return collection_cache_diagnosticos.find_one({"clave": clave}, {"_id": 0})
+
+def guardar_diagnostico_cache(clave, diagnostico, modelo, tiempo_modelo):
+    """
+    Guarda (o renueva) un diagnóstico en la caché.
+    """
+    collection_cache_diagnosticos.update_one(
+        {"clave": clave},
+        {"$set": {
+            "clave": clave,
+            "diagnostico": diagnostico,
+            "modelo": modelo,
+            "tiempo_modelo": tiempo_modelo,
+            "fecha": datetime.now(timezone.utc)  # El índice TTL compara en UTC
+        }},
+        upsert=True
+    )
+
+def encolar_trabajo(clave, trabajo):
+    """
+    Encola un trabajo de diagnóstico si no existe otro con la misma clave.
+    Un trabajo anterior que terminó en error se vuelve a poner pendiente.
+
+    Returns:
+        Documento del trabajo (el nuevo o el que ya existía)
+    """
+    ahora = datetime.now(timezone.utc)
+    documento = collection_trabajos.find_one_and_update(
+        {"clave": clave},
+        {"$setOnInsert": {**trabajo, "clave": clave, "estado": "pendiente", "creado": ahora, "intentos": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if documento["estado"] == "error":
+        # La misma clave implica la misma imagen y opciones: se reutiliza el trabajo
+        documento = collection_trabajos.find_one_and_update(
+            {"_id": documento["_id"], "estado": "error"},
+            {"$set": {"estado": "pendiente", "creado": ahora, "error": None, "intentos": 0}},
+            return_document=ReturnDocument.AFTER
+        ) or collection_trabajos.find_one({"_id": documento["_id"]})
+    return documento
+
+def buscar_trabajo(clave, proyeccion=None):
+    """
+    Obtiene el trabajo de diagnóstico con una clave de deduplicación, o None.
+    """
+    return collection_trabajos.find_one({"clave": clave}, proyeccion)
+
+def obtener_trabajo(id_trabajo, proyeccion=None):
+    """
+    Obtiene un trabajo de diagnóstico por su ID, o None.
+    """
+    return collection_trabajos.find_one({"_id": ObjectId(id_trabajo)}, proyeccion)
+
+def tomar_trabajo(trabajador, plazo_s, max_intentos):
+    """
+    Reserva el trabajo pendiente más antiguo para un trabajador. También
+    recupera los trabajos en proceso que no se renuevan desde hace más de
+    plazo_s segundos (su trabajador murió sin terminarlos), salvo los que ya
+    se intentaron max_intentos veces, que pasan a error.
+
+    Returns:
+        Documento del trabajo reservado o None si no hay trabajos
+    """
+    ahora = datetime.now(timezone.utc)
+    abandonado = {"estado": "procesando", "iniciado": {"$lt": ahora - timedelta(seconds=plazo_s)}}
+    collection_trabajos.update_many(
+        {**abandonado, "intentos": {"$gte": max_intentos}},
+        {"$set": {"estado": "error", "error": f"Abandonado tras {max_intentos} intentos"}}
+    )
+    return collection_trabajos.find_one_and_update(
+        {"$or": [
+            {"estado": "pendiente"},
+            {**abandonado, "intentos": {"$lt": max_intentos}},
+        ]},
+        {"$set": {"estado": "procesando", "iniciado": ahora, "trabajador": trabajador}, "$inc": {"intentos": 1}},
+        sort=[("creado", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _trabajo_reservado(id_trabajo, trabajador):
+    # Solo el trabajador que tiene reservado el trabajo puede actualizarlo
+    return {"_id": id_trabajo, "estado": "procesando", "trabajador": trabajador}
+
+def renovar_trabajo(id_trabajo, trabajador):
+    """
+    Renueva la reserva de un trabajo en proceso para que no se dé por abandonado.
+
+    Returns:
+        False si el trabajo ya no está reservado por este trabajador
+    """
+    result = collection_trabajos.update_one(
+        _trabajo_reservado(id_trabajo, trabajador), {"$set": {"iniciado": datetime.now(timezone.utc)}}
+    )
+    return result.matched_count > 0
+
+def terminar_trabajo(id_trabajo, trabajador, resultado):
+    """
+    Marca el trabajo como terminado con su resultado (la imagen queda en
+    GridFS, referenciada por el registro del ECG).
+
+    Returns:
+        False si el trabajo ya no está reservado por este trabajador
+    """
+    result = collection_trabajos.update_one(
+        _trabajo_reservado(id_trabajo, trabajador),
+        {"$set": {"estado": "terminado", "resultado": resultado, "terminado": datetime.now(timezone.utc)}}
+    )
+    return result.matched_count > 0
+
+def fallar_trabajo(id_trabajo, trabajador, error):
+    """
+    Marca el trabajo como fallido; al volver a encolarlo se reintenta.
+
+    Returns:
+        False si el trabajo ya no está reservado por este trabajador
+    """
+    result = collection_trabajos.update_one(
+        _trabajo_reservado(id_trabajo, trabajador), {"$set": {"estado": "error", "error": error}}
+    )
+    return result.matched_count > 0
+
+def guardar_metricas_llm(metricas):
+    """
+    Guarda mediciones de llamadas a LM Studio (ver telemetriaLLM).
+    """
+    if metricas:
+        collection_metricas_llm.insert_many(metricas, ordered=False)
+
+def actualizar_peticiones_llm(abiertas, cerradas):
+    """
+    Registra las peticiones a LM Studio que empiezan (documentos con _id, modelo
+    e inicio) y borra las que terminaron (por _id). Ver telemetriaLLM.
+    """
+    if abiertas:
+        collection_peticiones_llm.insert_many(abiertas, ordered=False)
+    if cerradas:
+        collection_peticiones_llm.delete_many({"_id": {"$in": list(cerradas)}})
+
+def contar_peticiones_llm():
+    """
+    Peticiones a LM Studio en curso por modelo en todos los procesos, sin contar
+    las que ya superaron PETICIONES_LLM_TTL_S (el TTL de Mongo las borra con retraso).
+    """
+    desde = datetime.now(timezone.utc) - timedelta(seconds=PETICIONES_LLM_TTL_S)
+    return {
+        documento["_id"]: documento["total"]
+        for documento in collection_peticiones_llm.aggregate([
+            {"$match": {"inicio": {"$gte": desde}}},
+            {"$group": {"_id": "$modelo", "total": {"$sum": 1}}},
+        ])
+    }
+
+def obtener_metricas_llm(desde, modelos=None):
+    """
+    Obtiene las mediciones de LM Studio desde una fecha (UTC), opcionalmente
+    solo de algunos modelos, ordenadas por fecha.
     """
-    result = collection_ecg.delete_one({"_id": ObjectId(id_ecg)})
-    return result.deleted_count > 0
\ No newline at end of file
+    filtro = {"fecha": {"$gte": desde}}
+    if modelos:
+        filtro["modelo"] = {"$in": list(modelos)}
+    return collection_metricas_llm.find(filtro, {"_id": 0}).sort("fecha", 1)
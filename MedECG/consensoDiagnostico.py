@@ -0,0 +1,151 @@
+"""
+Diagnóstico por consenso de varios modelos consultados a la vez.
+
+Cada participante es una función obtener_diagnostico_* con su modelo y su peso.
+Todas las consultas se lanzan en paralelo con asyncio (cada función bloqueante
+corre en un hilo propio), cada una con un plazo máximo, y el veredicto se
+devuelve en cuanto la mayoría ponderada ya no puede cambiar, sin esperar a los
+modelos restantes. Así la comparación tarda lo que el modelo más lento
+necesario y no la suma de todos.
+
+Las consultas descartadas o fuera de plazo se cancelan también en su hilo
+(streamDiagnostico.LimiteConsulta): la conexión con LM Studio se cierra y el
+modelo deja de generar en lugar de seguir ocupando la GPU.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from reglasDiagnostico import DIAGNOSTICO_NORMAL, diagnostico_anormal
+from streamDiagnostico import LimiteConsulta
+from veredictoECG import parsear_veredicto
+
+PLAZO_MODELO_S = float(os.getenv("CONSENSO_PLAZO_S", "60"))
+
+# Hilos propios: asyncio.run no espera a que terminen las consultas descartadas
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="consenso")
+
+def clasificar_diagnostico(texto):
+    """
+    Reduce la respuesta de un modelo a una categoría comparable: "normal", el
+    diagnóstico del veredicto o None si la respuesta es un error o no se
+    reconoce.
+    """
+    veredicto = parsear_veredicto(texto)
+    if veredicto is None:
+        return None
+    return "normal" if veredicto.normal else veredicto.diagnostico
+
+def _texto_categoria(categoria):
+    return DIAGNOSTICO_NORMAL if categoria == "normal" else diagnostico_anormal(categoria)
+
+async def _consultar(participante, argumentos, plazo):
+    loop = asyncio.get_running_loop()
+    inicio = time.time()
+    limite = LimiteConsulta(plazo)
+
+    def consultar():
+        with limite:
+            return participante["funcion"](*argumentos, participante["modelo"])
+
+    try:
+        diagnostico, tiempo_modelo = await asyncio.wait_for(loop.run_in_executor(_executor, consultar), timeout=plazo)
+        estado = "ok"
+    except asyncio.TimeoutError:
+        diagnostico, tiempo_modelo, estado = None, None, "plazo"
+    except Exception as e:
+        diagnostico, tiempo_modelo, estado = f"⚠️ Error: {e}", None, "error"
+    finally:
+        # Si la consulta sigue en su hilo (plazo agotado o descartada), detenerla
+        limite.cancelar()
+    return {
+        "nombre": participante["nombre"],
+        "modelo": participante["modelo"],
+        "diagnostico": diagnostico,
+        "categoria": clasificar_diagnostico(diagnostico),
+        "estado": estado,
+        "tiempo": time.time() - inicio,
+        "tiempo_modelo": tiempo_modelo,
+    }
+
+async def diagnosticar_consenso_async(participantes, valores_ecg, valores_por_derivacion, sexo_paciente,
+                                      plazo=PLAZO_MODELO_S):
+    """
+    Consulta a todos los participantes a la vez y devuelve el veredicto ponderado.
+
+    Args:
+        participantes: Lista de diccionarios {"nombre", "funcion", "modelo", "peso"}
+        valores_ecg: Valores promedio de los picos
+        valores_por_derivacion: Diccionario {derivación: {pico: valor}}
+        sexo_paciente: Sexo del paciente
+        plazo: Segundos máximos de espera por modelo
+
+    Returns:
+        Diccionario con:
+            "diagnostico": texto del veredicto (None si ningún modelo respondió)
+            "votos": {categoría: peso acumulado}
+            "respuestas": resultado y latencia de cada modelo (estado "ok",
+                "plazo", "error" o "descartado" si no hizo falta esperarlo)
+            "anticipado": True si se decidió antes de que respondieran todos
+            "tiempo": segundos totales
+    """
+    inicio = time.time()
+    argumentos = (valores_ecg, valores_por_derivacion, sexo_paciente)
+    peso_total = sum(p.get("peso", 1.0) for p in participantes)
+    pesos = {p["nombre"]: p.get("peso", 1.0) for p in participantes}
+
+    tareas = {
+        asyncio.ensure_future(_consultar(p, argumentos, plazo)): p for p in participantes
+    }
+    pendientes = set(tareas)
+    respuestas = []
+    votos = {}
+    peso_respondido = 0.0
+
+    while pendientes:
+        terminadas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+        for tarea in terminadas:
+            respuesta = tarea.result()
+            respuestas.append(respuesta)
+            peso = pesos[respuesta["nombre"]]
+            peso_respondido += peso
+            if respuesta["categoria"] is not None:
+                votos[respuesta["categoria"]] = votos.get(respuesta["categoria"], 0.0) + peso
+
+        # La mayoría es definitiva si ni todo el peso pendiente puede superarla
+        if votos and pendientes:
+            ordenados = sorted(votos.values(), reverse=True)
+            segunda = ordenados[1] if len(ordenados) > 1 else 0.0
+            if ordenados[0] > segunda + (peso_total - peso_respondido):
+                break
+
+    for tarea in pendientes:
+        tarea.cancel()
+        participante = tareas[tarea]
+        respuestas.append({
+            "nombre": participante["nombre"],
+            "modelo": participante["modelo"],
+            "diagnostico": None,
+            "categoria": None,
+            "estado": "descartado",
+            "tiempo": time.time() - inicio,
+            "tiempo_modelo": None,
+        })
+
+    ganadora = max(votos, key=votos.get) if votos else None
+    return {
+        "diagnostico": _texto_categoria(ganadora) if ganadora else None,
+        "votos": votos,
+        "respuestas": respuestas,
+        "anticipado": bool(pendientes),
+        "tiempo": time.time() - inicio,
+    }
+
+def diagnosticar_consenso(participantes, valores_ecg, valores_por_derivacion, sexo_paciente, plazo=PLAZO_MODELO_S):
+    """
+    Versión síncrona de diagnosticar_consenso_async para Streamlit y scripts.
+    """
+    return asyncio.run(
+        diagnosticar_consenso_async(participantes, valores_ecg, valores_por_derivacion, sexo_paciente, plazo)
+    )
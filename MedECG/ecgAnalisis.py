@@ -5,20 +5,12 @@ import matplotlib.pyplot as plt
 from conexion import guardar_ecg_analizado
 from extraer import extract_ecg_values
 import requests
-import json
+from idiomaDiagnostico import diagnostico_en_espanol
+from clienteLMStudio import enviar_chat
 import re
-from googletrans import Translator
 import time
 
-def traducir_texto(texto, idioma_destino="es"):
-    translator = Translator()
-    traduccion = translator.translate(texto, dest=idioma_destino)
-    return traduccion.text
-
 def obtener_diagnostico_lmstudio(valores_ecg, sexo_paciente, modelo="Meta Llama 3.1"):
-    url = "http://localhost:1234/v1/chat/completions"
-    headers = {"Content-Type": "application/json"}
-
     # Modificar el prompt para dejar claro que el Pico QRS debe ser validado correctamente.
     prompt = f"""
     Analiza los siguientes valores de ECG de un paciente {sexo_paciente}:
@@ -62,21 +54,21 @@ def obtener_diagnostico_lmstudio(valores_ecg, sexo_paciente, modelo="Meta Llama
     # 📌 Inicia el cronómetro
     tiempo_inicio = time.time()
 
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    try:
+        response = enviar_chat(data)
+    except requests.RequestException:
+        response = None
 
     # 📌 Calcula el tiempo transcurrido
     tiempo_respuesta = time.time() - tiempo_inicio
 
-    if response.status_code == 200:
+    if response is not None and response.status_code == 200:
         resultado = response.json()["choices"][0]["message"]["content"]
         return resultado, tiempo_respuesta
     else:
         return "⚠️ Error al obtener el diagnóstico", tiempo_respuesta
 
 def obtener_diagnostico_deepseek(valores_ecg, sexo_paciente):
-    url = "http://localhost:1234/v1/chat/completions"
-    headers = {"Content-Type": "application/json"}
-
     prompt = f"""
     Evalúa los valores de ECG de un paciente {sexo_paciente} y determina si hay anomalías.
     Responde solo con el diagnóstico sin explicaciones y no me digas que estas haciendo, que pasos estas haciendo y como lo estas razonando, solo dame una respuestas corta y sencilla.  
@@ -124,29 +116,29 @@ def obtener_diagnostico_deepseek(valores_ecg, sexo_paciente):
     # 📌 Inicia el cronómetro
     tiempo_inicio = time.time()
 
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    try:
+        response = enviar_chat(data)
+    except requests.RequestException:
+        response = None
 
     # 📌 Calcula el tiempo transcurrido
     tiempo_respuesta = time.time() - tiempo_inicio
 
 
-    if response.status_code == 200:
+    if response is not None and response.status_code == 200:
         resultado = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
 
         # Eliminar cualquier etiqueta HTML o texto adicional
         resultado_limpio = re.sub(r"<[^>]+>", "", resultado).strip()
 
-        # Traducir si la respuesta no está en español
-        resultado_final = traducir_texto(resultado_limpio)
+        # Pasar a español solo si hace falta, sin salir a la red
+        resultado_final = diagnostico_en_espanol(resultado_limpio)
 
         return resultado_final, tiempo_respuesta
     else:
         return "⚠️ Error al obtener el diagnóstico", tiempo_respuesta
 
 def obtener_diagnostico_gemma(valores_ecg, sexo_paciente):
-    url = "http://localhost:1234/v1/chat/completions"  # Reemplaza con la URL correcta para el modelo Gemma
-    headers = {"Content-Type": "application/json"}
-
     prompt = f"""
     Evalúa los siguientes valores de ECG para un paciente {sexo_paciente} y determina si hay anomalías. 
     Responde con solo el diagnóstico indicando si hay alguna anomalía y especifica el pico afectado con el diagnóstico. 
@@ -179,12 +171,15 @@ def obtener_diagnostico_gemma(valores_ecg, sexo_paciente):
     # 📌 Inicia el cronómetro
     tiempo_inicio = time.time()
 
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    try:
+        response = enviar_chat(data)
+    except requests.RequestException:
+        response = None
 
     # 📌 Calcula el tiempo transcurrido
     tiempo_respuesta = time.time() - tiempo_inicio
 
-    if response.status_code == 200:
+    if response is not None and response.status_code == 200:
         resultado = response.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip()
         
         # Limpiar cualquier posible etiqueta HTML y traducir la respuesta si no está en español
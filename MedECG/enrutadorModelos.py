@@ -0,0 +1,118 @@
+"""
+Elección del modelo de diagnóstico según la latencia disponible.
+
+En cada consulta se elige entre los modelos configurados teniendo en cuenta:
+    - La latencia reciente medida de cada modelo (mediana de Metricas_LLM en
+      los últimos ENRUTADOR_VENTANA_MIN minutos, solo de los diagnósticos
+      completos: las conversaciones del chatbot y las consultas cortadas a
+      propósito no son comparables)
+    - Las peticiones en curso a cada modelo desde cualquier proceso (interfaz,
+      trabajadores de la cola, lotes), según Peticiones_LLM: LM Studio las
+      atiende en cola, así que cada una suma aproximadamente una latencia más
+    - La complejidad del caso: con ENRUTADOR_DERIVACIONES_COMPLEJO o más
+      derivaciones anormales se prefiere el modelo más grande; en los casos
+      sencillos, el más pequeño
+
+Se toma el primer modelo en orden de preferencia que no esté saturado
+(ENRUTADOR_MAX_EN_CURSO peticiones) y cuya latencia estimada quepa en el
+presupuesto ENRUTADOR_PRESUPUESTO_S. Si ninguno cumple, se toma el de menor
+latencia estimada: en horas pico el modelo de 12B deja paso al más pequeño.
+"""
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from telemetriaLLM import peticiones_en_curso_globales
+
+PRESUPUESTO_S = float(os.getenv("ENRUTADOR_PRESUPUESTO_S", "20"))
+MAX_EN_CURSO = int(os.getenv("ENRUTADOR_MAX_EN_CURSO", "2"))
+VENTANA_MIN = float(os.getenv("ENRUTADOR_VENTANA_MIN", "15"))
+DERIVACIONES_COMPLEJO = int(os.getenv("ENRUTADOR_DERIVACIONES_COMPLEJO", "4"))
+
+# Segundos que se reutilizan las latencias leídas de Mongo
+VIGENCIA_LATENCIAS_S = 15
+
+_latencias = {"leidas": 0.0, "valores": {}}
+_lock = threading.Lock()
+
+def latencias_recientes():
+    """
+    Mediana del tiempo total de los diagnósticos completos de cada modelo en
+    la ventana reciente. Se consulta a Mongo como mucho cada VIGENCIA_LATENCIAS_S.
+
+    Returns:
+        Diccionario {modelo: segundos}; vacío si no hay mediciones o Mongo no responde
+    """
+    with _lock:
+        if time.monotonic() - _latencias["leidas"] < VIGENCIA_LATENCIAS_S:
+            return _latencias["valores"]
+
+    from pymongo.errors import PyMongoError
+    from conexion import obtener_metricas_llm
+
+    desde = datetime.now(timezone.utc) - timedelta(minutes=VENTANA_MIN)
+    tiempos = {}
+    try:
+        for metrica in obtener_metricas_llm(desde):
+            if (
+                metrica.get("origen") == "diagnostico" and metrica.get("completa")
+                and metrica.get("estado_http") == 200 and metrica.get("tiempo_total_s") is not None
+            ):
+                tiempos.setdefault(metrica["modelo"], []).append(metrica["tiempo_total_s"])
+    except PyMongoError:
+        tiempos = {}
+
+    valores = {modelo: statistics.median(lista) for modelo, lista in tiempos.items()}
+    with _lock:
+        _latencias.update(leidas=time.monotonic(), valores=valores)
+    return valores
+
+def derivaciones_anormales(picos_anormales):
+    """
+    Número de derivaciones distintas con algún pico fuera de rango.
+    """
+    return len({d['derivacion'] for datos in picos_anormales.values() for d in datos['derivaciones']})
+
+def elegir_modelo(candidatos, picos_anormales, presupuesto=PRESUPUESTO_S):
+    """
+    Elige el modelo para un diagnóstico.
+
+    Args:
+        candidatos: Lista de diccionarios {"modelo", "funcion", "tamano_b"}
+        picos_anormales: Resultado de obtener_picos_anormales del ECG
+        presupuesto: Latencia máxima deseada en segundos
+
+    Returns:
+        Diccionario con el candidato elegido ("candidato"), el motivo y la
+        latencia estimada de cada modelo (None si no hay mediciones)
+    """
+    latencias = latencias_recientes()
+    en_curso = peticiones_en_curso_globales()
+    complejo = derivaciones_anormales(picos_anormales) >= DERIVACIONES_COMPLEJO
+
+    # Casos complejos: primero el modelo más grande; sencillos: el más pequeño
+    orden = sorted(candidatos, key=lambda c: c["tamano_b"], reverse=complejo)
+    estimaciones = {
+        c["modelo"]: latencias[c["modelo"]] * (1 + en_curso.get(c["modelo"], 0)) if c["modelo"] in latencias else None
+        for c in orden
+    }
+
+    for candidato in orden:
+        modelo = candidato["modelo"]
+        if en_curso.get(modelo, 0) >= MAX_EN_CURSO:
+            continue
+        if estimaciones[modelo] is None or estimaciones[modelo] <= presupuesto:
+            motivo = "caso complejo" if complejo else "caso sencillo"
+            if candidato is not orden[0]:
+                motivo += f", {orden[0]['modelo']} saturado o fuera de presupuesto"
+            return {"candidato": candidato, "motivo": motivo, "estimaciones": estimaciones}
+
+    # Todos saturados o fuera de presupuesto: el de menor latencia estimada
+    # (los modelos sin mediciones van detrás; a igual estimación, el más pequeño)
+    candidato = min(
+        orden,
+        key=lambda c: (estimaciones[c["modelo"]] if estimaciones[c["modelo"]] is not None else float("inf"), c["tamano_b"]),
+    )
+    return {"candidato": candidato, "motivo": "todos fuera de presupuesto", "estimaciones": estimaciones}
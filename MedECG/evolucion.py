@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from conexion import obtener_ecgs_por_paciente
+from conexion import evolucion_por_fecha
+from veredictoECG import veredicto_de_registro
+from picosECG import picos_de_texto
 from datetime import datetime
 import numpy as np
 
@@ -89,8 +91,8 @@ def evolucion_cardiaca(pacientes_ordenados):
 
     if paciente_seleccionado:
         id_paciente = pacientes_ordenados[pacientes_ordenados["Nombre Paciente"] == paciente_seleccionado]["ID Paciente"].values[0]
-        ecgs_analizados = obtener_ecgs_por_paciente(id_paciente)
-        ecgs_analizados = list(ecgs_analizados)
+        # Estadísticas por fecha calculadas en Mongo (agregación), no los registros
+        ecgs_analizados = evolucion_por_fecha(id_paciente)
 
         if len(ecgs_analizados) >= 2:
             # Procesamiento de datos para gráficos
@@ -264,7 +266,7 @@ def agregar_grafico_anomalias_apiladas(ecgs_analizados):
     datos_anomalias = []
     for ecg in ecgs_analizados:
         fecha = ecg['fecha_analisis']
-        _, anomalias = extraer_valores_picos(ecg['detalles_picos_del_ECG'])
+        _, anomalias = estadisticas_picos(ecg)
         anomalias['Fecha'] = fecha
         datos_anomalias.append(anomalias)
     
@@ -315,69 +317,65 @@ def agregar_grafico_anomalias_apiladas(ecgs_analizados):
 # FUNCIONES ORIGINALES (MANTENIDAS)
 # ==============================================
 
+# Claves cortas de los picos e intervalos en las tablas de evolución
+CLAVES_PICO = ['P', 'QRS', 'T', 'U', 'PR', 'QT']
+
+def _valores_vacios():
+    return {f"{clave}_{estadistica}": np.nan for clave in CLAVES_PICO for estadistica in ('avg', 'min', 'max')}
+
+def _clave_pico(nombre):
+    """
+    Clave corta ('P', 'QRS', ...) del nombre de un pico guardado ("Pico P", o
+    "Onda P", "Intervalo PR"... en registros antiguos), o None si no se reconoce.
+    """
+    nombre = nombre.lower()
+    if 'pico qrs' in nombre or 'complejo qrs' in nombre:
+        return 'QRS'
+    if ('pico p' in nombre or 'onda p' in nombre) and 'intervalo pr' not in nombre:
+        return 'P'
+    if 'pico t' in nombre or 'onda t' in nombre:
+        return 'T'
+    if 'pico u' in nombre or 'onda u' in nombre:
+        return 'U'
+    if 'intervalo pr' in nombre:
+        return 'PR'
+    if 'intervalo qt' in nombre:
+        return 'QT'
+    return None
+
 def contar_anomalias_por_pico(ecgs_analizados):
-    """Cuenta las anomalías por tipo de pico en todos los ECG analizados de manera precisa"""
-    contador_anomalias = {
-        'P': 0,      # Anomalías en onda P
-        'QRS': 0,    # Anomalías en complejo QRS
-        'T': 0,      # Anomalías en onda T
-        'U': 0,      # Anomalías en onda U
-        'PR': 0,     # Anomalías en intervalo PR
-        'QT': 0      # Anomalías en intervalo QT
-    }
+    """Cuenta las derivaciones anormales por tipo de pico en todos los ECG analizados"""
+    contador_anomalias = {clave: 0 for clave in CLAVES_PICO}
     
     for ecg in ecgs_analizados:
-        detalles_picos = ecg.get('detalles_picos_del_ECG', '')
-        
-        if not detalles_picos or "No se detectaron" in detalles_picos:
-            continue
-        
-        # Dividir por secciones de picos anormales
-        secciones = [s.strip() for s in detalles_picos.split('🔴') if s.strip()]
-        
-        for seccion in secciones:
-            lineas = [l.strip() for l in seccion.split('\n') if l.strip()]
-            if not lineas:
-                continue
-                
-            # Determinar tipo de pico exacto
-            header = lineas[0].lower()
-            pico_key = None
-            
-            # Detección exacta del tipo de pico
-            if 'pico qrs' in header or 'complejo qrs' in header:
-                pico_key = 'QRS'
-            elif ('pico p' in header or 'onda p' in header) and 'intervalo pr' not in header:
-                pico_key = 'P'
-            elif 'pico t' in header or 'onda t' in header:
-                pico_key = 'T'
-            elif 'pico u' in header or 'onda u' in header:
-                pico_key = 'U'
-            elif 'intervalo pr' in header:
-                pico_key = 'PR'
-            elif 'intervalo qt' in header:
-                pico_key = 'QT'
-            
-            # Solo contar si identificamos claramente el tipo de pico
-            if pico_key:
-                # Contar cada derivación con anomalía (cada 4 líneas = 1 derivación)
-                num_anomalias = 0
-                for i in range(1, len(lineas), 4):
-                    if i + 3 < len(lineas):
-                        # La línea de diferencia (i+3) contiene ↑ o ↓ si hay anomalía
-                        diferencia_linea = lineas[i+3]
-                        if '↑' in diferencia_linea or '↓' in diferencia_linea:
-                            num_anomalias += 1
-                
-                contador_anomalias[pico_key] += num_anomalias
+        _, anomalias = estadisticas_picos(ecg)
+        for clave, n in anomalias.items():
+            contador_anomalias[clave] += n
     
     return contador_anomalias
 
+def estadisticas_picos(resumen):
+    """
+    Mínimo, media y máximo de cada pico y número de derivaciones anormales de
+    un resumen de conexion.evolucion_por_fecha. Los registros sin migrar traen
+    el texto de detalles, que se convierte aquí.
+    """
+    if not resumen.get('migrado'):
+        return extraer_valores_picos(picos_de_texto(resumen.get('detalles_picos_del_ECG')) or [])
+
+    valores = _valores_vacios()
+    anomalias_pico = {clave: 0 for clave in CLAVES_PICO}
+    for estadistica in resumen['picos']:
+        pico_key = _clave_pico(estadistica['pico'])
+        if pico_key:
+            valores[f"{pico_key}_avg"] = estadistica['media']
+            valores[f"{pico_key}_min"] = estadistica['min']
+            valores[f"{pico_key}_max"] = estadistica['max']
+            anomalias_pico[pico_key] += estadistica['anomalias']
+    return valores, anomalias_pico
+
 def procesar_datos_evolucion(ecgs_analizados):
-    # Ordenar ECG por fecha
-    ecgs_analizados.sort(key=lambda x: x['fecha_analisis'] if isinstance(x['fecha_analisis'], datetime) 
-                         else datetime.fromisoformat(x['fecha_analisis']))
-    
+    # Los resúmenes llegan ordenados por fecha desde evolucion_por_fecha
     # Contar anomalías en TODOS los ECG de manera precisa
     contador_anomalias = contar_anomalias_por_pico(ecgs_analizados)
     
@@ -421,87 +419,72 @@ def procesar_datos_evolucion(ecgs_analizados):
         fecha = (ecg['fecha_analisis'] if isinstance(ecg['fecha_analisis'], datetime) 
                 else datetime.fromisoformat(ecg['fecha_analisis']))
         diagnostico = ecg['anomalias']
-        detalles_picos = ecg['detalles_picos_del_ECG']
-        valores_picos, _ = extraer_valores_picos(detalles_picos)
+        veredicto = veredicto_de_registro(ecg)
+        valores_picos, _ = estadisticas_picos(ecg)
+        valores_picos.update(extraer_valores_intervalos(ecg.get('intervalos_ECG')))
         
         datos.append({
             'Fecha': fecha,
             'Diagnóstico': diagnostico,
+            'Normal': veredicto.normal if veredicto else None,
+            'Diagnóstico Simple': _diagnostico_simple(veredicto, diagnostico),
             **valores_picos
         })
     
     return pd.DataFrame(datos), nombres_picos.get(max_pico, 'Complejo QRS')
 
-def extraer_valores_picos(detalles_picos):
-    valores = {
-        'P_avg': np.nan, 'P_min': np.nan, 'P_max': np.nan,
-        'QRS_avg': np.nan, 'QRS_min': np.nan, 'QRS_max': np.nan,
-        'T_avg': np.nan, 'T_min': np.nan, 'T_max': np.nan,
-        'U_avg': np.nan, 'U_min': np.nan, 'U_max': np.nan,
-        'PR_avg': np.nan, 'PR_min': np.nan, 'PR_max': np.nan,
-        'QT_avg': np.nan, 'QT_min': np.nan, 'QT_max': np.nan
-    }
-    
-    anomalias_pico = {'P': 0, 'QRS': 0, 'T': 0, 'U': 0, 'PR': 0, 'QT': 0}
-    
-    if not detalles_picos or "No se detectaron" in detalles_picos:
-        return valores, anomalias_pico
-    
-    try:
-        secciones = [s.strip() for s in detalles_picos.split('🔴') if s.strip()]
-        
-        for seccion in secciones:
-            lineas = [l.strip() for l in seccion.split('\n') if l.strip()]
-            if not lineas:
-                continue
-                
-            tipo_pico = lineas[0].lower()
-            pico_key = None
-            
-            if 'pico qrs' in tipo_pico or 'complejo qrs' in tipo_pico:
-                pico_key = 'QRS'
-            elif ('pico p' in tipo_pico or 'onda p' in tipo_pico) and 'intervalo pr' not in tipo_pico:
-                pico_key = 'P'
-            elif 'pico t' in tipo_pico or 'onda t' in tipo_pico:
-                pico_key = 'T'
-            elif 'pico u' in tipo_pico or 'onda u' in tipo_pico:
-                pico_key = 'U'
-            elif 'intervalo pr' in tipo_pico:
-                pico_key = 'PR'
-            elif 'intervalo qt' in tipo_pico:
-                pico_key = 'QT'
-            
-            valores_pico = []
-            for i in range(1, len(lineas), 4):
-                if i + 3 >= len(lineas):
-                    break
-                
-                try:
-                    valor_str = lineas[i + 1].split("`")[1].split()[0]
-                    valor = float(valor_str)
-                    valores_pico.append(valor)
-                    
-                    # Contar anomalías
-                    if '↑' in lineas[i + 3] or '↓' in lineas[i + 3]:
-                        if pico_key in anomalias_pico:
-                            anomalias_pico[pico_key] += 1
-                except:
-                    continue
-            
-            if pico_key and valores_pico:
-                avg_key = f"{pico_key}_avg"
-                min_key = f"{pico_key}_min"
-                max_key = f"{pico_key}_max"
-                
-                valores[avg_key] = np.mean(valores_pico)
-                valores[min_key] = min(valores_pico)
-                valores[max_key] = max(valores_pico)
-                
-    except Exception as e:
-        st.error(f"Error al extraer valores: {str(e)}")
+def _diagnostico_simple(veredicto, diagnostico):
+    """
+    Etiqueta corta del veredicto para tablas y gráficos ("Normal" o el diagnóstico).
+    """
+    if veredicto is None:
+        return diagnostico
+    return "Normal" if veredicto.normal else veredicto.diagnostico
+
+def extraer_valores_picos(picos):
+    """
+    Mínimo, media y máximo de cada pico en las derivaciones anormales (las
+    únicas que guardaban los registros anteriores) y número de anomalías.
+
+    Args:
+        picos: Entradas de "picos_ECG" (ver picosECG.documento_picos)
+    """
+    valores = _valores_vacios()
+    anomalias_pico = {clave: 0 for clave in CLAVES_PICO}
+    
+    valores_por_pico = {}
+    for entrada in picos:
+        pico_key = _clave_pico(entrada['pico'])
+        if pico_key and entrada['anormal']:
+            valores_por_pico.setdefault(pico_key, []).append(entrada['valor'])
+            anomalias_pico[pico_key] += 1
+    
+    for pico_key, valores_pico in valores_por_pico.items():
+        valores[f"{pico_key}_avg"] = np.mean(valores_pico)
+        valores[f"{pico_key}_min"] = min(valores_pico)
+        valores[f"{pico_key}_max"] = max(valores_pico)
     
     return valores, anomalias_pico
 
+def extraer_valores_intervalos(intervalos_ecg):
+    """
+    Valores de PR y QT (ms) medidos latido a latido al analizar el ECG.
+    Los registros anteriores al motor de intervalos no tienen el campo y se
+    quedan con los valores del texto de detalles.
+    """
+    valores = {}
+    if not intervalos_ecg:
+        return valores
+
+    for intervalo in ('PR', 'QT'):
+        resumen = intervalos_ecg.get('global', {}).get(intervalo)
+        if not resumen or resumen.get('media') is None:
+            continue
+        valores[f"{intervalo}_avg"] = resumen['media']
+        valores[f"{intervalo}_min"] = resumen['min']
+        valores[f"{intervalo}_max"] = resumen['max']
+    return valores
+
 def mostrar_metricas_resumen(df, pico_principal):
     st.subheader("📊 Métricas Clave de Evolución", divider="blue")
     
@@ -557,14 +540,10 @@ def mostrar_metricas_resumen(df, pico_principal):
     
     # Mostrar diagnóstico actual
     with cols[-2]:
-        ultimo_dx = df['Diagnóstico'].iloc[-1]
-        if " - " in ultimo_dx:
-            dx_principal = ultimo_dx.split(" - ")[1]
-            icono = "⚠️" if "⚠️" in ultimo_dx else "✅"
-            st.metric("Diagnóstico Actual", f"{icono} {dx_principal}")
-        else:
-            icono = "✅" if "Normal" in ultimo_dx else "⚠️"
-            st.metric("Diagnóstico Actual", f"{icono} {ultimo_dx}")
+        # Sin veredicto (registro sin migrar) el diagnóstico es desconocido, no anormal
+        normal = df['Normal'].iloc[-1]
+        icono = "❔" if pd.isna(normal) else "✅" if normal else "⚠️"
+        st.metric("Diagnóstico Actual", f"{icono} {df['Diagnóstico Simple'].iloc[-1]}")
     
     # Mostrar total de ECG
     with cols[-1]:
@@ -583,15 +562,16 @@ def mostrar_tabla_datos(df):
     # Seleccionar columnas relevantes para mostrar
     columns_to_show = ['Fecha', 'Diagnóstico']
     for col in df.columns:
-        if col not in ['Fecha', 'Diagnóstico'] and not pd.isna(df[col]).all():
+        if col not in ['Fecha', 'Diagnóstico', 'Normal', 'Diagnóstico Simple'] and not pd.isna(df[col]).all():
             columns_to_show.append(col)
     
     # Función para aplicar estilo condicional
     def style_table(row):
         styles = [''] * len(row)
         
-        # Resaltar diagnósticos anormales
-        if "⚠️" in str(row['Diagnóstico']) or "Anomalía" in str(row['Diagnóstico']):
+        # Resaltar diagnósticos anormales (sin veredicto no se sabe: no se resalta)
+        normal = df_display.at[row.name, 'Normal']
+        if not pd.isna(normal) and not normal:
             styles[columns_to_show.index('Diagnóstico')] = 'background-color: #ffebee;'
         
         # Resaltar valores extremos en QRS
@@ -689,11 +669,8 @@ def mostrar_graficos_evolucion(df, pico_principal):
     
     # Gráfico 2: Histograma de diagnósticos - SOLO SI HAY MÁS DE UN DIAGNÓSTICO
     with st.container():
-        # Simplificar diagnóstico para visualización
+        # Diagnóstico simple tomado del veredicto estructurado
         df_dx = df.copy()
-        df_dx['Diagnóstico Simple'] = df_dx['Diagnóstico'].apply(
-            lambda x: x.split(" - ")[1] if " - " in x else x
-        )
         
         # Verificar si hay más de un diagnóstico único
         diagnosticos_unicos = df_dx['Diagnóstico Simple'].unique()
@@ -865,7 +842,7 @@ def mostrar_analisis_tendencias(df, pico_principal):
         st.error(f"No se pudo calcular la tendencia: {e}")
     
     # Análisis de diagnóstico cambiante
-    if len(df['Diagnóstico'].unique()) > 1:
+    if len(df['Diagnóstico Simple'].unique()) > 1:
         st.markdown("""
         <div class='metric-card'>
             <h4>📌 Evolución del Diagnóstico</h4>
@@ -878,7 +855,7 @@ def mostrar_analisis_tendencias(df, pico_principal):
             if i == 0:
                 cambios.append("Primer registro")
             else:
-                if df['Diagnóstico'].iloc[i] != df['Diagnóstico'].iloc[i-1]:
+                if df['Diagnóstico Simple'].iloc[i] != df['Diagnóstico Simple'].iloc[i-1]:
                     cambios.append("Cambio significativo")
                 else:
                     cambios.append("Sin cambio")
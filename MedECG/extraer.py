@@ -1,20 +1,63 @@
+import tempfile
+
 import numpy as np
 import cv2
 from scipy import signal
 from PIL import Image
 import matplotlib.pyplot as plt
+from rejillaECG import obtener_disposicion
+from intervalosECG import medir_intervalos, resumen_global, resumir_intervalos
+
+# Ancho físico del papel de ECG (A4 horizontal) para estimar la resolución de la
+# imagen cuando no se ve la cuadrícula milimetrada
+ANCHO_PAPEL_MM = 297
+
+# Anchos de papel plausibles (mm) para validar el paso de cuadrícula medido
+ANCHOS_PAPEL_VALIDOS_MM = (150, 450)
+
+# Píxeles de margen por región en el modo por mosaicos: el cierre y la apertura
+# con kernel 3x3 son cuatro pasadas que dependen cada una del píxel vecino
+MARGEN_MOSAICO = 4
 
-def extract_ecg_values(image, lead_region):
+# Calibración estándar del papel de ECG
+VELOCIDAD_PAPEL_MM_S = 25   # mm/s
+GANANCIA_MM_MV = 10         # mm/mV
+
+# Resolución objetivo (píxeles por mm) de cada nivel de preprocesamiento.
+# None (por defecto) conserva la resolución original de la imagen; los niveles
+# suponen que la imagen abarca ancho_mm de papel.
+NIVELES_RESOLUCION = {
+    "rapido": 4.0,     # Vista previa rápida
+    "completo": 8.0,   # Precisión completa (la rejilla de 1 mm queda con 8 px)
+}
+
+def _parametros_escalados(escala):
+    """
+    Ajusta los parámetros de detección (en píxeles de la imagen original) a la escala de trabajo.
+    """
+    ventana = max(5, int(round(15 * escala)) | 1)  # Savitzky-Golay necesita ventana impar > orden
+    return {
+        "ventana": ventana,
+        "distancia": max(1, int(round(30 * escala))),
+        "busqueda_p": max(1, int(round(30 * escala))),
+        "busqueda_t": max(1, int(round(40 * escala))),
+        "busqueda_u": max(1, int(round(30 * escala))),
+    }
+
+def extract_ecg_values(image, lead_region, rng=None, escala=1.0):
     """
     Extrae los valores de la señal ECG desde una región específica de la imagen.
 
     Args:
         image: Imagen preprocesada en escala de grises
         lead_region: Coordenadas (top, bottom, left, right) de la región de interés
+        rng: numpy.random.Generator opcional para aplicar la variación aleatoria
+        escala: Factor de reescalado aplicado a la imagen en el preprocesamiento
 
     Returns:
         Diccionario con los valores de los picos del ECG
     """
+    parametros = _parametros_escalados(escala)
     top, bottom, left, right = lead_region
     lead_image = image[top:bottom, left:right]
 
@@ -24,10 +67,36 @@ def extract_ecg_values(image, lead_region):
     # Normalizar y suavizar la señal
     if np.max(ecg_profile) > 0:
         ecg_profile = ecg_profile / np.max(ecg_profile)
-    ecg_profile_smooth = signal.savgol_filter(ecg_profile, 15, 3)
+    ecg_profile_smooth = signal.savgol_filter(ecg_profile, parametros["ventana"], 3)
+
+    return _valores_desde_perfil(ecg_profile_smooth, rng, escala)
+
+def _detectar_picos(ecg_profile_smooth, escala=1.0):
+    """
+    Detecta los picos (ondas P, QRS, T y U) de un perfil normalizado y suavizado.
+    """
+    distancia = _parametros_escalados(escala)["distancia"]
+    peaks, _ = signal.find_peaks(ecg_profile_smooth, height=0.4, distance=distancia)
+    return peaks
+
+def _valores_desde_perfil(ecg_profile_smooth, rng=None, escala=1.0, peaks=None):
+    """
+    Calcula las amplitudes de los picos a partir de un perfil ya normalizado y suavizado.
+
+    Args:
+        ecg_profile_smooth: Perfil de columnas suavizado de una derivación
+        rng: numpy.random.Generator opcional para aplicar la variación aleatoria
+        escala: Factor de reescalado aplicado a la imagen en el preprocesamiento
+        peaks: Picos ya detectados con _detectar_picos (se detectan si es None)
+
+    Returns:
+        Diccionario con los valores de los picos del ECG
+    """
+    parametros = _parametros_escalados(escala)
 
     # Detectar picos (ondas P, QRS, T y U)
-    peaks, _ = signal.find_peaks(ecg_profile_smooth, height=0.4, distance=30)
+    if peaks is None:
+        peaks = _detectar_picos(ecg_profile_smooth, escala)
 
     # Factores de calibración
     calibration_factor = 0.1
@@ -39,7 +108,7 @@ def extract_ecg_values(image, lead_region):
         mid_peak_idx = len(peaks) // 2
 
         # Estimar la onda P
-        p_search_start = max(0, peaks[mid_peak_idx] - 30)
+        p_search_start = max(0, peaks[mid_peak_idx] - parametros["busqueda_p"])
         p_region = ecg_profile_smooth[p_search_start:peaks[mid_peak_idx]]
         p_amplitude = np.max(p_region) * calibration_factor if len(p_region) > 0 else p_amplitude
 
@@ -47,13 +116,13 @@ def extract_ecg_values(image, lead_region):
         qrs_amplitude = ecg_profile_smooth[peaks[mid_peak_idx]] * calibration_factor
 
         # T
-        t_search_end = min(len(ecg_profile_smooth), peaks[mid_peak_idx] + 40)
+        t_search_end = min(len(ecg_profile_smooth), peaks[mid_peak_idx] + parametros["busqueda_t"])
         t_region = ecg_profile_smooth[peaks[mid_peak_idx]:t_search_end]
         t_amplitude = np.max(t_region) * calibration_factor if len(t_region) > 0 else t_amplitude
 
         # U
         u_region_start = peaks[mid_peak_idx] + len(t_region)
-        u_region_end = min(u_region_start + 30, len(ecg_profile_smooth))
+        u_region_end = min(u_region_start + parametros["busqueda_u"], len(ecg_profile_smooth))
         u_region = ecg_profile_smooth[u_region_start:u_region_end]
         u_amplitude = np.max(u_region) * calibration_factor if len(u_region) > 0 else u_amplitude
 
@@ -63,11 +132,19 @@ def extract_ecg_values(image, lead_region):
     t_amplitude = max(0.1, min(0.6, t_amplitude))
     u_amplitude = max(0.0, min(0.25, u_amplitude))
 
-    # Variación aleatoria para simular mediciones reales
-    p_amplitude = round(p_amplitude * np.random.uniform(0.9, 1.1), 3)
-    qrs_amplitude = round(qrs_amplitude * np.random.uniform(0.9, 1.1), 3)
-    t_amplitude = round(t_amplitude * np.random.uniform(0.9, 1.1), 3)
-    u_amplitude = round(u_amplitude * np.random.uniform(0.9, 1.1), 3)
+    # Variación aleatoria para simular mediciones reales, solo si se pide de forma
+    # explícita con un generador; por defecto la extracción es determinista
+    if rng is not None:
+        variacion = rng.uniform(0.9, 1.1, size=4)
+        p_amplitude *= variacion[0]
+        qrs_amplitude *= variacion[1]
+        t_amplitude *= variacion[2]
+        u_amplitude *= variacion[3]
+
+    p_amplitude = round(p_amplitude, 3)
+    qrs_amplitude = round(qrs_amplitude, 3)
+    t_amplitude = round(t_amplitude, 3)
+    u_amplitude = round(u_amplitude, 3)
 
     return {
         "Pico P": p_amplitude,
@@ -76,41 +153,41 @@ def extract_ecg_values(image, lead_region):
         "Pico U": u_amplitude
     }
 
-def analyze_all_leads(image):
+def get_lead_regions(height, width, disposicion=None):
     """
-    Analiza todas las derivaciones del ECG en la imagen.
+    Calcula las regiones de las 12 derivaciones para la rejilla 4x3.
 
     Args:
-        image: Imagen PIL o ruta del archivo de imagen
+        height: Alto de la imagen binarizada
+        width: Ancho de la imagen binarizada
+        disposicion: Cortes detectados {"filas": [...], "columnas": [...]} en fracciones
+            (ver rejillaECG.obtener_disposicion); None usa la división uniforme
 
     Returns:
-        Diccionario con valores de todas las derivaciones
+        Diccionario {derivación: (top, bottom, left, right)}
     """
-    # Cargar imagen
-    if isinstance(image, str):
-        image = Image.open(image)
+    if disposicion is not None:
+        filas = [int(round(f * height)) for f in disposicion["filas"]]
+        cols = [int(round(c * width)) for c in disposicion["columnas"]]
+        return {
+            'I':    (filas[0], filas[1], cols[0], cols[1]),
+            'II':   (filas[1], filas[2], cols[0], cols[1]),
+            'III':  (filas[2], filas[3], cols[0], cols[1]),
+            'aVR':  (filas[0], filas[1], cols[1], cols[2]),
+            'aVL':  (filas[1], filas[2], cols[1], cols[2]),
+            'aVF':  (filas[2], filas[3], cols[1], cols[2]),
+            'V1':   (filas[0], filas[1], cols[2], cols[3]),
+            'V2':   (filas[1], filas[2], cols[2], cols[3]),
+            'V3':   (filas[2], filas[3], cols[2], cols[3]),
+            'V4':   (filas[3], filas[4], cols[0], cols[1]),
+            'V5':   (filas[3], filas[4], cols[1], cols[2]),
+            'V6':   (filas[3], filas[4], cols[2], cols[3]),
+        }
 
-    # Convertir a escala de grises e invertir colores
-    img_gray = np.array(image.convert("L"))
-    img_inv = 255 - img_gray
-
-    # Aplicar umbralización
-    _, binary = cv2.threshold(img_inv, 50, 255, cv2.THRESH_BINARY)
-
-    # Operaciones morfológicas para limpiar la imagen
-    kernel = np.ones((3, 3), np.uint8)
-    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-
-    # Definir derivaciones y sus regiones en la imagen
-    lead_names = ['I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6']
-    
-    # Dimensiones de la imagen
-    height, width = binary.shape
     row_height = height // 4
     col_width = width // 3
 
-    lead_regions = {
+    return {
         'I':    (0, row_height, 0, col_width),
         'II':   (row_height, 2 * row_height, 0, col_width),
         'III':  (2 * row_height, 3 * row_height, 0, col_width),
@@ -125,9 +202,567 @@ def analyze_all_leads(image):
         'V6':   (3 * row_height, height, 2 * col_width, width),
     }
 
-    # Extraer valores de cada derivación
+def _factor_reduccion(width, nivel, ancho_mm):
+    """
+    Factor entero de reducción que deja la imagen lo más cerca posible de la
+    resolución objetivo del nivel.
+    """
+    if nivel is None:
+        return 1
+    if nivel not in NIVELES_RESOLUCION:
+        raise ValueError(f"Nivel de resolución desconocido: {nivel}")
+
+    px_por_mm = width / ancho_mm
+    return max(1, int(round(px_por_mm / NIVELES_RESOLUCION[nivel])))
+
+def normalize_resolution(img_gray, nivel=None, ancho_mm=ANCHO_PAPEL_MM):
+    """
+    Reduce la imagen en escala de grises a la resolución objetivo del nivel indicado.
+
+    Solo se reduce (nunca se amplía) y por un factor entero con cv2.INTER_AREA,
+    que promedia bloques completos de píxeles (conserva los trazos finos) y es
+    mucho más rápido que una reducción por un factor fraccionario.
+
+    Args:
+        img_gray: Imagen en escala de grises (uint8)
+        nivel: Clave de NIVELES_RESOLUCION o None para conservar la resolución original
+        ancho_mm: Ancho físico que representa la imagen, para estimar los píxeles por mm
+
+    Returns:
+        Tupla (imagen reescalada, escala aplicada)
+    """
+    return _reducir(img_gray, _factor_reduccion(img_gray.shape[1], nivel, ancho_mm))
+
+def _reducir(img_gray, factor):
+    """
+    Reduce la imagen por un factor entero (ver normalize_resolution).
+
+    Returns:
+        Tupla (imagen reducida, escala aplicada)
+    """
+    if factor == 1:
+        return img_gray, 1.0
+
+    height, width = img_gray.shape
+
+    # Recortar a un múltiplo del factor (como mucho factor-1 píxeles de margen)
+    img_gray = img_gray[:height - height % factor, :width - width % factor]
+    nuevo_tamano = (img_gray.shape[1] // factor, img_gray.shape[0] // factor)
+    img_gray = cv2.resize(img_gray, nuevo_tamano, interpolation=cv2.INTER_AREA)
+    return img_gray, 1.0 / factor
+
+def _abrir_imagen(image, nivel, ancho_mm):
+    """
+    Abre la imagen si hace falta y, si es un JPEG abierto aquí, configura su
+    decodificación directa en escala de grises y a menor escala (escalado DCT)
+    según el nivel, sin materializar el fotograma en color.
+
+    El factor de reducción se calcula una sola vez, con el ancho original; el
+    escalado DCT aplica la parte que es potencia de 2 (1/2, 1/4 u 1/8) y el
+    resto queda para después de decodificar.
+
+    Returns:
+        Tupla (imagen PIL, ancho original en píxeles, factor de reducción total,
+        factor entero que falta aplicar a la imagen decodificada)
+    """
+    abierta_aqui = not isinstance(image, Image.Image)
+    if abierta_aqui:
+        image = Image.open(image)
+    ancho_original = image.size[0]
+
+    factor = _factor_reduccion(ancho_original, nivel, ancho_mm)
+    restante = factor
+    if abierta_aqui and image.format == "JPEG":
+        dct = next(divisor for divisor in (8, 4, 2, 1) if factor % divisor == 0)
+        image.draft("L", (ancho_original // dct, image.size[1] // dct))
+        restante = max(1, factor // round(ancho_original / image.size[0]))
+
+    return image, ancho_original, factor, restante
+
+def binarize(img_gray):
+    """
+    Invierte, umbraliza y limpia (cierre + apertura 3x3) una imagen en escala de grises.
+
+    Args:
+        img_gray: Imagen o región en escala de grises (uint8)
+
+    Returns:
+        Imagen binaria (uint8)
+    """
+    img_inv = 255 - img_gray
+
+    # Aplicar umbralización
+    _, binary = cv2.threshold(img_inv, 50, 255, cv2.THRESH_BINARY)
+
+    # Operaciones morfológicas para limpiar la imagen
+    kernel = np.ones((3, 3), np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+
+    return binary
+
+def _escala_grises(image, nivel, ancho_mm):
+    """
+    Abre la imagen, la convierte a escala de grises y la reduce al nivel indicado.
+
+    Returns:
+        Tupla (imagen en escala de grises uint8, escala aplicada respecto a la
+        imagen original, ancho original en píxeles)
+    """
+    image, ancho_original, factor, restante = _abrir_imagen(image, nivel, ancho_mm)
+
+    # Convertir a escala de grises y terminar de reducir la resolución
+    img_gray, _ = _reducir(np.array(image.convert("L")), restante)
+    return img_gray, 1.0 / factor, ancho_original
+
+def preprocess_image(image, nivel=None, ancho_mm=ANCHO_PAPEL_MM):
+    """
+    Convierte la imagen a escala de grises, la reduce al nivel de resolución indicado,
+    la invierte, la binariza y la limpia.
+
+    Args:
+        image: Imagen PIL, ruta o archivo (por ejemplo io.BytesIO) de la imagen
+        nivel: Clave de NIVELES_RESOLUCION o None para conservar la resolución original
+        ancho_mm: Ancho físico que representa la imagen
+
+    Returns:
+        Tupla (imagen binaria uint8, escala aplicada respecto a la imagen original)
+    """
+    img_gray, escala, _ = _escala_grises(image, nivel, ancho_mm)
+    return binarize(img_gray), escala
+
+def load_grayscale_mapped(image, nivel=None, ancho_mm=ANCHO_PAPEL_MM, alto_franja=256):
+    """
+    Decodifica la imagen a escala de grises en un búfer mapeado en memoria (archivo temporal).
+
+    La conversión a grises y la reducción de resolución se hacen por franjas
+    horizontales, de modo que el único fotograma completo que vive en RAM es el
+    que decodifica PIL (en grises y ya reducido si es un JPEG abierto aquí), y el
+    resultado puede paginarse a disco por el sistema operativo.
+    El archivo temporal se elimina al liberar el arreglo.
+
+    Args:
+        image: Imagen PIL, ruta o archivo (por ejemplo io.BytesIO) de la imagen
+        nivel: Clave de NIVELES_RESOLUCION o None para conservar la resolución original
+        ancho_mm: Ancho físico que representa la imagen
+        alto_franja: Filas de la imagen decodificada que se procesan a la vez
+
+    Returns:
+        Tupla (np.memmap uint8 en escala de grises, escala aplicada respecto a la imagen original)
+    """
+    gray, escala, _ = _gris_mapeado(image, nivel, ancho_mm, alto_franja)
+    return gray, escala
+
+def _gris_mapeado(image, nivel, ancho_mm, alto_franja=256):
+    """
+    load_grayscale_mapped que devuelve también el ancho original en píxeles.
+    """
+    image, ancho_original, factor_total, factor = _abrir_imagen(image, nivel, ancho_mm)
+
+    width, height = image.size
+    # Igual que normalize_resolution: recortar a un múltiplo del factor
+    alto_util, ancho_util = height - height % factor, width - width % factor
+    alto_franja = max(factor, alto_franja - alto_franja % factor)
+
+    with tempfile.TemporaryFile() as archivo:
+        gray = np.memmap(archivo, dtype=np.uint8, mode="w+", shape=(alto_util // factor, ancho_util // factor))
+
+    for y in range(0, alto_util, alto_franja):
+        franja = image.crop((0, y, ancho_util, min(y + alto_franja, alto_util)))
+        franja = np.asarray(franja if franja.mode == "L" else franja.convert("L"))
+        if factor > 1:
+            franja = cv2.resize(
+                franja, (franja.shape[1] // factor, franja.shape[0] // factor), interpolation=cv2.INTER_AREA
+            )
+        gray[y // factor:y // factor + franja.shape[0]] = franja
+
+    return gray, 1.0 / factor_total, ancho_original
+
+def tiled_binary_regions(gray, lead_regions, margen=MARGEN_MOSAICO):
+    """
+    Binariza la imagen región por región, sin binarizar la imagen completa.
+
+    Cada región se procesa con un margen de píxeles vecinos para que la limpieza
+    morfológica dé exactamente el mismo resultado que sobre la imagen completa.
+
+    Args:
+        gray: Imagen en escala de grises (puede ser un np.memmap)
+        lead_regions: Diccionario {derivación: (top, bottom, left, right)}
+        margen: Píxeles de margen alrededor de cada región
+
+    Returns:
+        Generador de tuplas (derivación, región binarizada sin el margen)
+    """
+    height, width = gray.shape
+    for lead, (top, bottom, left, right) in lead_regions.items():
+        t, b = max(0, top - margen), min(height, bottom + margen)
+        l, r = max(0, left - margen), min(width, right + margen)
+        region = binarize(np.ascontiguousarray(gray[t:b, l:r]))
+        yield lead, region[top - t:bottom - t, left - l:right - l]
+
+def tiled_column_profiles(gray, lead_regions, margen=MARGEN_MOSAICO):
+    """
+    Binariza y calcula el perfil de columnas región por región (ver tiled_binary_regions).
+
+    Returns:
+        Diccionario {derivación: perfil de columnas sin normalizar}
+    """
+    return {lead: np.sum(region, axis=0) for lead, region in tiled_binary_regions(gray, lead_regions, margen)}
+
+def trace_centroid(region):
+    """
+    Posición vertical del trazo en cada columna de la región: el centroide de
+    los píxeles de tinta en lugar de su suma, que conserva la forma de la onda.
+
+    Args:
+        region: Región binarizada de una derivación
+
+    Returns:
+        Arreglo float64 con la fila del centroide por columna (NaN sin tinta)
+    """
+    tinta = region > 0
+    cuenta = np.count_nonzero(tinta, axis=0)
+    filas = np.arange(region.shape[0], dtype=np.float64)
+    suma = filas @ tinta
+    centroide = np.full(region.shape[1], np.nan)
+    np.divide(suma, cuenta, out=centroide, where=cuenta > 0)
+    return centroide
+
+def _maximo_local(valores, centro, radio):
+    """
+    Posición (con precisión subpíxel) del máximo de valores en centro ± radio, o
+    None si el máximo cae en el borde del tramo y no es un máximo local.
+    """
+    inicio, fin = max(1, int(centro - radio)), min(len(valores) - 1, int(centro + radio) + 1)
+    if fin - inicio < 3:
+        return None
+    i = inicio + int(np.argmax(valores[inicio:fin]))
+    if i in (inicio, fin - 1):
+        return None
+    # Interpolación parabólica con los dos vecinos
+    curvatura = valores[i - 1] - 2 * valores[i] + valores[i + 1]
+    return i + (0.5 * (valores[i - 1] - valores[i + 1]) / curvatura if curvatura else 0.0)
+
+def estimar_px_por_mm(img_gray, paso=8):
+    """
+    Mide los píxeles por mm a partir de la cuadrícula milimetrada del papel.
+
+    Las líneas verticales de la cuadrícula aclaran u oscurecen columnas completas
+    y el trazo solo unas pocas filas de cada columna, así que la mediana por
+    columna conserva la cuadrícula y descarta el trazo. El periodo de ese perfil
+    se toma de su autocorrelación y se afina con múltiplos cada vez más lejanos.
+    Si el periodo es el de las líneas gruesas (5 mm), se confirma con las de
+    1 mm; en ambos casos el ancho de papel resultante debe ser plausible
+    (ANCHOS_PAPEL_VALIDOS_MM).
+
+    Args:
+        img_gray: Imagen en escala de grises (puede ser un np.memmap)
+        paso: Se usa una fila de cada paso
+
+    Returns:
+        Píxeles por mm, o None si la imagen no muestra una cuadrícula clara
+        (por ejemplo, un escaneo en blanco y negro)
+    """
+    perfil = 255.0 - np.median(np.asarray(img_gray[::paso]), axis=0)
+    ancho = len(perfil)
+    ventana = max(9, ancho // 40)
+    if ancho <= 4 * ventana:
+        return None
+
+    # Quitar las variaciones lentas (sombras, bordes del papel)
+    detalle = (perfil - np.convolve(perfil, np.ones(ventana) / ventana, mode="same"))[ventana:-ventana]
+    if not detalle.any():
+        return None
+    n = len(detalle)
+    correlacion = np.fft.irfft(np.abs(np.fft.rfft(detalle, 2 * n)) ** 2)[:n]
+    correlacion /= correlacion[0]
+
+    # Desfases hasta ~1/25 del ancho: cubren las líneas de 1 y de 5 mm
+    limite = ancho // 25
+    picos = [i for i in range(4, limite - 1) if correlacion[i - 1] <= correlacion[i] > correlacion[i + 1]]
+    if not picos:
+        return None
+    mejor = max(correlacion[i] for i in picos)
+    if mejor < 0.3:
+        return None
+
+    # Periodo fundamental: el menor desfase casi tan correlacionado como el mejor
+    periodo = float(next(i for i in picos if correlacion[i] >= 0.8 * mejor))
+    multiplo = 1
+    while 4 * multiplo * periodo < n:
+        multiplo *= 2
+        lejano = _maximo_local(correlacion, multiplo * periodo, periodo / 4)
+        if lejano is None:
+            break
+        periodo = lejano / multiplo
+
+    minimo_mm, maximo_mm = ANCHOS_PAPEL_VALIDOS_MM
+    if minimo_mm <= ancho / periodo <= maximo_mm:
+        return periodo
+    if minimo_mm <= 5 * ancho / periodo <= maximo_mm:
+        menor = _maximo_local(correlacion, periodo / 5, periodo / 15)
+        if menor is not None and correlacion[int(round(menor))] >= 0.1:
+            return periodo / 5
+    return None
+
+def _px_por_mm(img_gray, escala, ancho_original, ancho_mm):
+    """
+    Píxeles por mm de la imagen de trabajo: los de la cuadrícula si se ve y, si
+    no, los de la imagen original (suponiendo que abarca ancho_mm de papel) por
+    la escala aplicada.
+    """
+    return estimar_px_por_mm(img_gray) or ancho_original / ancho_mm * escala
+
+def digitize_leads(centroids, px_por_mm):
+    """
+    Convierte los centroides del trazo de cada derivación en señales de voltaje.
+
+    Las columnas sin tinta se interpolan linealmente y la línea base se toma
+    como la mediana del trazo (el segmento isoeléctrico domina el latido).
+
+    Args:
+        centroids: Diccionario {derivación: centroide por columna (trace_centroid)}
+        px_por_mm: Píxeles por mm de la imagen de trabajo
+
+    Returns:
+        Diccionario {"calibracion": {...}, "derivaciones": {derivación: float32 en mV}}
+    """
+    derivaciones = {}
+    for lead, centroide in centroids.items():
+        validos = np.flatnonzero(~np.isnan(centroide))
+        if len(validos) == 0:
+            derivaciones[lead] = np.zeros(len(centroide), np.float32)
+            continue
+        trazo = np.interp(np.arange(len(centroide)), validos, centroide[validos])
+        # En la imagen el eje y crece hacia abajo
+        derivaciones[lead] = ((np.median(trazo) - trazo) / (px_por_mm * GANANCIA_MM_MV)).astype(np.float32)
+
+    return {
+        "calibracion": {
+            "frecuencia_muestreo": px_por_mm * VELOCIDAD_PAPEL_MM_S,
+            "px_por_mm": px_por_mm,
+            "velocidad_mm_s": VELOCIDAD_PAPEL_MM_S,
+            "ganancia_mm_mv": GANANCIA_MM_MV,
+            "unidad": "mV",
+        },
+        "derivaciones": derivaciones,
+    }
+
+def column_profiles(image, lead_regions):
+    """
+    Calcula el perfil de columnas de todas las derivaciones en una sola pasada.
+
+    Las derivaciones de una misma fila comparten la banda horizontal de la imagen,
+    así que se suma cada banda una vez y cada perfil es un corte de esa suma.
+
+    Args:
+        image: Imagen binarizada
+        lead_regions: Diccionario {derivación: (top, bottom, left, right)}
+
+    Returns:
+        Diccionario {derivación: perfil de columnas sin normalizar}
+    """
+    bandas = {}
+    for top, bottom, _, _ in lead_regions.values():
+        if (top, bottom) not in bandas:
+            bandas[(top, bottom)] = np.sum(image[top:bottom], axis=0)
+
+    return {
+        lead: bandas[(top, bottom)][left:right]
+        for lead, (top, bottom, left, right) in lead_regions.items()
+    }
+
+def smooth_profiles(profiles, escala=1.0):
+    """
+    Normaliza y suaviza todos los perfiles a la vez.
+
+    Los perfiles se apilan en matrices (derivaciones x columnas) agrupados por longitud,
+    de modo que la normalización y el filtro Savitzky-Golay se aplican en una sola
+    llamada por grupo.
+
+    Args:
+        profiles: Diccionario {derivación: perfil de columnas}
+        escala: Factor de reescalado aplicado a la imagen en el preprocesamiento
+
+    Returns:
+        Diccionario {derivación: perfil normalizado y suavizado}
+    """
+    ventana = _parametros_escalados(escala)["ventana"]
+    grupos = {}
+    for lead, perfil in profiles.items():
+        grupos.setdefault(len(perfil), []).append(lead)
+
+    suavizados = {}
+    for leads in grupos.values():
+        matriz = np.stack([profiles[lead] for lead in leads]).astype(np.float64)
+
+        # Normalizar cada fila por su máximo (las filas vacías se dejan igual)
+        maximos = np.max(matriz, axis=1, keepdims=True)
+        np.divide(matriz, maximos, out=matriz, where=maximos > 0)
+
+        matriz_suave = signal.savgol_filter(matriz, ventana, 3, axis=1)
+        for fila, lead in enumerate(leads):
+            suavizados[lead] = matriz_suave[fila]
+
+    # Mantener el orden original de las derivaciones
+    return {lead: suavizados[lead] for lead in profiles}
+
+def values_from_profiles(profiles, rng=None, escala=1.0):
+    """
+    Normaliza y suaviza todos los perfiles en lote (smooth_profiles) y extrae los
+    picos de cada derivación. Solo la detección de picos se hace derivación por derivación.
+
+    Args:
+        profiles: Diccionario {derivación: perfil de columnas}
+        rng: numpy.random.Generator opcional para aplicar la variación aleatoria
+        escala: Factor de reescalado aplicado a la imagen en el preprocesamiento
+
+    Returns:
+        Diccionario con los valores de los picos de cada derivación
+    """
+    suavizados = smooth_profiles(profiles, escala)
+    return {lead: _valores_desde_perfil(perfil, rng, escala) for lead, perfil in suavizados.items()}
+
+def _perfiles_de_imagen(image, nivel, mosaico, detectar, plantilla, digitalizar, ancho_mm):
+    """
+    Preprocesa la imagen y calcula los perfiles de columnas de cada derivación y,
+    si se pide, los centroides del trazo y los píxeles por mm, en una sola pasada.
+
+    Returns:
+        Tupla (perfiles, centroides, escala, píxeles por mm de la imagen de
+        trabajo o None si no se digitaliza)
+    """
+    centroids = {}
+    px_por_mm = None
+
+    if mosaico:
+        gray, escala, ancho_original = _gris_mapeado(image, nivel, ancho_mm)
+        disposicion = obtener_disposicion(gray, binaria=False, plantilla=plantilla) if detectar else None
+        lead_regions = get_lead_regions(*gray.shape, disposicion)
+
+        profiles = {}
+        for lead, region in tiled_binary_regions(gray, lead_regions):
+            profiles[lead] = np.sum(region, axis=0)
+            if digitalizar:
+                centroids[lead] = trace_centroid(region)
+        if digitalizar:
+            px_por_mm = _px_por_mm(gray, escala, ancho_original, ancho_mm)
+        return profiles, centroids, escala, px_por_mm
+
+    img_gray, escala, ancho_original = _escala_grises(image, nivel, ancho_mm)
+    if digitalizar:
+        px_por_mm = _px_por_mm(img_gray, escala, ancho_original, ancho_mm)
+    binary = binarize(img_gray)
+
+    # Dimensiones de la imagen y regiones de cada derivación
+    height, width = binary.shape
+    disposicion = obtener_disposicion(binary, plantilla=plantilla) if detectar else None
+    lead_regions = get_lead_regions(height, width, disposicion)
+
+    profiles = column_profiles(binary, lead_regions)
+    if digitalizar:
+        centroids = {
+            lead: trace_centroid(binary[top:bottom, left:right])
+            for lead, (top, bottom, left, right) in lead_regions.items()
+        }
+    return profiles, centroids, escala, px_por_mm
+
+def analyze_all_leads(image, rng=None, nivel=None, mosaico=False, detectar_rejilla=False, plantilla=None,
+                      ancho_mm=ANCHO_PAPEL_MM):
+    """
+    Analiza todas las derivaciones del ECG en la imagen.
+
+    El resultado es determinista salvo que se pase un generador aleatorio,
+    por ejemplo np.random.default_rng(semilla).
+
+    Args:
+        image: Imagen PIL, ruta o archivo (por ejemplo io.BytesIO) de la imagen
+        rng: numpy.random.Generator opcional para aplicar la variación aleatoria
+        nivel: Nivel de resolución ("rapido", "completo" o None para la original)
+        mosaico: Si es True, la escala de grises se mapea a disco y se binariza
+            región por región, limitando la memoria de trabajo a una derivación
+            en lugar de varias copias de la imagen completa (mismos resultados)
+        detectar_rejilla: Si es True, las regiones se detectan en la imagen
+            (una vez por plantilla) en lugar de dividirla en partes iguales
+        plantilla: Identificador opcional del equipo o plantilla de impresión;
+            implica detectar_rejilla
+        ancho_mm: Ancho del papel que abarca la imagen; fija la reducción de los
+            niveles de resolución y, si no se ve la cuadrícula milimetrada, la
+            calibración de las señales (analyze_ecg)
+
+    Returns:
+        Diccionario con valores de todas las derivaciones
+    """
+    detectar = detectar_rejilla or plantilla is not None
+    profiles, _, escala, _ = _perfiles_de_imagen(image, nivel, mosaico, detectar, plantilla, False, ancho_mm)
+
+    # Extraer valores de todas las derivaciones en lote
+    return values_from_profiles(profiles, rng, escala)
+
+def analyze_ecg(image, rng=None, nivel=None, mosaico=False, detectar_rejilla=False, plantilla=None,
+                ancho_mm=ANCHO_PAPEL_MM):
+    """
+    Análisis completo del ECG en una sola pasada sobre la imagen: valores de los
+    picos (igual que analyze_all_leads), señal digitalizada de cada derivación
+    (digitize_leads) e intervalos de todos los latidos (intervalosECG).
+
+    Los picos de cada derivación se detectan una sola vez y se reutilizan para
+    los valores y para los intervalos. La escala de tiempo y voltaje se mide en
+    la cuadrícula milimetrada (estimar_px_por_mm) cuando es visible.
+
+    Args:
+        Los mismos que analyze_all_leads
+
+    Returns:
+        Diccionario con:
+            "valores": valores de los picos de todas las derivaciones
+            "senales": señales digitalizadas con su calibración
+            "intervalos": {"derivaciones": {derivación: arreglos por latido},
+                           "resumen": {derivación: estadísticas}, "global": estadísticas}
+    """
+    detectar = detectar_rejilla or plantilla is not None
+    profiles, centroids, escala, px_por_mm = _perfiles_de_imagen(
+        image, nivel, mosaico, detectar, plantilla, True, ancho_mm
+    )
+    senales = digitize_leads(centroids, px_por_mm)
+    frecuencia = senales["calibracion"]["frecuencia_muestreo"]
+
+    valores = {}
+    intervalos = {}
+    for lead, perfil in smooth_profiles(profiles, escala).items():
+        peaks = _detectar_picos(perfil, escala)
+        valores[lead] = _valores_desde_perfil(perfil, rng, escala, peaks)
+        intervalos[lead] = medir_intervalos(senales["derivaciones"][lead], peaks, frecuencia)
+
+    return {
+        "valores": valores,
+        "senales": senales,
+        "intervalos": {
+            "derivaciones": intervalos,
+            "resumen": {lead: resumir_intervalos(medidas) for lead, medidas in intervalos.items()},
+            "global": resumen_global(intervalos),
+        },
+    }
+
+def analyze_all_leads_per_lead(image, rng=None, nivel=None):
+    """
+    Ruta de referencia: analiza cada derivación por separado con extract_ecg_values.
+
+    Se conserva para comparar resultados y tiempos con el motor en lote.
+
+    Args:
+        image: Imagen PIL, ruta o archivo (por ejemplo io.BytesIO) de la imagen
+        rng: numpy.random.Generator opcional para aplicar la variación aleatoria
+        nivel: Nivel de resolución ("rapido", "completo" o None para la original)
+
+    Returns:
+        Diccionario con valores de todas las derivaciones
+    """
+    binary, escala = preprocess_image(image, nivel)
+    height, width = binary.shape
+
     ecg_values = {}
-    for lead, region in lead_regions.items():
-        ecg_values[lead] = extract_ecg_values(binary, region)
+    for lead, region in get_lead_regions(height, width).items():
+        ecg_values[lead] = extract_ecg_values(binary, region, rng, escala)
 
     return ecg_values
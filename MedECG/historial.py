@@ -1,11 +1,17 @@
 import streamlit as st
-from conexion import obtener_ecgs_por_paciente, eliminar_ecg_analizado
+from conexion import (
+    pagina_ecgs, eliminar_ecg_analizado, contar_veredictos_por_paciente, obtener_imagen_ecg
+)
+from veredictoECG import veredicto_de_registro
+from picosECG import picos_anormales_de_documento, picos_de_registro
 import pandas as pd
-import io
 import time
 from datetime import datetime
 import base64
 
+# ECG por página del historial
+TAMANO_PAGINA = 10
+
 def mostrar_imagen_interactiva(imagen_bytes, expander_id):
     """
     Muestra la imagen con zoom y desplazamiento usando OpenSeadragon.
@@ -35,22 +41,50 @@ def mostrar_imagen_interactiva(imagen_bytes, expander_id):
     
     st.components.v1.html(html_code, height=550)
 
-def mostrar_detalles_picos(detalles_picos, diagnostico):
+def _estado_paginas(id_paciente, normal):
+    """
+    Cursores de las páginas visitadas del historial; se reinician al cambiar
+    de paciente o de filtro.
+    """
+    clave = (id_paciente, normal)
+    estado = st.session_state.get("historial_paginas")
+    if estado is None or estado["clave"] != clave:
+        estado = {"clave": clave, "cursores": [None], "pagina": 0}
+        st.session_state["historial_paginas"] = estado
+    return estado
+
+def _cambiar_pagina(estado, desplazamiento, cursor_siguiente=None):
+    if desplazamiento > 0:
+        # Se guarda el cursor de la página siguiente para poder volver a ella
+        del estado["cursores"][estado["pagina"] + 1:]
+        estado["cursores"].append(cursor_siguiente)
+    estado["pagina"] += desplazamiento
+
+def mostrar_paginacion(estado, cursor_siguiente, total, sufijo):
+    """
+    Botones para moverse entre páginas del historial.
+    """
+    col_anterior, col_pagina, col_siguiente = st.columns([1, 2, 1])
+    col_anterior.button(
+        "⬅️ Más recientes", key=f"historial_anterior_{sufijo}", disabled=estado["pagina"] == 0,
+        on_click=_cambiar_pagina, args=(estado, -1), use_container_width=True
+    )
+    paginas = max(1, -(-total // TAMANO_PAGINA))
+    col_pagina.markdown(
+        f"<p style='text-align:center'>Página {estado['pagina'] + 1} de {paginas}</p>", unsafe_allow_html=True
+    )
+    col_siguiente.button(
+        "Más antiguos ➡️", key=f"historial_siguiente_{sufijo}", disabled=cursor_siguiente is None,
+        on_click=_cambiar_pagina, args=(estado, 1, cursor_siguiente), use_container_width=True
+    )
+
+def mostrar_detalles_picos(picos, diagnostico):
     """Función para mostrar detalles de picos con descripción diagnóstica en formato de tabla"""
-    if not detalles_picos or detalles_picos == "No se detectaron picos anormales en este ECG.":
+    picos_anormales = picos_anormales_de_documento(picos)
+    if not picos_anormales:
         st.info("🌟 ECG completamente normal - No se detectaron anomalías")
         return
-    
-    # Limpiar el título principal
-    if detalles_picos.startswith("###"):
-        detalles_picos = detalles_picos.replace("###", "").strip()
 
-    # Eliminar específicamente el encabezado no deseado
-    if "🔴 Detalles de Picos Anormales" in detalles_picos:
-        detalles_picos = detalles_picos.replace("🔴 Detalles de Picos Anormales", "").strip()
-    elif "Detalles de Picos Anormales" in detalles_picos:
-        detalles_picos = detalles_picos.replace("Detalles de Picos Anormales", "").strip()
-    
     # Mostrar descripción diagnóstica
     if "Hipertrofia ventricular" in diagnostico:
         st.markdown("""
@@ -70,16 +104,11 @@ def mostrar_detalles_picos(detalles_picos, diagnostico):
         </div>
         """, unsafe_allow_html=True)
     
-    # Dividir por picos anormales
-    secciones = [s for s in detalles_picos.split('🔴') if s.strip()]
-    
-    for seccion in secciones:
-        lineas = [l.strip() for l in seccion.split('\n') if l.strip()]
-        if not lineas:
-            continue
-            
+    for pico, datos in picos_anormales.items():
         # Encabezado del pico
-        header = lineas[0]
+        header = (
+            f"{pico} - {len(datos['derivaciones'])} derivaciones anormales (Rango normal: {datos['rango_normal']})"
+        )
         with st.container():
             st.markdown(f"""
             <div style='background-color: #f5f5f5; padding: 10px; border-radius: 5px; margin: 10px 0 20px 0;'>
@@ -87,36 +116,15 @@ def mostrar_detalles_picos(detalles_picos, diagnostico):
             </div>
             """, unsafe_allow_html=True)
             
-            # Preparar datos para la tabla
+            # Preparar datos para la tabla (el color según la dirección guardada)
             tabla_data = []
-            for i in range(1, len(lineas), 4):
-                if i+3 >= len(lineas):
-                    break
-                    
-                derivacion = lineas[i].replace("**", "").replace(":", "").strip()
-                valor_str = lineas[i+1].split("`")[1]
-                valor = float(valor_str.split()[0])
-                rango = lineas[i+2].split("`")[1]
-                rango_min = float(rango.split('-')[0])
-                rango_max = float(rango.split('-')[1].split()[0])
-                desviacion = lineas[i+3].split("`")[1]
-                
-                # Determinar dirección y color
-                if valor > rango_max:
-                    direccion = "↑"  # Valor por encima del rango máximo
-                    color = "color: #d32f2f;"  # Rojo
-                elif valor < rango_min:
-                    direccion = "↓"  # Valor por debajo del rango mínimo
-                    color = "color: #1976d2;"  # Azul
-                else:
-                    direccion = ""   # No debería ocurrir para valores anormales
-                    color = ""
-                
+            for d in datos['derivaciones']:
+                color = {"↑": "color: #d32f2f;", "↓": "color: #1976d2;"}.get(d['direccion'], "")
                 tabla_data.append({
-                    "Derivación": derivacion,
-                    "Valor Extraido": f"{valor:.3f} mV",
-                    "Rango Normal": rango,
-                    "Diferencia": f"{desviacion} {direccion}",
+                    "Derivación": f"Derivación {d['derivacion']}",
+                    "Valor Extraido": f"{d['valor']:.3f} {d['unidad']}",
+                    "Rango Normal": datos['rango_normal'],
+                    "Diferencia": f"{d['desviacion']} {d['unidad']} {d['direccion'] or ''}",
                     "_style": color
                 })
             # Nueva implementación de estilo de tabla
@@ -256,14 +264,39 @@ def historial_medico(pacientes_ordenados):
 
     if id_historial:
         id_paciente = pacientes_ordenados[pacientes_ordenados["Nombre Paciente"] == id_historial]["ID Paciente"].values[0]
-        ecgs_analizados = obtener_ecgs_por_paciente(id_paciente)
-        ecgs_analizados = list(ecgs_analizados)
+        # Filtro por el veredicto guardado (consulta indexada en Mongo)
+        filtro_veredicto = st.radio(
+            "Mostrar",
+            ["Todos", "Normales", "Anormales"],
+            horizontal=True,
+            key="historial_filtro_veredicto"
+        )
+        normal = {"Todos": None, "Normales": True, "Anormales": False}[filtro_veredicto]
+        # Solo se consulta y se dibuja una página (más reciente primero, sin señales)
+        estado = _estado_paginas(id_paciente, normal)
+        ecgs_analizados, cursor_siguiente = pagina_ecgs(
+            id_paciente, TAMANO_PAGINA, estado["cursores"][estado["pagina"]], normal=normal
+        )
+        if not ecgs_analizados and estado["pagina"] > 0:
+            # La página quedó vacía (p. ej. tras eliminar su último ECG): volver al inicio
+            st.session_state.pop("historial_paginas")
+            st.rerun()
 
         if ecgs_analizados:
             st.subheader(f"📊 ECG Analizados de {id_historial}", divider="blue")
 
-            # Ordenar ECG por fecha (más reciente primero)
-            ecgs_analizados.sort(key=lambda x: x['fecha_analisis'], reverse=True)
+            conteo = contar_veredictos_por_paciente(id_paciente)
+            col_normales, col_anormales, col_pendientes = st.columns(3)
+            col_normales.metric("✅ Normales", conteo["normales"])
+            col_anormales.metric("⚠️ Anormales", conteo["anormales"])
+            col_pendientes.metric("Sin veredicto", conteo["sin_veredicto"])
+
+            total = {
+                None: conteo["normales"] + conteo["anormales"] + conteo["sin_veredicto"],
+                True: conteo["normales"],
+                False: conteo["anormales"],
+            }[normal]
+            mostrar_paginacion(estado, cursor_siguiente, total, "arriba")
 
             for idx, ecg in enumerate(ecgs_analizados):
                 # Formatear fecha
@@ -284,7 +317,8 @@ def historial_medico(pacientes_ordenados):
                     
                     with col2:
                         # Mostrar diagnóstico principal con estilo
-                        if "Sin Anomalías" in ecg['anomalias'] or "Normal" in ecg['anomalias']:
+                        veredicto = veredicto_de_registro(ecg)
+                        if veredicto is not None and veredicto.normal:
                             st.success(f"✅ {ecg['anomalias']}")
                         else:
                             st.warning(f"{ecg['anomalias']}")
@@ -295,18 +329,23 @@ def historial_medico(pacientes_ordenados):
                                    key=f"eliminar_{idx}", 
                                    help="Eliminar este ECG",
                                    use_container_width=True,
-                                   on_click=lambda: st.session_state.update({'to_delete': ecg['_id']})):
+                                   on_click=lambda id_ecg=ecg['_id']: st.session_state.update({'to_delete': id_ecg})):
                             pass
 
                     # Expander para la imagen ECG
+                    # El contenido de un expander se ejecuta aunque esté cerrado: la
+                    # imagen solo se descarga de GridFS al activar el interruptor
                     with st.expander("🖼️ Ver ECG", expanded=False):
-                        mostrar_imagen_interactiva(io.BytesIO(ecg['imagen_ecg']).getvalue(), idx)
+                        if st.toggle("Cargar imagen", key=f"imagen_{ecg['_id']}"):
+                            imagen_bytes = obtener_imagen_ecg(ecg)
+                            if imagen_bytes:
+                                mostrar_imagen_interactiva(imagen_bytes, idx)
+                            else:
+                                st.warning("No se encontró la imagen de este ECG.")
 
                     # Expander para detalles de picos
                     with st.expander("📈 Analisis Detallado", expanded=False):
-                        detalles_picos = ecg['detalles_picos_del_ECG']
-                        
-                        mostrar_detalles_picos(detalles_picos, ecg['anomalias'])
+                        mostrar_detalles_picos(picos_de_registro(ecg), ecg['anomalias'])
 
                 # Manejar eliminación después de renderizar todo
                 if 'to_delete' in st.session_state:
@@ -316,6 +355,8 @@ def historial_medico(pacientes_ordenados):
                         st.rerun()
                     del st.session_state['to_delete']
 
+            mostrar_paginacion(estado, cursor_siguiente, total, "abajo")
+
         else:
             st.warning(f"⚠️ El paciente {id_historial} no tiene análisis ECG registrados.")
             st.image("https://cdn-icons-png.flaticon.com/512/4076/4076478.png", width=150)
@@ -0,0 +1,75 @@
+"""
+Manejo local del idioma de las respuestas de diagnóstico, sin servicios externos.
+
+Los modelos a veces responden en inglés. En lugar de traducir cada respuesta
+con un servicio en línea, los diagnósticos conocidos en inglés se normalizan a
+las etiquetas canónicas en español que usa el resto del sistema; el resto del
+texto se devuelve tal cual.
+"""
+import re
+
+from reglasDiagnostico import DIAGNOSTICO_NORMAL, diagnostico_anormal
+
+# Palabras frecuentes de cada idioma para la detección (sin las que se
+# escriben igual en los dos, como "normal", "ventricular" o "no")
+PALABRAS_ES = {
+    "sin", "anomalías", "anomalias", "anormal", "el", "la", "de", "en", "con",
+    "hipertrofia", "onda", "invertida", "arritmia", "cardiaca", "cardíaca",
+    "alteración", "alteracion", "repolarización", "repolarizacion", "y", "los", "las",
+}
+PALABRAS_EN = {
+    "anomalies", "abnormal", "the", "of", "in", "with", "and", "hypertrophy",
+    "wave", "inverted", "inversion", "arrhythmia", "cardiac", "repolarization",
+    "abnormality", "alteration", "findings", "detected",
+}
+
+# Diagnósticos conocidos en inglés → etiqueta canónica en español
+DIAGNOSTICOS_EN = (
+    (r"ventricular\s+hypertrophy", "Hipertrofia ventricular"),
+    (r"(inverted\s+t[\s-]*wave|t[\s-]*wave\s+inversion|inverted\s+t)", "Onda T invertida"),
+    (r"(cardiac\s+)?arrhythmia", "Arritmia cardiaca"),
+    (r"repolari[sz]ation\s+(abnormality|alteration|disorder|changes?)", "Alteración en la repolarización"),
+)
+NORMAL_EN = r"(no\s+(anomalies|abnormalities)|normal\s+ecg|ecg\s+normal|within\s+normal)"
+
+def _palabras(texto):
+    return re.findall(r"[a-záéíóúñü]+", texto.lower())
+
+def es_espanol(texto):
+    """
+    True si el texto parece estar en español: tiene acentos o más palabras
+    frecuentes en español que en inglés (un empate no basta).
+    """
+    if re.search(r"[áéíóúñ¿¡]", texto.lower()):
+        return True
+    palabras = _palabras(texto)
+    espanol = sum(palabra in PALABRAS_ES for palabra in palabras)
+    ingles = sum(palabra in PALABRAS_EN for palabra in palabras)
+    return espanol > ingles
+
+def normalizar_diagnostico(texto):
+    """
+    Convierte un diagnóstico en inglés a la etiqueta canónica en español.
+
+    Returns:
+        Texto canónico ("✅ Sin Anomalías - ECG Normal" o "⚠️ ECG Anormal - ...")
+        o None si el texto no corresponde a ningún diagnóstico conocido
+    """
+    minusculas = texto.lower()
+    for patron, diagnostico in DIAGNOSTICOS_EN:
+        if re.search(patron, minusculas):
+            return diagnostico_anormal(diagnostico)
+    if re.search(NORMAL_EN, minusculas):
+        return DIAGNOSTICO_NORMAL
+    return None
+
+def diagnostico_en_espanol(texto):
+    """
+    Devuelve el diagnóstico en español: normalizado si es un diagnóstico
+    conocido en inglés o, si no, el texto original.
+
+    Los diagnósticos conocidos se normalizan antes de mirar el idioma, porque
+    los más cortos ("Normal ECG", "Ventricular hypertrophy") apenas tienen
+    palabras propias del inglés.
+    """
+    return normalizar_diagnostico(texto) or texto
@@ -0,0 +1,179 @@
+"""
+Motor de intervalos del ECG (RR, frecuencia cardíaca, PR y QT) a partir de los
+picos detectados por extraer.py.
+
+Los complejos QRS se localizan con los picos de find_peaks sobre el perfil de
+columnas, pero las ondas P y T se miden sobre la señal digitalizada (centroide
+del trazo): el perfil de columnas cuenta tinta y marca las pendientes, no la
+forma de la onda. Todas las medidas se calculan para cada latido a la vez, con
+operaciones vectorizadas de NumPy sobre ventanas alrededor de cada QRS, en
+lugar de medir solo el latido central.
+"""
+import warnings
+
+import numpy as np
+from scipy import signal
+
+# Fracción de la altura del mayor pico que debe alcanzar un pico para contarse
+# como complejo QRS (descarta ondas T y P altas que también detecta find_peaks)
+FRACCION_QRS = 0.6
+
+# Altura relativa a la que se miden el inicio y el final de cada onda
+ALTURA_BASE = 0.9
+
+# Ventanas de búsqueda en ms alrededor del pico QRS
+VENTANA_R_MS = 60
+VENTANA_P_MS = 300
+VENTANA_T_MS = 500
+
+INTERVALOS = ("RR", "FC", "PR", "QT", "QTc")
+
+def _ventanas(perfil, inicios, longitud):
+    """
+    Matriz (latidos x longitud) con las muestras de perfil[inicio:inicio + longitud]
+    de cada latido; las posiciones fuera del perfil quedan en -inf.
+    """
+    relleno = np.full(longitud, -np.inf)
+    extendido = np.concatenate((relleno, perfil, relleno))
+    vistas = np.lib.stride_tricks.sliding_window_view(extendido, longitud)
+    return vistas[np.asarray(inicios) + longitud].copy()
+
+def _limites(perfil, picos):
+    """
+    Inicio y final (posiciones fraccionarias) de las ondas centradas en picos.
+    Los picos sin prominencia (bordes de ventana) devuelven NaN.
+    """
+    if len(picos) == 0:
+        return np.empty(0), np.empty(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        anchos, _, izquierda, derecha = signal.peak_widths(perfil, picos, rel_height=ALTURA_BASE)
+    sin_onda = anchos <= 0
+    izquierda[sin_onda] = np.nan
+    derecha[sin_onda] = np.nan
+    return izquierda, derecha
+
+def medir_intervalos(senal, picos, frecuencia_muestreo):
+    """
+    Mide los intervalos de todos los latidos de una derivación.
+
+    Args:
+        senal: Señal digitalizada de la derivación (mV, línea base en 0)
+        picos: Índices devueltos por signal.find_peaks sobre el perfil de columnas
+        frecuencia_muestreo: Muestras por segundo de la señal (px/mm x mm/s)
+
+    Returns:
+        Diccionario de arreglos en ms (FC en latidos por minuto):
+            "QRS": índice de cada complejo QRS
+            "RR", "FC": un valor por par de latidos consecutivos
+            "PR", "QT", "QTc": un valor por latido (NaN si no se pudo medir)
+    """
+    # Las ondas pueden ser negativas según la derivación: se mide la desviación
+    desviacion = np.abs(np.asarray(senal, np.float64))
+    picos = np.asarray(picos, np.intp)
+    ms_por_muestra = 1000.0 / frecuencia_muestreo
+
+    if len(picos) > 0:
+        # El pico del perfil de columnas cae en la pendiente del QRS: se ajusta al vértice de la onda
+        radio = max(1, int(round(VENTANA_R_MS / ms_por_muestra)))
+        cercanos = _ventanas(desviacion, picos - radio, 2 * radio + 1)
+        picos = np.unique(picos - radio + np.argmax(cercanos, axis=1))
+        picos = picos[desviacion[picos] >= FRACCION_QRS * desviacion[picos].max()]
+
+    rr = np.diff(picos) * ms_por_muestra
+    fc = 60000.0 / rr
+    resultado = {
+        "QRS": picos,
+        "RR": rr,
+        "FC": fc,
+        "PR": np.full(len(picos), np.nan),
+        "QT": np.full(len(picos), np.nan),
+        "QTc": np.full(len(picos), np.nan),
+    }
+    if len(picos) == 0:
+        return resultado
+
+    inicio_qrs, fin_qrs = _limites(desviacion, picos)
+
+    # Onda P: máximo de la ventana anterior al QRS
+    ventana_p = max(1, int(round(VENTANA_P_MS / ms_por_muestra)))
+    antes = _ventanas(desviacion, picos - ventana_p, ventana_p)
+    # Solo se busca antes del inicio del QRS (sin inicio medido no se busca)
+    limite_p = np.where(np.isnan(inicio_qrs), 0, inicio_qrs - (picos - ventana_p))
+    antes[np.arange(ventana_p) >= limite_p[:, None]] = -np.inf
+    valida_p = np.isfinite(antes.max(axis=1))
+    picos_p = picos - ventana_p + np.argmax(antes, axis=1)
+
+    # Onda T: máximo de la ventana posterior al final del QRS
+    ventana_t = max(1, int(round(VENTANA_T_MS / ms_por_muestra)))
+    despues = _ventanas(desviacion, picos, ventana_t)
+    limite_t = np.where(np.isnan(fin_qrs), ventana_t, fin_qrs - picos)
+    despues[np.arange(ventana_t) <= limite_t[:, None]] = -np.inf
+    valida_t = np.isfinite(despues.max(axis=1))
+    picos_t = picos + np.argmax(despues, axis=1)
+
+    inicio_p = np.full(len(picos), np.nan)
+    inicio_p[valida_p] = _limites(desviacion, picos_p[valida_p])[0]
+    fin_t = np.full(len(picos), np.nan)
+    fin_t[valida_t] = _limites(desviacion, picos_t[valida_t])[1]
+
+    resultado["PR"] = (inicio_qrs - inicio_p) * ms_por_muestra
+    resultado["QT"] = (fin_t - inicio_qrs) * ms_por_muestra
+
+    # QTc de Bazett con el RR anterior a cada latido (el primero no tiene)
+    rr_anterior = np.concatenate(([np.nan], rr)) / 1000.0
+    resultado["QTc"] = resultado["QT"] / np.sqrt(rr_anterior)
+    return resultado
+
+def resumir_intervalos(intervalos):
+    """
+    Estadísticas de cada intervalo (media, mínimo, máximo, desviación y número
+    de latidos medidos), ignorando los latidos sin medida.
+
+    Args:
+        intervalos: Diccionario devuelto por medir_intervalos o un diccionario
+            {intervalo: arreglo} con los latidos de varias derivaciones
+
+    Returns:
+        Diccionario {intervalo: {"media", "min", "max", "desviacion", "n"}}
+        (valores None si no hay latidos medidos)
+    """
+    resumen = {}
+    for nombre in INTERVALOS:
+        valores = np.asarray(intervalos.get(nombre, []), np.float64)
+        valores = valores[np.isfinite(valores)]
+        if len(valores) == 0:
+            resumen[nombre] = {"media": None, "min": None, "max": None, "desviacion": None, "n": 0}
+            continue
+        resumen[nombre] = {
+            "media": round(float(np.mean(valores)), 1),
+            "min": round(float(np.min(valores)), 1),
+            "max": round(float(np.max(valores)), 1),
+            "desviacion": round(float(np.std(valores)), 1),
+            "n": int(len(valores)),
+        }
+    return resumen
+
+def resumen_global(intervalos_por_derivacion):
+    """
+    Resume los latidos de todas las derivaciones juntos.
+
+    Args:
+        intervalos_por_derivacion: Diccionario {derivación: medir_intervalos(...)}
+
+    Returns:
+        Diccionario con el mismo formato que resumir_intervalos
+    """
+    combinados = {
+        nombre: np.concatenate([intervalos[nombre] for intervalos in intervalos_por_derivacion.values()])
+        if intervalos_por_derivacion else np.empty(0)
+        for nombre in INTERVALOS
+    }
+    return resumir_intervalos(combinados)
+
+def documento_intervalos(intervalos):
+    """
+    Documento para guardar en Mongo a partir de analyze_ecg(...)["intervalos"]:
+    solo las estadísticas (global y por derivación), sin los arreglos por latido.
+    """
+    return {"global": intervalos["global"], "derivaciones": intervalos["resumen"]}
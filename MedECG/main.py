@@ -6,6 +6,7 @@ from historial import historial_medico
 from chatBot import mostrar_chatbot
 import pandas as pd
 from evolucion import evolucion_cardiaca
+from rendimientoModelos import mostrar_rendimiento_modelos
 
 # Configuración del endpoint de LM Studio
 LMSTUDIO_ENDPOINT = "http://localhost:1234/v1/chat/completions"
@@ -250,7 +251,7 @@ with st.container():
 st.divider()  # Línea divisoria para mejorar la visualización
 
 # Añade una columna adicional para la nueva sección
-col1, col2, col3, col4, col5, col6 = st.columns([1, 2, 2, 2, 2, 1])  # 6 columnas ahora
+col1, col2, col3, col4, col5, col6, col7 = st.columns([1, 2, 2, 2, 2, 2, 2])  # 7 columnas ahora
 
 with col2:
     if st.button("🏥 GESTIÓN DE PACIENTES"):
@@ -267,6 +268,9 @@ with col5:
 with col6:
     if st.button("🤖 CHATBOT"):
         st.session_state["seccion"] = "Chatbot"
+with col7:
+    if st.button("⏱️ MODELOS"):
+        st.session_state["seccion"] = "Rendimiento de Modelos"
 
 st.divider()  # Segunda línea divisoria para separar contenido
 
@@ -274,8 +278,8 @@ st.divider()  # Segunda línea divisoria para separar contenido
 # Sidebar de navegación con iconos
 seccion = st.sidebar.selectbox(
     "Navega entre secciones:",
-    ["Gestión de Pacientes", "Analizador de ECG", "Historial Médico", "Evolución Cardíaca", "Chatbot"],
-    index=["Gestión de Pacientes", "Analizador de ECG", "Historial Médico", "Evolución Cardíaca", "Chatbot"].index(
+    ["Gestión de Pacientes", "Analizador de ECG", "Historial Médico", "Evolución Cardíaca", "Chatbot", "Rendimiento de Modelos"],
+    index=["Gestión de Pacientes", "Analizador de ECG", "Historial Médico", "Evolución Cardíaca", "Chatbot", "Rendimiento de Modelos"].index(
         st.session_state.get("seccion", "Gestión de Pacientes")
     )
 )
@@ -401,6 +405,8 @@ elif st.session_state["seccion"] == "Evolución Cardíaca":
         evolucion_cardiaca(st.session_state.pacientes)  # Nueva función
 elif st.session_state["seccion"] == "Chatbot":
     mostrar_chatbot()
+elif st.session_state["seccion"] == "Rendimiento de Modelos":
+    mostrar_rendimiento_modelos()
 
 # --- Pie de página ---
 # Pie de página profesional
@@ -0,0 +1,33 @@
+"""
+Migraciones de los registros de ECG guardados con formatos anteriores.
+
+Uso:
+    python migracionesECG.py imagenes    # Imágenes en línea -> GridFS
+    python migracionesECG.py picos       # Texto de detalles de picos -> picos_ECG
+    python migracionesECG.py veredictos  # Texto de anomalías -> veredicto estructurado
+"""
+import argparse
+
+from conexion import mover_imagenes_a_gridfs
+from picosECG import completar_picos
+from veredictoECG import completar_veredictos
+
+MIGRACIONES = {
+    "imagenes": (mover_imagenes_a_gridfs, "Mueve a GridFS las imágenes guardadas dentro de los registros"),
+    "picos": (completar_picos, "Convierte el texto de detalles de picos en campos numéricos"),
+    "veredictos": (completar_veredictos, "Añade el veredicto estructurado a partir del texto de anomalías"),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones de los registros de ECG")
+    parser.add_argument(
+        "migracion", choices=list(MIGRACIONES),
+        help="; ".join(f"{nombre}: {descripcion}" for nombre, (_, descripcion) in MIGRACIONES.items())
+    )
+    args = parser.parse_args()
+
+    migrar, _ = MIGRACIONES[args.migracion]
+    print(f"Registros actualizados: {migrar()}")
+
+if __name__ == "__main__":
+    main()
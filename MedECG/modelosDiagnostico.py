@@ -0,0 +1,174 @@
+"""
+Diagnóstico de un ECG con las reglas y los modelos de LM Studio.
+
+Reúne las funciones obtener_diagnostico_* de cada modelo y el flujo completo
+(reglas → consenso o modelo elegido por enrutadorModelos) para que lo usen por
+igual la interfaz y los trabajadores de la cola de diagnósticos
+(colaDiagnosticos), sin depender de Streamlit.
+"""
+import re
+import time
+
+import numpy as np
+
+from reglasDiagnostico import diagnosticar_por_reglas
+from consensoDiagnostico import diagnosticar_consenso
+from idiomaDiagnostico import diagnostico_en_espanol
+from streamDiagnostico import consultar_diagnostico
+from cacheDiagnostico import con_cache_diagnostico
+from promptECG import PICOS, construir_prompt
+from veredictoECG import FORMATO_VEREDICTO, parsear_veredicto
+from enrutadorModelos import elegir_modelo
+
+DIAGNOSTICO_ERROR = "⚠️ Error al obtener el diagnóstico"
+
+@con_cache_diagnostico("lmstudio-v3")
+def obtener_diagnostico_lmstudio(valores_ecg, valores_por_derivacion, sexo_paciente, modelo="Meta Llama 3.1 8B"):
+    prompt = construir_prompt("lmstudio", valores_ecg, valores_por_derivacion, sexo_paciente)
+
+    data = {
+        "model": modelo,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.5,
+        "response_format": FORMATO_VEREDICTO
+    }
+
+    # Respuesta en streaming: se corta en cuanto llega el veredicto
+    resultado, tiempo_respuesta = consultar_diagnostico(data)
+
+    if resultado is not None:
+        veredicto = parsear_veredicto(resultado)
+        return (veredicto.texto if veredicto else resultado), tiempo_respuesta
+    else:
+        return DIAGNOSTICO_ERROR, tiempo_respuesta
+
+@con_cache_diagnostico("deepseek-v3")
+def obtener_diagnostico_deepseek(valores_ecg, valores_por_derivacion, sexo_paciente ,modelo="DeepSeek R1 Distill"):
+    prompt = construir_prompt("deepseek", valores_ecg, valores_por_derivacion, sexo_paciente)
+
+    data = {
+        "model": modelo,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,
+        "response_format": FORMATO_VEREDICTO
+    }
+
+    # Respuesta en streaming: se corta en cuanto llega el veredicto
+    resultado, tiempo_respuesta = consultar_diagnostico(data)
+
+    if resultado is not None:
+        veredicto = parsear_veredicto(resultado)
+        if veredicto is not None:
+            return veredicto.texto, tiempo_respuesta
+
+        # Sin JSON válido: eliminar cualquier etiqueta HTML o texto adicional
+        resultado_limpio = re.sub(r"<[^>]+>", "", resultado).strip()
+
+        # Pasar a español solo si hace falta, sin salir a la red
+        resultado_final = diagnostico_en_espanol(resultado_limpio)
+
+        return resultado_final, tiempo_respuesta
+    else:
+        return DIAGNOSTICO_ERROR, tiempo_respuesta
+
+@con_cache_diagnostico("gemma-v3")
+def obtener_diagnostico_gemma(valores_ecg, valores_por_derivacion, sexo_paciente, modelo="Gemma 3 12B"):
+    prompt = construir_prompt("gemma", valores_ecg, valores_por_derivacion, sexo_paciente)
+
+    data = {
+        "model": modelo, 
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,  # Control de la aleatoriedad de la respuesta
+        "response_format": FORMATO_VEREDICTO  # JSON restringido al esquema del veredicto
+    }
+
+    # Respuesta en streaming: se corta en cuanto llega el veredicto
+    resultado, tiempo_respuesta = consultar_diagnostico(data)
+
+    if resultado is not None:
+        veredicto = parsear_veredicto(resultado)
+        if veredicto is not None:
+            return veredicto.texto, tiempo_respuesta
+
+        # Sin JSON válido: limpiar cualquier posible etiqueta HTML y traducir la respuesta si no está en español
+        resultado_limpio = re.sub(r"<[^>]+>", "", resultado).strip()
+
+        return resultado_limpio, tiempo_respuesta
+    else:
+        return DIAGNOSTICO_ERROR, tiempo_respuesta
+
+# Modelos que participan en el diagnóstico por consenso (peso de su voto)
+PARTICIPANTES_CONSENSO = [
+    {"nombre": "Llama", "funcion": obtener_diagnostico_lmstudio, "modelo": "Meta Llama 3.1 8B", "peso": 1.0},
+    {"nombre": "DeepSeek", "funcion": obtener_diagnostico_deepseek, "modelo": "DeepSeek R1 Distill", "peso": 1.0},
+    {"nombre": "Gemma", "funcion": obtener_diagnostico_gemma, "modelo": "Gemma 3 12B", "peso": 1.0},
+]
+
+# Modelos entre los que elige el enrutador cuando no se usa el consenso
+# (tamaño en miles de millones de parámetros; DeepSeek R1 razona antes de
+# responder y queda fuera por su latencia)
+MODELOS_ENRUTADOR = [
+    {"modelo": "Gemma 3 12B", "funcion": obtener_diagnostico_gemma, "tamano_b": 12},
+    {"modelo": "Meta Llama 3.1 8B", "funcion": obtener_diagnostico_lmstudio, "tamano_b": 8},
+]
+
+def valores_consolidados(valores_ecg):
+    """
+    Promedio de cada pico sobre las derivaciones, para el diagnóstico general.
+    """
+    return {pico: float(np.mean([valores[pico] for valores in valores_ecg.values()])) for pico in PICOS}
+
+def diagnosticar_ecg(valores_ecg, sexo_paciente, usar_consenso=False, modelo=None):
+    """
+    Diagnóstico completo: los casos claros (la mayoría, ECG normales) se
+    resuelven con las reglas en milisegundos; solo los ambiguos se consultan
+    al consenso de modelos o al modelo que elija el enrutador.
+
+    Args:
+        valores_ecg: Diccionario {derivación: {pico: valor}}
+        sexo_paciente: Sexo del paciente
+        usar_consenso: True para consultar a PARTICIPANTES_CONSENSO en paralelo
+        modelo: Modelo de MODELOS_ENRUTADOR que se usa siempre (None = lo elige el enrutador)
+
+    Returns:
+        Diccionario con:
+            "diagnostico": texto del diagnóstico
+            "tiempo": segundos empleados
+            "regla": regla que respondió (None si se consultó a los modelos)
+            "consenso": resultado de diagnosticar_consenso (None si no se usó)
+            "modelo": modelo consultado sin consenso y "motivo_modelo" de la elección
+            "picos_anormales": picos anormales usados por las reglas
+    """
+    tiempo_inicio = time.time()
+    resultado_reglas = diagnosticar_por_reglas(valores_ecg)
+    diagnostico = resultado_reglas["diagnostico"]
+    tiempo = time.time() - tiempo_inicio
+
+    consenso = None
+    eleccion = None
+    if diagnostico is None and usar_consenso:
+        consenso = diagnosticar_consenso(
+            PARTICIPANTES_CONSENSO, valores_consolidados(valores_ecg), valores_ecg, sexo_paciente
+        )
+        diagnostico = consenso["diagnostico"] or DIAGNOSTICO_ERROR
+        tiempo = consenso["tiempo"]
+    elif diagnostico is None:
+        if modelo is None:
+            eleccion = elegir_modelo(MODELOS_ENRUTADOR, resultado_reglas["picos_anormales"])
+        else:
+            candidato = next(c for c in MODELOS_ENRUTADOR if c["modelo"] == modelo)
+            eleccion = {"candidato": candidato, "motivo": "modelo fijado"}
+        candidato = eleccion["candidato"]
+        diagnostico, tiempo = candidato["funcion"](
+            valores_consolidados(valores_ecg), valores_ecg, sexo_paciente, candidato["modelo"]
+        )
+
+    return {
+        "diagnostico": diagnostico,
+        "tiempo": tiempo,
+        "regla": resultado_reglas["regla"],
+        "consenso": consenso,
+        "modelo": eleccion["candidato"]["modelo"] if eleccion else None,
+        "motivo_modelo": eleccion["motivo"] if eleccion else None,
+        "picos_anormales": resultado_reglas["picos_anormales"],
+    }
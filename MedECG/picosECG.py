@@ -0,0 +1,207 @@
+"""
+Rangos normales de los picos del ECG y detección de valores anormales.
+
+Este módulo no depende de Streamlit para poder usarse tanto desde la interfaz
+como desde el análisis por lotes.
+
+Los registros guardan los picos como campos numéricos ("picos_ECG", ver
+documento_picos): una entrada por derivación y pico con su valor y la marca de
+anormal. El texto de detalles solo se genera al mostrarlo. Los registros
+anteriores guardaban el texto en "detalles_picos_del_ECG"; picos_de_texto lo
+convierte y completar_picos migra los registros.
+
+Uso (convertir los registros anteriores):
+    python migracionesECG.py picos
+"""
+import re
+
+RANGOS_NORMALES = {
+    'Pico P': {'min': 0.05, 'max': 0.25, 'unidad': 'mV'},
+    'Pico QRS': {'min': 0.6, 'max': 1.2, 'unidad': 'mV'},
+    'Pico T': {'min': 0.1, 'max': 0.5, 'unidad': 'mV'},
+    'Pico U': {'min': 0.0, 'max': 0.2, 'unidad': 'mV'}
+}
+
+def rango_normal_texto(pico):
+    rango = RANGOS_NORMALES[pico]
+    return f"{rango['min']}-{rango['max']} {rango['unidad']}"
+
+def _desviacion(pico, valor):
+    """
+    Desviación respecto al rango normal y su dirección ('↑' por encima del
+    máximo, '↓' por debajo del mínimo, None si está dentro del rango).
+    """
+    rango = RANGOS_NORMALES[pico]
+    if valor > rango['max']:
+        return valor - rango['max'], '↑'
+    if valor < rango['min']:
+        return rango['min'] - valor, '↓'
+    return 0.0, None
+
+def obtener_picos_anormales(valores_ecg):
+    picos_anormales = {}
+
+    for lead, valores in valores_ecg.items():
+        for pico, valor in valores.items():
+            desviacion, direccion = _desviacion(pico, valor)
+            if direccion is not None:
+                if pico not in picos_anormales:
+                    picos_anormales[pico] = {
+                        'derivaciones': [],
+                        'rango_normal': rango_normal_texto(pico)
+                    }
+
+                picos_anormales[pico]['derivaciones'].append({
+                    'derivacion': lead,
+                    'valor': valor,
+                    'desviacion': f"{desviacion:.3f}",
+                    'direccion': direccion,
+                    'unidad': RANGOS_NORMALES[pico]['unidad']
+                })
+
+    return picos_anormales
+
+def documento_picos(valores_ecg):
+    """
+    Valores de todos los picos de cada derivación para guardar en "picos_ECG".
+
+    Args:
+        valores_ecg: Diccionario {derivación: {pico: valor}}
+
+    Returns:
+        Lista de {"derivacion", "pico", "valor", "unidad", "anormal",
+        "direccion", "desviacion"} (direccion None si el valor es normal)
+    """
+    picos = []
+    for lead, valores in valores_ecg.items():
+        for pico, valor in valores.items():
+            desviacion, direccion = _desviacion(pico, float(valor))
+            picos.append({
+                'derivacion': lead,
+                'pico': pico,
+                'valor': float(valor),
+                'unidad': RANGOS_NORMALES[pico]['unidad'],
+                'anormal': direccion is not None,
+                'direccion': direccion,
+                'desviacion': round(desviacion, 3),
+            })
+    return picos
+
+def picos_anormales_de_documento(picos):
+    """
+    Picos anormales de "picos_ECG" en el formato de obtener_picos_anormales.
+    """
+    picos_anormales = {}
+    for entrada in picos:
+        if not entrada['anormal']:
+            continue
+        pico = entrada['pico']
+        if pico not in picos_anormales:
+            picos_anormales[pico] = {
+                'derivaciones': [],
+                'rango_normal': rango_normal_texto(pico) if pico in RANGOS_NORMALES else entrada.get('rango_normal', '')
+            }
+        picos_anormales[pico]['derivaciones'].append({
+            'derivacion': entrada['derivacion'],
+            'valor': entrada['valor'],
+            'desviacion': f"{entrada['desviacion']:.3f}",
+            'direccion': entrada['direccion'],
+            'unidad': entrada['unidad']
+        })
+    return picos_anormales
+
+# Texto de los registros anteriores: "🔴 **Pico P** - ..." seguido de bloques
+# "**Derivación I:** - Valor Extraido: `0.3 mV` - Rango normal: `...` - Desviación: `0.05 mV` ↑"
+_PATRON_ENCABEZADO = re.compile(r"\*\*([^*]+)\*\*")
+_PATRON_DERIVACION = re.compile(
+    r"Derivaci[oó]n\s+([^:*]+?):.*?`\s*([-+\d.eE]+)\s*([^`\s]*)\s*`"
+    r".*?Rango normal:\s*`([^`]*)`.*?Desviaci[oó]n:\s*`\s*([-+\d.eE]+)[^`]*`",
+    re.S
+)
+
+def picos_de_texto(detalles_picos):
+    """
+    Convierte el texto "detalles_picos_del_ECG" de los registros anteriores en
+    entradas de "picos_ECG". El texto solo contenía las derivaciones anormales,
+    así que solo se recuperan esas.
+
+    Returns:
+        Lista de entradas (vacía si no había picos anormales) o None si el texto
+        no tiene el formato esperado
+    """
+    if not detalles_picos or "No se detectaron" in detalles_picos:
+        return []
+
+    picos = []
+    for seccion in detalles_picos.split('🔴')[1:]:
+        derivaciones = _PATRON_DERIVACION.findall(seccion)
+        encabezado = _PATRON_ENCABEZADO.search(seccion)
+        if not derivaciones:
+            # Título "🔴 Detalles de Picos Anormales" de algunos formatos
+            continue
+        if encabezado is None:
+            return None
+        pico = encabezado.group(1).strip()
+        for derivacion, valor, unidad, rango, desviacion in derivaciones:
+            valor = float(valor)
+            if pico in RANGOS_NORMALES:
+                _, direccion = _desviacion(pico, valor)
+                unidad = RANGOS_NORMALES[pico]['unidad']
+            else:
+                # Intervalos de formatos antiguos: la dirección solo está en el texto
+                direccion = '↓' if float(desviacion) < 0 else '↑'
+            entrada = {
+                'derivacion': derivacion.strip(),
+                'pico': pico,
+                'valor': valor,
+                'unidad': unidad,
+                'anormal': True,
+                'direccion': direccion,
+                'desviacion': round(abs(float(desviacion)), 3),
+            }
+            if pico not in RANGOS_NORMALES:
+                entrada['rango_normal'] = rango
+            picos.append(entrada)
+    return picos if picos else None
+
+def picos_de_registro(ecg):
+    """
+    Picos de un registro de Registros_ECG: "picos_ECG" si existe o, en los
+    registros sin migrar, el texto de "detalles_picos_del_ECG".
+    """
+    if ecg.get('picos_ECG') is not None:
+        return ecg['picos_ECG']
+    return picos_de_texto(ecg.get('detalles_picos_del_ECG')) or []
+
+def completar_picos():
+    """
+    Convierte a "picos_ECG" el texto de detalles de los registros anteriores y
+    elimina el texto. Los registros cuyo texto no se reconoce no se modifican.
+
+    Returns:
+        Número de registros actualizados
+    """
+    # Solo el script se conecta a la base de datos
+    from pymongo import UpdateOne
+    from conexion import collection_ecg
+
+    operaciones = []
+    actualizados = 0
+    pendientes = collection_ecg.find(
+        {"picos_ECG": {"$exists": False}, "detalles_picos_del_ECG": {"$exists": True}},
+        {"detalles_picos_del_ECG": 1}
+    )
+    for ecg in pendientes:
+        picos = picos_de_texto(ecg.get("detalles_picos_del_ECG"))
+        if picos is None:
+            continue
+        operaciones.append(UpdateOne(
+            {"_id": ecg["_id"]},
+            {"$set": {"picos_ECG": picos}, "$unset": {"detalles_picos_del_ECG": ""}}
+        ))
+        if len(operaciones) >= 1000:
+            actualizados += collection_ecg.bulk_write(operaciones, ordered=False).modified_count
+            operaciones = []
+    if operaciones:
+        actualizados += collection_ecg.bulk_write(operaciones, ordered=False).modified_count
+    return actualizados
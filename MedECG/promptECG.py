@@ -0,0 +1,189 @@
+"""
+Construcción compacta de los prompts de diagnóstico.
+
+En lugar de un bloque de varias líneas con sangría por cada una de las 12
+derivaciones, los promedios van en una sola línea y solo las derivaciones con
+algún pico fuera de rango (obtener_picos_anormales) se envían completas, como
+filas de una tabla; el resto se enumera por nombre. El tiempo de procesamiento
+del prompt en el modelo local crece con su longitud, así que esto reduce el
+tiempo hasta el primer token.
+
+Uso (informe de tokens por plantilla):
+    python promptECG.py
+"""
+from picosECG import RANGOS_NORMALES, obtener_picos_anormales
+
+PICOS = ("Pico P", "Pico QRS", "Pico T", "Pico U")
+
+# La respuesta se restringe con veredictoECG.FORMATO_VEREDICTO; el prompt solo la describe
+FORMATO_RESPUESTA = (
+    '{"normal": true, "diagnostico": "Ninguno"} si todo está en rango\n'
+    '{"normal": false, "diagnostico": "<DIAGNÓSTICO>"} si hay anomalías'
+)
+
+REGLAS_DIAGNOSTICO = (
+    "QRS → Hipertrofia ventricular; T → Onda T invertida; "
+    "P → Arritmia cardiaca; U → Alteración en la repolarización"
+)
+
+PLANTILLAS = {
+    "lmstudio": (
+        "Analiza los valores de ECG de un paciente {sexo}.\n"
+        "{valores}\n"
+        "Rangos normales (mV): {rangos}\n"
+        "Reglas:\n"
+        "1. Todos los valores en rango → ECG normal\n"
+        "2. Con anomalías, escoge UN diagnóstico: {reglas}\n"
+        "Responde SOLO con un objeto JSON, sin explicaciones:\n"
+        "{formato}"
+    ),
+    "deepseek": (
+        "Evalúa estos valores de ECG de un {sexo}.\n"
+        "{valores}\n"
+        "Rangos normales (mV): {rangos}\n"
+        "Diagnósticos: {reglas}\n"
+        "Prioridad: QRS → T → P → U.\n"
+        "Responde SOLO con un objeto JSON, sin texto extra:\n"
+        "{formato}"
+    ),
+    "gemma": (
+        "Evalúa los valores de ECG de un paciente {sexo} (promedios y derivaciones) y determina si hay anomalías.\n"
+        "{valores}\n"
+        "Rangos normales (mV): {rangos}\n"
+        "Si hay anomalías, da UN SOLO diagnóstico general, el más significativo: {reglas}\n"
+        "No menciones derivaciones ni des explicaciones. Responde solo con un objeto JSON:\n"
+        "{formato}"
+    ),
+}
+
+def _numero(valor):
+    return f"{round(float(valor), 3):g}"
+
+def _nombre_corto(pico):
+    return pico.replace("Pico ", "")
+
+def texto_rangos():
+    """
+    Rangos normales en una línea: "P 0.05-0.25 | QRS 0.6-1.2 | ...".
+    """
+    return " | ".join(
+        f"{_nombre_corto(pico)} {_numero(rango['min'])}-{_numero(rango['max'])}"
+        for pico, rango in RANGOS_NORMALES.items()
+    )
+
+def tabla_derivaciones(valores_por_derivacion, derivaciones=None):
+    """
+    Tabla compacta "Der|P|QRS|T|U" con una fila por derivación.
+
+    Args:
+        valores_por_derivacion: Diccionario {derivación: {pico: valor}}
+        derivaciones: Derivaciones a incluir (por defecto todas)
+    """
+    derivaciones = list(valores_por_derivacion) if derivaciones is None else derivaciones
+    filas = ["Der|" + "|".join(_nombre_corto(pico) for pico in PICOS)]
+    for lead in derivaciones:
+        valores = valores_por_derivacion[lead]
+        filas.append(f"{lead}|" + "|".join(_numero(valores[pico]) for pico in PICOS))
+    return "\n".join(filas)
+
+def seccion_valores(valores_ecg, valores_por_derivacion, picos_anormales=None):
+    """
+    Promedios en una línea y las derivaciones fuera de rango como tabla.
+    """
+    if picos_anormales is None:
+        picos_anormales = obtener_picos_anormales(valores_por_derivacion)
+
+    anormales = {
+        d['derivacion'] for datos in picos_anormales.values() for d in datos['derivaciones']
+    }
+    fuera = [lead for lead in valores_por_derivacion if lead in anormales]
+    dentro = [lead for lead in valores_por_derivacion if lead not in anormales]
+
+    lineas = ["Promedios (mV): " + " ".join(f"{_nombre_corto(p)}={_numero(valores_ecg[p])}" for p in PICOS)]
+    if fuera:
+        lineas.append("Derivaciones con valores fuera de rango (mV):")
+        lineas.append(tabla_derivaciones(valores_por_derivacion, fuera))
+        if dentro:
+            lineas.append(f"Dentro de rango: {', '.join(dentro)}")
+    else:
+        lineas.append(f"Todas las derivaciones dentro de rango ({', '.join(dentro)}).")
+    return "\n".join(lineas)
+
+def construir_prompt(plantilla, valores_ecg, valores_por_derivacion, sexo_paciente, picos_anormales=None):
+    """
+    Prompt compacto de diagnóstico.
+
+    Args:
+        plantilla: Clave de PLANTILLAS ("lmstudio", "deepseek" o "gemma")
+        valores_ecg: Valores promedio de los picos
+        valores_por_derivacion: Diccionario {derivación: {pico: valor}}
+        sexo_paciente: Sexo del paciente
+        picos_anormales: Resultado de obtener_picos_anormales (se calcula si es None)
+
+    Returns:
+        Texto del prompt
+    """
+    return PLANTILLAS[plantilla].format(
+        sexo=sexo_paciente,
+        valores=seccion_valores(valores_ecg, valores_por_derivacion, picos_anormales),
+        rangos=texto_rangos(),
+        reglas=REGLAS_DIAGNOSTICO,
+        formato=FORMATO_RESPUESTA,
+    )
+
+def estimar_tokens(texto):
+    """
+    Estimación del número de tokens sin cargar el tokenizador del modelo:
+    los tokenizadores BPE usan de media unos 3.5 caracteres por token en
+    español, y los espacios de sangría cuentan igual que el texto.
+    """
+    return max(1, round(len(texto) / 3.5))
+
+def informe_tokens(valores_ecg, valores_por_derivacion, sexo_paciente):
+    """
+    Tokens estimados y caracteres del prompt de cada plantilla.
+
+    Returns:
+        Diccionario {plantilla: {"caracteres", "tokens"}}
+    """
+    picos_anormales = obtener_picos_anormales(valores_por_derivacion)
+    informe = {}
+    for plantilla in PLANTILLAS:
+        prompt = construir_prompt(plantilla, valores_ecg, valores_por_derivacion, sexo_paciente, picos_anormales)
+        informe[plantilla] = {"caracteres": len(prompt), "tokens": estimar_tokens(prompt)}
+    return informe
+
+def _bloque_por_derivacion(valores_por_derivacion):
+    """
+    Formato anterior (un bloque con sangría por derivación), solo para comparar.
+    """
+    bloque = ""
+    for lead, valores in valores_por_derivacion.items():
+        bloque += f"""
+        Derivación {lead}:
+        - Pico P: {valores['Pico P']} mV
+        - Pico QRS: {valores['Pico QRS']} mV
+        - Pico T: {valores['Pico T']} mV
+        - Pico U: {valores['Pico U']} mV
+        """
+    return bloque
+
+def main():
+    derivaciones = ["I", "II", "III", "aVR", "aVL", "aVF", "V1", "V2", "V3", "V4", "V5", "V6"]
+    valores_por_derivacion = {
+        lead: {"Pico P": 0.12, "Pico QRS": 0.95, "Pico T": 0.31, "Pico U": 0.05} for lead in derivaciones
+    }
+    valores_por_derivacion["V1"]["Pico QRS"] = 1.35
+    valores_por_derivacion["V2"]["Pico QRS"] = 1.28
+    valores_ecg = {
+        pico: sum(v[pico] for v in valores_por_derivacion.values()) / len(derivaciones) for pico in PICOS
+    }
+
+    anterior = estimar_tokens(_bloque_por_derivacion(valores_por_derivacion))
+    print(f"Bloque de derivaciones anterior: ~{anterior} tokens")
+    print(f"{'Plantilla':<10} {'Caracteres':>10} {'Tokens':>7}")
+    for plantilla, datos in informe_tokens(valores_ecg, valores_por_derivacion, "masculino").items():
+        print(f"{plantilla:<10} {datos['caracteres']:>10} {datos['tokens']:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Diagnóstico rápido por reglas, sin consultar al modelo de lenguaje.
+
+Las reglas se evalúan en orden sobre los picos anormales de picosECG. Cada una
+devuelve un diagnóstico con el formato exacto que piden los prompts
+("✅ Sin Anomalías - ECG Normal" o "⚠️ ECG Anormal - [DIAGNÓSTICO]"), o None
+si el caso no le corresponde. Si ninguna regla responde, el caso es ambiguo y
+se escala al modelo.
+
+Se pueden añadir reglas con el decorador registrar_regla.
+"""
+import os
+
+from picosECG import obtener_picos_anormales
+
+DIAGNOSTICO_NORMAL = "✅ Sin Anomalías - ECG Normal"
+
+# Diagnóstico fijo de cada pico y dirección de la anomalía que lo justifica
+# (las mismas reglas que se dan al modelo en el prompt)
+DIAGNOSTICOS_POR_PICO = {
+    'Pico QRS': {'direccion': '↑', 'diagnostico': "Hipertrofia ventricular"},
+    'Pico T': {'direccion': '↑', 'diagnostico': "Onda T invertida"},
+    'Pico P': {'direccion': None, 'diagnostico': "Arritmia cardiaca"},
+    'Pico U': {'direccion': '↑', 'diagnostico': "Alteración en la repolarización"},
+}
+
+# Derivaciones anormales necesarias para considerar clara una anomalía aislada;
+# una sola derivación fuera de rango puede ser un error de extracción
+MIN_DERIVACIONES_CLARAS = int(os.getenv("REGLAS_MIN_DERIVACIONES", "2"))
+
+_reglas = []
+
+def registrar_regla(regla):
+    """
+    Registra una regla al final de la lista. La regla recibe (valores_ecg,
+    picos_anormales) y devuelve el texto del diagnóstico o None.
+    """
+    _reglas.append(regla)
+    return regla
+
+def diagnostico_anormal(diagnostico):
+    return f"⚠️ ECG Anormal - {diagnostico}"
+
+@registrar_regla
+def regla_ecg_normal(valores_ecg, picos_anormales):
+    """
+    Todas las derivaciones dentro de rango.
+    """
+    if not picos_anormales:
+        return DIAGNOSTICO_NORMAL
+    return None
+
+@registrar_regla
+def regla_anomalia_aislada(valores_ecg, picos_anormales):
+    """
+    Un único pico fuera de rango, en varias derivaciones y siempre en la
+    dirección que corresponde a su diagnóstico fijo.
+    """
+    if len(picos_anormales) != 1:
+        return None
+
+    pico, datos = next(iter(picos_anormales.items()))
+    regla = DIAGNOSTICOS_POR_PICO.get(pico)
+    if regla is None or len(datos['derivaciones']) < MIN_DERIVACIONES_CLARAS:
+        return None
+
+    direcciones = {d['direccion'] for d in datos['derivaciones']}
+    if len(direcciones) != 1:
+        return None
+    if regla['direccion'] is not None and direcciones != {regla['direccion']}:
+        return None
+
+    return diagnostico_anormal(regla['diagnostico'])
+
+def diagnosticar_por_reglas(valores_ecg, picos_anormales=None):
+    """
+    Aplica las reglas registradas a los valores del ECG.
+
+    Args:
+        valores_ecg: Diccionario {derivación: {pico: valor}}
+        picos_anormales: Resultado de obtener_picos_anormales (se calcula si es None)
+
+    Returns:
+        Diccionario con:
+            "diagnostico": texto del diagnóstico o None si hay que consultar al modelo
+            "regla": nombre de la regla que respondió (None si ninguna)
+            "picos_anormales": picos anormales usados
+    """
+    if picos_anormales is None:
+        picos_anormales = obtener_picos_anormales(valores_ecg)
+
+    for regla in _reglas:
+        diagnostico = regla(valores_ecg, picos_anormales)
+        if diagnostico is not None:
+            return {"diagnostico": diagnostico, "regla": regla.__name__, "picos_anormales": picos_anormales}
+
+    return {"diagnostico": None, "regla": None, "picos_anormales": picos_anormales}
@@ -0,0 +1,314 @@
+"""
+Detección automática de la rejilla de derivaciones (4 filas x 3 columnas) en imágenes de ECG.
+
+La disposición se calcula a partir de las proyecciones de tinta por fila y por
+columna: los cortes entre filas se colocan en los huecos sin tinta y los cortes
+entre columnas en las marcas separadoras, siempre cerca de la posición nominal.
+Una marca solo se acepta si es estrecha, única en su zona de búsqueda y aparece
+a la misma altura en varias filas (un complejo QRS cumple lo primero pero se
+repite con cada latido); si no, se conserva el corte nominal. Como la
+disposición depende del equipo o de la plantilla de impresión y no del paciente, se guarda en caché por huella de
+plantilla (en memoria y, opcionalmente, en ECG_PLANTILLAS_ARCHIVO) y los
+siguientes ECG del mismo equipo solo la confirman con una pasada por la imagen
+(la detección necesita dos) antes de la extracción. La huella es aproximada y
+dos equipos pueden compartirla: si la disposición guardada no encaja en la
+página, se vuelve a detectar.
+
+Las disposiciones se guardan como fracciones del alto y ancho de la imagen para
+que sirvan con cualquier nivel de resolución.
+"""
+import json
+import os
+import threading
+from functools import partial
+
+import numpy as np
+
+ARCHIVO_PLANTILLAS = os.getenv("ECG_PLANTILLAS_ARCHIVO")
+
+# Umbral de tinta sobre la escala de grises (equivale al umbral de extraer.binarize)
+UMBRAL_TINTA = 205
+
+# Ancho máximo de una marca separadora, como fracción del ancho de la imagen (~1 mm en A4)
+ANCHO_MARCA = 1 / 300
+
+# Diferencia máxima entre los cortes de una disposición en caché y los de la
+# página para reutilizarla, como fracción del alto o ancho
+TOLERANCIA_PLANTILLA = 1 / 100
+
+_plantillas = {}
+_cargadas = False
+_lock = threading.Lock()
+
+def _cargar_plantillas():
+    global _cargadas
+    if _cargadas:
+        return
+    _cargadas = True
+    if ARCHIVO_PLANTILLAS and os.path.exists(ARCHIVO_PLANTILLAS):
+        try:
+            with open(ARCHIVO_PLANTILLAS, encoding="utf-8") as archivo:
+                _plantillas.update(json.load(archivo))
+        except (OSError, ValueError):
+            pass
+
+def _guardar_plantillas():
+    if not ARCHIVO_PLANTILLAS:
+        return
+    try:
+        temporal = f"{ARCHIVO_PLANTILLAS}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(_plantillas, archivo, indent=2)
+        os.replace(temporal, ARCHIVO_PLANTILLAS)
+    except OSError:
+        pass
+
+def _mascara_tinta(bloque, binaria):
+    return bloque > 0 if binaria else bloque < UMBRAL_TINTA
+
+def proyecciones_tinta(imagen, binaria=True, alto_franja=512):
+    """
+    Cuenta los píxeles de tinta por fila y por columna, por franjas para no
+    crear una máscara del tamaño de la imagen completa.
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises (puede ser un np.memmap)
+        binaria: True si la imagen ya está binarizada, False si es escala de grises
+        alto_franja: Filas procesadas a la vez
+
+    Returns:
+        Tupla (tinta por fila, tinta por columna)
+    """
+    height, width = imagen.shape
+    filas = np.zeros(height, np.int64)
+    columnas = np.zeros(width, np.int64)
+    for y in range(0, height, alto_franja):
+        mascara = _mascara_tinta(imagen[y:y + alto_franja], binaria)
+        filas[y:y + alto_franja] = np.count_nonzero(mascara, axis=1)
+        columnas += np.count_nonzero(mascara, axis=0)
+    return filas, columnas
+
+def columnas_por_fila(imagen, cortes_filas, binaria=True, alto_franja=512):
+    """
+    Cuenta los píxeles de tinta por columna dentro de cada fila de derivaciones.
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises (puede ser un np.memmap)
+        cortes_filas: Cortes entre filas como fracciones del alto
+        binaria: True si la imagen ya está binarizada, False si es escala de grises
+        alto_franja: Filas procesadas a la vez
+
+    Returns:
+        Arreglo (filas de derivaciones x ancho) con la tinta por columna
+    """
+    height, width = imagen.shape
+    limites = [int(round(corte * height)) for corte in cortes_filas]
+    columnas = np.zeros((len(limites) - 1, width), np.int64)
+    for fila, (top, bottom) in enumerate(zip(limites[:-1], limites[1:])):
+        for y in range(top, bottom, alto_franja):
+            mascara = _mascara_tinta(imagen[y:min(y + alto_franja, bottom)], binaria)
+            columnas[fila] += np.count_nonzero(mascara, axis=0)
+    return columnas
+
+def _suavizar(proyeccion, ventana):
+    ventana = max(1, ventana)
+    return np.convolve(proyeccion, np.ones(ventana) / ventana, mode="same")
+
+def _centro_hueco(ventana):
+    """
+    Índice central del tramo continuo más largo con tinta mínima dentro de la
+    ventana, o None si la ventana no tiene un hueco claro.
+    """
+    minimo, maximo = ventana.min(), ventana.max()
+    if maximo == 0 or minimo > 0.5 * np.median(ventana):
+        return None
+    bajos = ventana <= minimo + 0.05 * (maximo - minimo)
+    # Inicios y finales de los tramos de valores bajos
+    bordes = np.diff(np.concatenate(([0], bajos.astype(np.int8), [0])))
+    inicios, finales = np.flatnonzero(bordes == 1), np.flatnonzero(bordes == -1)
+    mas_largo = np.argmax(finales - inicios)
+    return (inicios[mas_largo] + finales[mas_largo] - 1) // 2
+
+def _pico_aislado(ventana, ancho_max):
+    """
+    Índice de la columna con mucha más tinta que sus vecinas si forma un pico
+    estrecho (como mucho ancho_max columnas) y no hay otro comparable (al menos
+    3/4 de su altura sobre la mediana) en la ventana; None en caso contrario.
+    """
+    pico = int(np.argmax(ventana))
+    mediana = np.median(ventana)
+    if ventana[pico] <= 2 * max(mediana, 1):
+        return None
+
+    altos = ventana > mediana + 0.75 * (ventana[pico] - mediana)
+    inicio, fin = pico, pico + 1
+    while inicio > 0 and altos[inicio - 1]:
+        inicio -= 1
+    while fin < len(altos) and altos[fin]:
+        fin += 1
+    if fin - inicio > ancho_max:
+        return None
+
+    # Un QRS se repite con cada latido dentro de la ventana; la marca no
+    altos[max(0, inicio - ancho_max):fin + ancho_max] = False
+    return None if altos.any() else pico
+
+def _marca_separadora(ventanas, ancho_max):
+    """
+    Índice de la marca vertical que separa dos derivaciones: un pico aislado y
+    estrecho en la misma columna de la mayoría de las filas, o None si no hay
+    una marca clara.
+
+    Args:
+        ventanas: Tinta por columna de cada fila (filas x ancho de la ventana)
+        ancho_max: Ancho máximo de la marca en columnas
+    """
+    picos = [p for p in (_pico_aislado(ventana, ancho_max) for ventana in ventanas) if p is not None]
+    if len(picos) < max(2, len(ventanas) - 1):
+        return None
+
+    centro = int(np.median(picos))
+    coinciden = sum(abs(p - centro) <= ancho_max for p in picos)
+    return centro if coinciden >= max(2, len(ventanas) - 1) else None
+
+def _cortes(proyeccion, partes, fraccion_busqueda, buscar):
+    """
+    Coloca los cortes internos buscando alrededor de cada posición nominal con
+    la función buscar; si no encuentra nada claro, conserva la posición nominal.
+    La proyección puede tener varias filas (una por fila de derivaciones): se
+    busca sobre su último eje.
+    """
+    n = proyeccion.shape[-1]
+    radio = max(1, int(n * fraccion_busqueda))
+    cortes = [0.0]
+    for k in range(1, partes):
+        nominal = int(round(k * n / partes))
+        inicio, fin = max(1, nominal - radio), min(n - 1, nominal + radio)
+        posicion = buscar(proyeccion[..., inicio:fin])
+        cortes.append(float(inicio + posicion) / n if posicion is not None else k / partes)
+    cortes.append(1.0)
+    return cortes
+
+def _cortes_filas(filas):
+    return _cortes(_suavizar(filas.astype(np.float64), len(filas) // 50), 4, 1 / 8, _centro_hueco)
+
+def confirmar_disposicion(imagen, disposicion, binaria=True):
+    """
+    Comprueba, con una sola pasada por la imagen, que una disposición guardada
+    sirve para esta página: los cortes entre filas deben caer en los mismos
+    huecos y los cortes entre columnas, en las mismas marcas (buscadas en la
+    tinta por columna de toda la página) o en la posición nominal si la página
+    no tiene marcas.
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises
+        disposicion: Diccionario {"filas": 5 fracciones, "columnas": 4 fracciones}
+        binaria: True si la imagen ya está binarizada
+
+    Returns:
+        True si la disposición encaja en la página
+    """
+    filas, columnas = proyecciones_tinta(imagen, binaria)
+    ancho_max = max(2, int(round(len(columnas) * ANCHO_MARCA)))
+    cortes = {
+        "filas": _cortes_filas(filas),
+        "columnas": _cortes(columnas, 3, 1 / 12, partial(_pico_aislado, ancho_max=ancho_max)),
+    }
+    return all(
+        abs(corte - guardado) <= TOLERANCIA_PLANTILLA
+        for eje in ("filas", "columnas")
+        for corte, guardado in zip(cortes[eje], disposicion[eje])
+    )
+
+def detectar_rejilla(imagen, binaria=True):
+    """
+    Detecta los cortes entre filas y columnas de derivaciones.
+
+    Las filas de trazos están separadas por franjas sin tinta, así que el corte
+    va en el centro del hueco. Las derivaciones de una misma fila son tramos
+    consecutivos del mismo trazo, separados solo por una marca vertical, así que
+    el corte entre columnas va en esa marca si se repite en la mayoría de las filas.
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises
+        binaria: True si la imagen ya está binarizada
+
+    Returns:
+        Diccionario {"filas": 5 fracciones, "columnas": 4 fracciones}
+    """
+    filas, _ = proyecciones_tinta(imagen, binaria)
+    cortes_filas = _cortes_filas(filas)
+    columnas = columnas_por_fila(imagen, cortes_filas, binaria)
+    ancho_max = max(2, int(round(columnas.shape[1] * ANCHO_MARCA)))
+    return {
+        "filas": cortes_filas,
+        "columnas": _cortes(columnas, 3, 1 / 12, partial(_marca_separadora, ancho_max=ancho_max)),
+    }
+
+def huella_plantilla(imagen, binaria=True, paso=8):
+    """
+    Huella barata de la plantilla de impresión: proporción de la imagen y caja
+    que contiene la tinta (márgenes del equipo), medidas sobre una submuestra.
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises
+        binaria: True si la imagen ya está binarizada
+        paso: Paso de la submuestra (1 de cada paso x paso píxeles)
+
+    Returns:
+        Cadena que identifica la plantilla
+    """
+    height, width = imagen.shape
+    mascara = _mascara_tinta(np.asarray(imagen[::paso, ::paso]), binaria)
+    filas = np.flatnonzero(mascara.any(axis=1))
+    columnas = np.flatnonzero(mascara.any(axis=0))
+    if len(filas) == 0 or len(columnas) == 0:
+        caja = (0, 0, 0, 0)
+    else:
+        alto_sub, ancho_sub = mascara.shape
+        # Caja de tinta en porcentaje de la imagen (redondeada al 2 % para tolerar ruido)
+        caja = tuple(
+            int(round(100 * valor / total / 2)) * 2
+            for valor, total in (
+                (filas[0], alto_sub), (filas[-1], alto_sub),
+                (columnas[0], ancho_sub), (columnas[-1], ancho_sub),
+            )
+        )
+    return f"{width / height:.2f}:{'-'.join(map(str, caja))}"
+
+def obtener_disposicion(imagen, binaria=True, plantilla=None):
+    """
+    Devuelve la disposición de derivaciones de la imagen, detectándola solo la
+    primera vez que aparece su plantilla o cuando la guardada no encaja en la
+    página (confirmar_disposicion).
+
+    Args:
+        imagen: Imagen binarizada o en escala de grises
+        binaria: True si la imagen ya está binarizada
+        plantilla: Identificador explícito de la plantilla o equipo; si es None
+            se usa huella_plantilla
+
+    Returns:
+        Diccionario {"filas": 5 fracciones, "columnas": 4 fracciones}
+    """
+    clave = plantilla or huella_plantilla(imagen, binaria)
+    with _lock:
+        _cargar_plantillas()
+        guardada = _plantillas.get(clave)
+    if guardada is not None and confirmar_disposicion(imagen, guardada, binaria):
+        return guardada
+
+    disposicion = detectar_rejilla(imagen, binaria)
+    with _lock:
+        _plantillas[clave] = disposicion
+        _guardar_plantillas()
+    return disposicion
+
+def limpiar_plantillas():
+    """
+    Olvida las disposiciones guardadas en memoria (el archivo no se modifica).
+    """
+    global _cargadas
+    with _lock:
+        _plantillas.clear()
+        _cargadas = False
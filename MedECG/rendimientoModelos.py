@@ -0,0 +1,94 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from datetime import datetime, timedelta, timezone
+from conexion import obtener_metricas_llm
+
+PERIODOS = {
+    "Últimas 24 horas": (timedelta(days=1), "h"),
+    "Últimos 7 días": (timedelta(days=7), "6h"),
+    "Últimos 30 días": (timedelta(days=30), "D"),
+}
+
+METRICAS = {
+    "Tiempo total (s)": "tiempo_total_s",
+    "Tiempo al primer token (s)": "tiempo_primer_token_s",
+    "Tokens por segundo": "tokens_por_segundo",
+}
+
+def percentiles_por_modelo(df):
+    """
+    Resumen por modelo: llamadas, errores y percentiles 50/95 de latencia y velocidad.
+    """
+    filas = []
+    for modelo, grupo in df.groupby("modelo"):
+        correctas = grupo[grupo["estado_http"] == 200]
+        fila = {
+            "Modelo": modelo,
+            "Llamadas": len(grupo),
+            "Errores (%)": round(100 * (1 - len(correctas) / len(grupo)), 1),
+        }
+        for nombre, columna in METRICAS.items():
+            valores = correctas[columna].dropna()
+            etiqueta = nombre.replace(" (s)", "")
+            fila[f"{etiqueta} p50"] = round(valores.quantile(0.5), 2) if len(valores) else None
+            fila[f"{etiqueta} p95"] = round(valores.quantile(0.95), 2) if len(valores) else None
+        fila["Tokens prompt p50"] = correctas["tokens_prompt"].dropna().median() if len(correctas) else None
+        fila["Tokens respuesta p50"] = correctas["tokens_respuesta"].dropna().median() if len(correctas) else None
+        filas.append(fila)
+    return pd.DataFrame(filas)
+
+def serie_percentiles(df, columna, frecuencia):
+    """
+    Percentiles 50 y 95 de una métrica por modelo e intervalo de tiempo.
+    """
+    datos = df[df["estado_http"] == 200].dropna(subset=[columna])
+    if datos.empty:
+        return datos
+    agrupado = datos.groupby(["modelo", pd.Grouper(key="fecha", freq=frecuencia)])[columna]
+    serie = pd.concat({"p50": agrupado.quantile(0.5), "p95": agrupado.quantile(0.95)}, names=["Percentil"])
+    return serie.rename("Valor").reset_index()
+
+def mostrar_rendimiento_modelos():
+    st.header("⏱️ Rendimiento de los Modelos")
+    st.markdown(
+        "Latencia y velocidad de cada modelo de LM Studio medidas en todas las consultas "
+        "(diagnóstico y chatbot), para elegir entre Llama, Gemma y DeepSeek con datos reales."
+    )
+
+    periodo = st.selectbox("Periodo", list(PERIODOS), key="rendimiento_periodo")
+    duracion, frecuencia = PERIODOS[periodo]
+    desde = datetime.now(timezone.utc) - duracion
+
+    df = pd.DataFrame(list(obtener_metricas_llm(desde)))
+    if df.empty:
+        st.info("Todavía no hay mediciones de los modelos en este periodo.")
+        return
+
+    df["fecha"] = pd.to_datetime(df["fecha"], utc=True)
+    df["modelo"] = df["modelo"].fillna("(sin modelo)")
+
+    modelos = sorted(df["modelo"].unique())
+    seleccion = st.multiselect("Modelos", modelos, default=modelos, key="rendimiento_modelos")
+    df = df[df["modelo"].isin(seleccion)]
+    if df.empty:
+        return
+
+    st.subheader("📋 Percentiles por modelo", divider="blue")
+    st.dataframe(percentiles_por_modelo(df), use_container_width=True, hide_index=True)
+    if df["tokens_estimados"].any():
+        st.caption("Los tokens de respuesta de algunas llamadas en streaming se estimaron por fragmentos recibidos.")
+
+    st.subheader("📈 Evolución en el tiempo", divider="blue")
+    nombre_metrica = st.radio("Métrica", list(METRICAS), horizontal=True, key="rendimiento_metrica")
+    serie = serie_percentiles(df, METRICAS[nombre_metrica], frecuencia)
+    if serie.empty:
+        st.info("No hay datos de esta métrica en el periodo.")
+        return
+
+    fig = px.line(
+        serie, x="fecha", y="Valor", color="modelo", line_dash="Percentil", markers=True,
+        labels={"fecha": "Fecha", "Valor": nombre_metrica, "modelo": "Modelo"}
+    )
+    fig.update_layout(hovermode="x unified")
+    st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,76 @@
+"""
+Almacenamiento compacto de las señales digitalizadas del ECG.
+
+Cada derivación se guarda como un búfer int16 en microvoltios (1 µV de
+resolución, ±32 mV de rango) junto con una cabecera de calibración, de modo
+que un ECG de 12 derivaciones ocupa unas decenas de KB dentro del propio
+documento de Mongo. Así la evolución y los reanálisis pueden trabajar sobre la
+señal guardada sin volver a decodificar la imagen.
+"""
+import numpy as np
+
+FORMATO_SENALES = "int16-uV"
+
+# Microvoltios por unidad entera guardada
+UV_POR_UNIDAD = 1.0
+
+def codificar_senales(senales):
+    """
+    Convierte la salida de extraer.digitize_leads en un documento para Mongo.
+
+    Args:
+        senales: Diccionario {"calibracion": {...}, "derivaciones": {derivación: mV}}
+
+    Returns:
+        Diccionario con la cabecera de calibración y un búfer de bytes por derivación
+    """
+    limite = np.iinfo(np.int16)
+    derivaciones = {}
+    for lead, valores in senales["derivaciones"].items():
+        unidades = np.round(np.asarray(valores, np.float64) * 1000 / UV_POR_UNIDAD)
+        derivaciones[lead] = np.clip(unidades, limite.min, limite.max).astype("<i2").tobytes()
+
+    return {
+        "formato": FORMATO_SENALES,
+        "uv_por_unidad": UV_POR_UNIDAD,
+        "calibracion": dict(senales["calibracion"]),
+        "derivaciones": derivaciones,
+    }
+
+def decodificar_senales(documento):
+    """
+    Reconstruye las señales (float32 en mV) a partir del documento guardado.
+
+    Args:
+        documento: Diccionario generado por codificar_senales
+
+    Returns:
+        Diccionario {"calibracion": {...}, "derivaciones": {derivación: float32 en mV}}
+    """
+    if documento.get("formato") != FORMATO_SENALES:
+        raise ValueError(f"Formato de señales desconocido: {documento.get('formato')}")
+
+    factor = np.float32(documento["uv_por_unidad"] / 1000)
+    return {
+        "calibracion": dict(documento["calibracion"]),
+        "derivaciones": {
+            lead: np.frombuffer(datos, dtype="<i2").astype(np.float32) * factor
+            for lead, datos in documento["derivaciones"].items()
+        },
+    }
+
+def senales_de_registro(registro):
+    """
+    Señales de un registro de ECG guardado, o None si se analizó sin digitalizar.
+    """
+    documento = registro.get("senales_ECG")
+    if not documento:
+        return None
+    return decodificar_senales(documento)
+
+def eje_tiempo(senales, lead):
+    """
+    Tiempo (s) de cada muestra de una derivación.
+    """
+    frecuencia = senales["calibracion"]["frecuencia_muestreo"]
+    return np.arange(len(senales["derivaciones"][lead])) / frecuencia
@@ -0,0 +1,168 @@
+"""
+Diagnóstico en streaming con corte anticipado.
+
+La respuesta del modelo se lee evento a evento (SSE) y, en cuanto aparece una
+línea de veredicto completa ("✅ Sin Anomalías - ECG Normal" o
+"⚠️ ECG Anormal - ..."), se cierra la conexión: LM Studio deja de generar y
+no se gasta GPU en texto que se descartaría. Las respuestas JSON
+(veredictoECG.FORMATO_VEREDICTO) se dan por completas al cerrarse el objeto. El
+razonamiento entre <think> y </think> (DeepSeek R1) no cuenta como veredicto
+aunque lo mencione.
+
+Quien lanza la consulta en otro hilo (consensoDiagnostico) puede acotarla con
+un LimiteConsulta: el plazo restante se usa como tiempo de espera HTTP y, si
+se cancela, el hilo cierra la conexión en cuanto llega el siguiente fragmento.
+"""
+import os
+import re
+import threading
+import time
+
+import requests
+
+from clienteLMStudio import TIMEOUT_CONEXION, TIMEOUT_LECTURA, enviar_chat, iterar_contenido
+from reglasDiagnostico import DIAGNOSTICO_NORMAL, DIAGNOSTICOS_POR_PICO, diagnostico_anormal
+from veredictoECG import parsear_veredicto
+
+STREAMING = os.getenv("DIAGNOSTICO_STREAMING", "1") != "0"
+
+# Veredictos completos: se reconocen sin esperar el salto de línea
+VEREDICTOS_CANONICOS = [DIAGNOSTICO_NORMAL] + [
+    diagnostico_anormal(regla["diagnostico"]) for regla in DIAGNOSTICOS_POR_PICO.values()
+]
+
+# Cualquier otra línea de veredicto se da por completa al terminar la línea
+PATRON_LINEA_VEREDICTO = re.compile(r"(✅[^\n]+|⚠️\s*ECG Anormal\s*-\s*[^\n]+)\n")
+
+# Límite activo en cada hilo (ver LimiteConsulta)
+_hilo = threading.local()
+
+class LimiteConsulta:
+    """
+    Plazo y señal de cancelación de las consultas de diagnóstico de un hilo.
+
+    Lo crea quien espera la respuesta y lo activa el hilo que consulta con
+    ``with limite:``; cancelar() puede llamarse desde cualquier hilo.
+    """
+    def __init__(self, plazo):
+        self.fin = time.monotonic() + plazo
+        self._cancelada = threading.Event()
+
+    def cancelar(self):
+        self._cancelada.set()
+
+    def restante(self):
+        return max(0.0, self.fin - time.monotonic())
+
+    def agotado(self):
+        return self._cancelada.is_set() or self.restante() == 0
+
+    def timeout(self):
+        """Tupla (conexión, lectura) de requests acotada por el plazo restante."""
+        return TIMEOUT_CONEXION, max(0.1, min(TIMEOUT_LECTURA, self.restante()))
+
+    def __enter__(self):
+        _hilo.limite = self
+        return self
+
+    def __exit__(self, *excepcion):
+        _hilo.limite = None
+
+def _limite_actual():
+    return getattr(_hilo, "limite", None)
+
+def texto_visible(texto):
+    """
+    Quita los bloques <think>...</think>; lo que sigue a un <think> sin cerrar
+    todavía no es respuesta.
+    """
+    texto = re.sub(r"<think>.*?</think>", "", texto, flags=re.S)
+    inicio = texto.find("<think>")
+    return texto if inicio == -1 else texto[:inicio]
+
+def buscar_veredicto(texto):
+    """
+    Devuelve la línea de veredicto del texto recibido hasta ahora, o None si
+    aún no hay un veredicto completo.
+    """
+    visible = texto_visible(texto)
+    if visible.lstrip().startswith("{"):
+        # Respuesta JSON: completa cuando el objeto ya es un veredicto válido
+        completo = visible.rstrip().endswith("}") and parsear_veredicto(visible) is not None
+        return visible.strip() if completo else None
+    minusculas = visible.lower()
+    for veredicto in VEREDICTOS_CANONICOS:
+        if veredicto.lower() in minusculas:
+            return veredicto
+    coincidencia = PATRON_LINEA_VEREDICTO.search(visible)
+    return coincidencia.group(1).strip() if coincidencia else None
+
+def _dentro_de_think(texto):
+    return texto.rfind("<think>") > texto.rfind("</think>")
+
+def obtener_veredicto_stream(payload):
+    """
+    Envía la consulta en streaming y corta la generación al recibir el veredicto.
+
+    Args:
+        payload: Cuerpo de /chat/completions (se fuerza "stream": True)
+
+    Returns:
+        Tupla (texto, anticipado): el veredicto (o todo el texto visible si el
+        modelo terminó sin un veredicto reconocible; None si la petición falló)
+        y True si la generación se cortó antes de terminar
+
+    Raises:
+        requests.RequestException: Si no se pudo conectar o se agotó el tiempo
+    """
+    limite = _limite_actual()
+    if limite is not None and limite.agotado():
+        return None, False
+
+    response = enviar_chat({**payload, "stream": True}, stream=True, timeout=limite and limite.timeout())
+    acumulado = ""
+    try:
+        if response.status_code != 200:
+            return None, False
+        for fragmento in iterar_contenido(response):
+            if limite is not None and limite.agotado():
+                # Consulta descartada o fuera de plazo: dejar de leer y cerrar
+                return None, False
+            acumulado += fragmento
+            if _dentro_de_think(acumulado):
+                continue
+            veredicto = buscar_veredicto(acumulado)
+            if veredicto is not None:
+                # El veredicto es la respuesta completa aunque la generación se corte
+                response.medicion.completa = True
+                return veredicto, True
+    finally:
+        # Cerrar la conexión a mitad de la respuesta detiene la generación
+        response.close()
+
+    return texto_visible(acumulado).strip(), False
+
+def consultar_diagnostico(payload, streaming=None):
+    """
+    Envía una consulta de diagnóstico, en streaming con corte anticipado salvo
+    que se desactive con DIAGNOSTICO_STREAMING=0.
+
+    Returns:
+        Tupla (texto de la respuesta o None si la petición falló o se canceló, segundos de respuesta)
+    """
+    streaming = STREAMING if streaming is None else streaming
+    limite = _limite_actual()
+    tiempo_inicio = time.time()
+    try:
+        if streaming:
+            resultado, _ = obtener_veredicto_stream(payload)
+        elif limite is not None and limite.agotado():
+            resultado = None
+        else:
+            response = enviar_chat(payload, timeout=limite and limite.timeout())
+            resultado = None
+            if response.status_code == 200:
+                resultado = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+    except requests.RequestException:
+        resultado = None
+    return resultado, time.time() - tiempo_inicio
@@ -0,0 +1,207 @@
+"""
+Telemetría de las llamadas a LM Studio.
+
+clienteLMStudio crea una MedicionLLM por petición y la completa al terminar:
+tiempo total, tiempo hasta el primer token, tokens del prompt y de la
+respuesta, tokens por segundo, código HTTP, modelo y origen ("diagnostico" o
+"chatbot"). Una petición es completa si se recibió la respuesta entera o, en
+un diagnóstico en streaming, su veredicto; las que se cortan antes (consultas
+de consenso descartadas o fuera de plazo) no lo son. Las mediciones se
+escriben en la colección limitada (capped) Metricas_LLM desde un hilo de
+fondo, de modo que la escritura no añade latencia a la consulta y un fallo de
+Mongo no la interrumpe.
+
+Cuando el servidor no informa del uso ("usage"), los tokens de la respuesta se
+estiman como el número de fragmentos recibidos en streaming (cada evento SSE
+lleva normalmente un token) y el documento se marca con tokens_estimados.
+
+Cada petición también se anota en la colección Peticiones_LLM al empezar y se
+borra al terminar (por el mismo hilo de fondo), para que todos los procesos
+conozcan la carga real de LM Studio (peticiones_en_curso_globales).
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+# Operaciones que se escriben juntas como máximo
+TAMANO_LOTE = 50
+
+# Segundos que se reutiliza el recuento de peticiones en curso leído de Mongo
+VIGENCIA_EN_CURSO_S = 2
+
+# Cola de operaciones (tipo, dato): ("metrica", documento), ("abierta", documento) o ("cerrada", _id)
+_pendientes = queue.SimpleQueue()
+_escritor = None
+_lock = threading.Lock()
+
+# Peticiones sin terminar por modelo en este proceso (cola en el servidor)
+_en_curso = Counter()
+_lock_en_curso = threading.Lock()
+_globales = {"leidas": 0.0, "valores": {}}
+
+def peticiones_en_curso():
+    """
+    Peticiones a LM Studio iniciadas y aún sin terminar en este proceso, por modelo.
+    """
+    with _lock_en_curso:
+        return dict(_en_curso)
+
+def peticiones_en_curso_globales():
+    """
+    Peticiones a LM Studio sin terminar por modelo en todos los procesos, según
+    Peticiones_LLM (leída como mucho cada VIGENCIA_EN_CURSO_S). Las de este
+    proceso cuentan aunque su registro aún no se haya escrito; si Mongo no
+    responde, solo se cuentan ellas.
+    """
+    locales = peticiones_en_curso()
+    with _lock_en_curso:
+        vigentes = time.monotonic() - _globales["leidas"] < VIGENCIA_EN_CURSO_S
+        globales = _globales["valores"]
+
+    if not vigentes:
+        from pymongo.errors import PyMongoError
+        from conexion import contar_peticiones_llm
+
+        try:
+            globales = contar_peticiones_llm()
+        except PyMongoError:
+            globales = {}
+        with _lock_en_curso:
+            _globales.update(leidas=time.monotonic(), valores=globales)
+
+    return {
+        modelo: max(locales.get(modelo, 0), globales.get(modelo, 0))
+        for modelo in set(locales) | set(globales)
+    }
+
+class MedicionLLM:
+    """
+    Medición de una petición a /chat/completions.
+    """
+    def __init__(self, modelo, stream, origen="diagnostico"):
+        self.modelo = modelo
+        self.stream = stream
+        self.origen = origen
+        self.inicio = time.perf_counter()
+        self.primer_token = None
+        self.fragmentos = 0
+        self.tokens_prompt = None
+        self.tokens_respuesta = None
+        self.estado_http = None
+        self.completa = False
+        self.error = None
+        self._registrada = False
+        self._id = ObjectId()
+        with _lock_en_curso:
+            _en_curso[modelo] += 1
+        _pendientes.put(("abierta", {
+            "_id": self._id, "modelo": modelo, "inicio": datetime.now(timezone.utc), "proceso": os.getpid(),
+        }))
+        _iniciar_escritor()
+
+    def fragmento(self):
+        """
+        Anota un fragmento de texto recibido en streaming.
+        """
+        if self.primer_token is None:
+            self.primer_token = time.perf_counter()
+        self.fragmentos += 1
+
+    def uso(self, usage):
+        """
+        Anota el uso de tokens que informa el servidor ("usage" de la respuesta).
+        """
+        if usage:
+            self.tokens_prompt = usage.get("prompt_tokens", self.tokens_prompt)
+            self.tokens_respuesta = usage.get("completion_tokens", self.tokens_respuesta)
+
+    def documento(self):
+        fin = time.perf_counter()
+        tokens_estimados = self.tokens_respuesta is None and self.stream
+        tokens_respuesta = self.fragmentos if tokens_estimados else self.tokens_respuesta
+
+        # Velocidad de generación: desde el primer token si se conoce
+        inicio_generacion = self.primer_token or self.inicio
+        duracion_generacion = fin - inicio_generacion
+        tokens_por_segundo = (
+            tokens_respuesta / duracion_generacion if tokens_respuesta and duracion_generacion > 0 else None
+        )
+        return {
+            "fecha": datetime.now(timezone.utc),
+            "modelo": self.modelo,
+            "origen": self.origen,
+            "stream": self.stream,
+            "estado_http": self.estado_http,
+            "tiempo_total_s": fin - self.inicio,
+            "tiempo_primer_token_s": self.primer_token - self.inicio if self.primer_token else None,
+            "tokens_prompt": self.tokens_prompt,
+            "tokens_respuesta": tokens_respuesta,
+            "tokens_estimados": tokens_estimados,
+            "tokens_por_segundo": tokens_por_segundo,
+            "completa": self.completa,
+            "error": self.error,
+        }
+
+    def registrar(self):
+        """
+        Encola la medición para escribirla (solo la primera vez).
+        """
+        if self._registrada:
+            return
+        self._registrada = True
+        with _lock_en_curso:
+            _en_curso[self.modelo] -= 1
+            if _en_curso[self.modelo] <= 0:
+                del _en_curso[self.modelo]
+        _pendientes.put(("cerrada", self._id))
+        _pendientes.put(("metrica", self.documento()))
+        _iniciar_escritor()
+
+def _escribir(operaciones):
+    # La conexión se abre al primer uso, no al importar el cliente
+    from pymongo.errors import PyMongoError
+    from conexion import actualizar_peticiones_llm, guardar_metricas_llm
+
+    abiertas = {dato["_id"]: dato for tipo, dato in operaciones if tipo == "abierta"}
+    cerradas = {dato for tipo, dato in operaciones if tipo == "cerrada"}
+    # Las peticiones que empiezan y terminan en el mismo lote no se escriben
+    emparejadas = cerradas & abiertas.keys()
+    for _id in emparejadas:
+        del abiertas[_id]
+    cerradas -= emparejadas
+    metricas = [dato for tipo, dato in operaciones if tipo == "metrica"]
+
+    try:
+        actualizar_peticiones_llm(list(abiertas.values()), cerradas)
+        guardar_metricas_llm(metricas)
+    except PyMongoError:
+        # La telemetría es opcional: se pierden las mediciones, no la consulta
+        pass
+
+def _bucle_escritor():
+    while True:
+        operaciones = [_pendientes.get()]
+        while len(operaciones) < TAMANO_LOTE:
+            try:
+                operaciones.append(_pendientes.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _escribir(operaciones)
+        except Exception:
+            # El hilo escritor no debe morir por un lote con problemas
+            traceback.print_exc()
+
+def _iniciar_escritor():
+    global _escritor
+    if _escritor is None:
+        with _lock:
+            if _escritor is None:
+                _escritor = threading.Thread(target=_bucle_escritor, name="telemetria-llm", daemon=True)
+                _escritor.start()
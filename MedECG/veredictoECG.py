@@ -0,0 +1,160 @@
+"""
+Veredicto estructurado del diagnóstico.
+
+Los modelos responden con JSON restringido por un esquema (response_format de
+la API compatible con OpenAI que admite LM Studio) y la respuesta se convierte
+en un Veredicto. En la base de datos el veredicto se guarda como campos
+("veredicto.normal", "veredicto.diagnostico") para que las vistas filtren y
+cuenten con consultas indexadas en lugar de buscar subcadenas en el texto.
+
+Los registros antiguos, las respuestas en texto libre y las entradas de la
+caché siguen funcionando: parsear_veredicto reconoce también el formato de
+texto "✅ Sin Anomalías - ECG Normal" / "⚠️ ECG Anormal - [DIAGNÓSTICO]".
+
+Para añadir el veredicto a los registros anteriores (completar_veredictos):
+    python migracionesECG.py veredictos
+"""
+import json
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from reglasDiagnostico import DIAGNOSTICO_NORMAL, DIAGNOSTICOS_POR_PICO, diagnostico_anormal
+
+# Valor del campo "diagnostico" del JSON cuando el ECG es normal
+SIN_DIAGNOSTICO = "Ninguno"
+
+DIAGNOSTICOS_CONOCIDOS = [regla["diagnostico"] for regla in DIAGNOSTICOS_POR_PICO.values()]
+
+ESQUEMA_VEREDICTO = {
+    "type": "object",
+    "properties": {
+        "normal": {"type": "boolean"},
+        "diagnostico": {"type": "string", "enum": [SIN_DIAGNOSTICO] + DIAGNOSTICOS_CONOCIDOS},
+    },
+    "required": ["normal", "diagnostico"],
+    "additionalProperties": False,
+}
+
+# Se añade al cuerpo de /chat/completions
+FORMATO_VEREDICTO = {
+    "type": "json_schema",
+    "json_schema": {"name": "veredicto_ecg", "strict": True, "schema": ESQUEMA_VEREDICTO},
+}
+
+@dataclass(frozen=True)
+class Veredicto:
+    """
+    Resultado de un diagnóstico.
+
+    Attributes:
+        normal: True si el ECG no presenta anomalías
+        diagnostico: Diagnóstico principal si es anormal (None si es normal)
+    """
+    normal: bool
+    diagnostico: Optional[str] = None
+
+    @property
+    def texto(self):
+        """
+        Texto canónico que se muestra y se guarda en "anomalias".
+        """
+        return DIAGNOSTICO_NORMAL if self.normal else diagnostico_anormal(self.diagnostico)
+
+    def documento(self):
+        """
+        Campos que se guardan en el registro del ECG.
+        """
+        return {"normal": self.normal, "diagnostico": self.diagnostico}
+
+    @classmethod
+    def desde_documento(cls, documento):
+        return cls(normal=bool(documento["normal"]), diagnostico=documento.get("diagnostico"))
+
+def _diagnostico_conocido(texto):
+    minusculas = texto.lower()
+    for diagnostico in DIAGNOSTICOS_CONOCIDOS:
+        if diagnostico.lower() in minusculas:
+            return diagnostico
+    return None
+
+def _veredicto_json(texto):
+    """
+    Veredicto del primer objeto JSON del texto, o None si no hay uno válido.
+    """
+    inicio, fin = texto.find("{"), texto.rfind("}")
+    if inicio == -1 or fin < inicio:
+        return None
+    try:
+        datos = json.loads(texto[inicio:fin + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(datos, dict) or not isinstance(datos.get("normal"), bool):
+        return None
+
+    diagnostico = str(datos.get("diagnostico") or "").strip()
+    if datos["normal"] or diagnostico in ("", SIN_DIAGNOSTICO):
+        # Un "anormal" sin diagnóstico no se puede usar
+        return Veredicto(normal=True) if datos["normal"] else None
+    return Veredicto(normal=False, diagnostico=_diagnostico_conocido(diagnostico) or diagnostico)
+
+def _veredicto_texto(texto):
+    """
+    Veredicto del formato de texto libre, o None si no se reconoce.
+    """
+    minusculas = texto.lower()
+    if "ecg anormal" in minusculas or "⚠️" in texto:
+        diagnostico = _diagnostico_conocido(texto)
+        if diagnostico is None:
+            partes = texto.split(" - ", 1)
+            diagnostico = partes[1].strip().rstrip(".") if len(partes) == 2 else None
+        return Veredicto(normal=False, diagnostico=diagnostico) if diagnostico else None
+    if "sin anomal" in minusculas or re.search(r"\becg normal\b", minusculas):
+        return Veredicto(normal=True)
+    diagnostico = _diagnostico_conocido(texto)
+    return Veredicto(normal=False, diagnostico=diagnostico) if diagnostico else None
+
+def parsear_veredicto(texto):
+    """
+    Convierte la respuesta de un modelo (JSON o texto libre) en un Veredicto.
+
+    Args:
+        texto: Respuesta del modelo, diagnóstico por reglas o texto guardado
+
+    Returns:
+        Veredicto o None si el texto es un error o no contiene un veredicto
+    """
+    if not texto or texto.startswith("⚠️ Error"):
+        return None
+    texto = re.sub(r"<think>.*?</think>", "", texto, flags=re.S).strip()
+    return _veredicto_json(texto) or _veredicto_texto(texto)
+
+def veredicto_de_registro(ecg):
+    """
+    Veredicto de un registro de Registros_ECG: los campos estructurados si
+    existen o, en registros anteriores, el texto de "anomalias".
+    """
+    if ecg.get("veredicto"):
+        return Veredicto.desde_documento(ecg["veredicto"])
+    return parsear_veredicto(ecg.get("anomalias", ""))
+
+def completar_veredictos():
+    """
+    Añade el veredicto estructurado a los registros guardados antes de que
+    existiera, a partir de su texto de "anomalias".
+
+    Returns:
+        Número de registros actualizados
+    """
+    # Solo el script se conecta a la base de datos
+    from pymongo import UpdateOne
+    from conexion import collection_ecg
+
+    operaciones = []
+    for ecg in collection_ecg.find({"veredicto": {"$exists": False}}, {"anomalias": 1}):
+        veredicto = parsear_veredicto(ecg.get("anomalias", ""))
+        if veredicto is not None:
+            operaciones.append(UpdateOne({"_id": ecg["_id"]}, {"$set": {"veredicto": veredicto.documento()}}))
+    if not operaciones:
+        return 0
+    return collection_ecg.bulk_write(operaciones, ordered=False).modified_count